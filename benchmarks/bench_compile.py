@@ -0,0 +1,61 @@
+"""Compile a deep synthetic schema graph, comparing against compiling with a deepcopy per $ref.
+
+    python benchmarks/bench_compile.py
+"""
+
+import copy
+import json
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def deepcopy_compile_schema(schema, schemas):
+    """compile_schema as it was, copying and recompiling every referenced schema on every path."""
+    for field, prop in list(schema['properties'].items()):
+        array_ref = prop.get('items', {}).get("$ref")
+        if array_ref:
+            prop['items'].pop("$ref")
+            old_prop = prop['items'].copy()
+            prop['items'] = deepcopy_compile_schema(copy.deepcopy(schemas[array_ref]), schemas)
+            prop.update(old_prop)
+
+        obj_ref = prop.get("$ref")
+        if obj_ref:
+            prop.pop("$ref")
+            old_prop = prop.copy()
+            prop.clear()
+            prop.update(deepcopy_compile_schema(copy.deepcopy(schemas[obj_ref]), schemas))
+            prop.update(old_prop)
+    return schema
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'depth':>5} {'deepcopy s':>11} {'memoized s':>11} {'speedup':>8} {'output MB':>10}")
+    for depth in (4, 6, 8, 10):
+        schemas = synthetic.deep_schema_set(depth=depth)
+
+        naive, naive_time = timed(deepcopy_compile_schema, copy.deepcopy(schemas['service.json']), schemas)
+        compiled, compiled_time = timed(hsds_schema.compile_schema, schemas['service.json'], schemas)
+
+        output = json.dumps(compiled)
+        assert output == json.dumps(naive)
+        print(
+            f"{depth:>5} {naive_time:>11.4f} {compiled_time:>11.4f} "
+            f"{naive_time / compiled_time:>7.0f}x {len(output) / 1e6:>10.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
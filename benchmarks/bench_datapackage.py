@@ -0,0 +1,63 @@
+"""Build a datapackage from 1000 synthetic tables, in one string and streamed.
+
+    python benchmarks/bench_datapackage.py [tables]
+"""
+
+import os
+import pathlib
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def scan_foreign_keys(schema_set):
+    """Foreign keys as they used to be found, scanning every ref for every table."""
+    fks = []
+    for filename, schema in schema_set.by_filename.items():
+        for ref in schema_set.ref_graph.refs(filename):
+            table = ref.target.replace('.json', '')
+            if not ref.array:
+                fks.append((schema['name'], table))
+            elif ref.target not in ['attribute.json', 'metadata.json']:
+                fks.append((table, schema['name']))
+    return {
+        schema['name']: [foreign for table, foreign in fks if table == schema['name']]
+        for schema in schema_set.ordered
+    }
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    tables = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    schema_set = hsds_schema.SchemaSet(synthetic.wide_schema_set(tables=tables, fanout=5))
+    schema_set.ref_graph
+
+    stages = [
+        ('foreign keys, scan per table', scan_foreign_keys, schema_set),
+        ('foreign keys, grouped', hsds_schema.datapackage_foreign_keys, schema_set),
+        ('datapackage string', hsds_schema._schemas_to_datapackage, schema_set),
+    ]
+    print(f"{tables} tables")
+    with open(os.devnull, 'w') as devnull:
+        stages.append(('datapackage streamed', hsds_schema.stream_datapackage, schema_set, devnull))
+        for name, function, *args in stages:
+            elapsed, peak = measure(function, *args)
+            print(f"{name:<30} {elapsed:>8.4f} s {peak / 1e6:>8.2f} MB peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Size and load time of fully inlined compiled schemas against their $defs variants.
+
+    python benchmarks/bench_defs.py
+
+Load time is json.loads, plus building a validator and checking the
+schema when jsonschema is installed, which is what an API gateway does
+at startup.
+"""
+
+import importlib
+import json
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def inline(value, defs):
+    """value with its #/$defs/ refs replaced by what they point at."""
+    if isinstance(value, dict):
+        ref = value.get('$ref')
+        if isinstance(ref, str) and ref.startswith('#/$defs/'):
+            return {**inline(defs[ref[len('#/$defs/'):]], defs),
+                    **{key: inline(item, defs) for key, item in value.items() if key != '$ref'}}
+        return {key: inline(item, defs) for key, item in value.items() if key != '$defs'}
+    if isinstance(value, list):
+        return [inline(item, defs) for item in value]
+    return value
+
+
+def load_time(text, jsonschema):
+    start = time.perf_counter()
+    schema = json.loads(text)
+    if jsonschema:
+        validator = jsonschema.validators.validator_for(schema)
+        validator.check_schema(schema)
+        validator(schema)
+    return time.perf_counter() - start
+
+
+def main():
+    try:
+        jsonschema = importlib.import_module('jsonschema')
+    except ImportError:
+        jsonschema = None
+        print('jsonschema is not installed, only timing json.loads')
+
+    print(f"{'depth':>5} {'variant':>9} {'inlined KB':>11} {'defs KB':>8} {'inlined s':>10} {'defs s':>8}")
+    for depth in (6, 8, 10):
+        schemas = synthetic.deep_schema_set(depth=depth)
+        compiler = hsds_schema.SchemaCompiler(schemas)
+        compiled = compiler.compile_ref('service.json')
+        inlined = {
+            '': compiled,
+            '_package': {"type": "array", "items": compiled},
+            '_list': {**compiled, 'properties': hsds_schema.without_one_to_many(compiled['properties'])},
+        }
+
+        for variant, full in inlined.items():
+            defs = hsds_schema.definitions_entity(schemas, 'service', variant)
+            assert inline(defs, defs['$defs']) == full
+
+            full_text = hsds_schema.dumps_json(full, compact=True)
+            defs_text = hsds_schema.dumps_json(defs, compact=True)
+            print(
+                f"{depth:>5} {variant or 'full':>9} {len(full_text) / 1e3:>11.1f} {len(defs_text) / 1e3:>8.1f} "
+                f"{load_time(full_text, jsonschema):>10.4f} {load_time(defs_text, jsonschema):>8.4f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
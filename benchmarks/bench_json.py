@@ -0,0 +1,50 @@
+"""Serialize compiled schemas with each json backend, pretty and compact.
+
+    python benchmarks/bench_json.py
+"""
+
+import json
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    backends = ['json']
+    if hsds_schema.json_backend('auto'):
+        backends.append('orjson')
+    else:
+        print('orjson is not installed, only timing the standard library')
+
+    print(f"{'depth':>5} {'backend':>8} {'pretty s':>9} {'compact s':>10} {'pretty MB':>10} {'compact MB':>11}")
+    for depth in (6, 8, 10):
+        schemas = synthetic.deep_schema_set(depth=depth)
+        compiled = hsds_schema.compile_schema(schemas['service.json'], schemas)
+        expected = json.dumps(compiled, indent=2)
+
+        for backend in backends:
+            hsds_schema.JSON_BACKEND = backend
+            hsds_schema.json_backend.cache_clear()
+            pretty, pretty_time = timed(hsds_schema.dumps_json, compiled)
+            compact, compact_time = timed(hsds_schema.dumps_json, compiled, True)
+            assert pretty == expected
+            assert json.loads(compact) == compiled
+            print(
+                f"{depth:>5} {backend:>8} {pretty_time:>9.4f} {compact_time:>10.4f} "
+                f"{len(pretty) / 1e6:>10.2f} {len(compact) / 1e6:>11.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Import time of hsds_schema, from `python -X importtime`, and wall time of a quick command.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def import_times():
+    """module -> cumulative microseconds for one fresh interpreter importing hsds_schema."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import hsds_schema'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    samples = [import_times() for _ in range(runs)]
+    total = statistics.median(sample['hsds_schema'] for sample in samples)
+    print(f"import hsds_schema: {total / 1000:.1f} ms median of {runs}")
+
+    print("heaviest imports (median cumulative ms):")
+    modules = set.intersection(*(set(sample) for sample in samples))
+    medians = {module: statistics.median(sample[module] for sample in samples) for module in modules}
+    for module, value in sorted(medians.items(), key=lambda i: -i[1])[1:11]:
+        print(f"  {module:<40} {value / 1000:>7.1f}")
+
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'hsds_schema.py', '--help'], cwd=ROOT, capture_output=True, check=True)
+        walls.append(time.perf_counter() - start)
+    print(f"hsds_schema.py --help: {statistics.median(walls) * 1000:.1f} ms median wall time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Records checked per second by jsonschema and by a module from generate-validator.
+
+    python benchmarks/bench_validator.py
+
+Records are generated from synthetic schema sets, and some are broken by
+replacing or removing a value. tests/test_generate_validator.py checks
+that both validators find the same errors.
+"""
+
+import copy
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+BAD_VALUES = [None, 1, 1.5, True, '', 'not-a-uuid', '2020-13-45', [], {}]
+
+
+def break_record(record, rng):
+    """A copy of record with a value somewhere in it replaced or removed."""
+    record = copy.deepcopy(record)
+    value = record
+    while True:
+        keys = list(value) if isinstance(value, dict) else range(len(value))
+        if not keys:
+            return record
+        key = rng.choice(keys)
+        if isinstance(value[key], (dict, list)) and value[key] and rng.random() < 0.6:
+            value = value[key]
+        elif isinstance(value, dict) and rng.random() < 0.3:
+            del value[key]
+            return record
+        else:
+            value[key] = copy.deepcopy(rng.choice(BAD_VALUES))
+            return record
+
+
+def timed(check, records):
+    start = time.perf_counter()
+    for record in records:
+        check(record)
+    return len(records) / (time.perf_counter() - start)
+
+
+def main():
+    jsonschema = hsds_schema.import_optional('jsonschema', 'validate')
+    rng = random.Random(1)
+
+    print(f"{'tables':>6} {'depth':>5} {'records':>7} {'errors':>6} {'jsonschema/s':>12} {'generated/s':>11} {'speedup':>7}")
+    for tables, depth in ((20, 3), (100, 4), (300, 5)):
+        schemas = synthetic.layered_schema_set(tables, fanout=3, depth=depth)
+        compiled = hsds_schema.compile_schema(schemas['service.json'], schemas)
+
+        generator = hsds_schema.DataGenerator(hsds_schema.SchemaSet(schemas), {'service': 1000})
+        records = [generator.record('service', index) for index in range(1000)]
+        records = [break_record(record, rng) if index % 10 == 0 else record for index, record in enumerate(records)]
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = pathlib.Path(tmpdirname) / 'service_validator.py'
+            path.write_text(hsds_schema.ValidatorGenerator(compiled).generate())
+            generated = hsds_schema.load_generated_validator(path)
+
+        validator = jsonschema.Draft202012Validator(
+            compiled, format_checker=jsonschema.Draft202012Validator.FORMAT_CHECKER
+        )
+        error_count = sum(len(generated.errors(record)) for record in records)
+
+        reference = timed(lambda record: list(validator.iter_errors(record)), records)
+        fast = timed(generated.errors, records)
+        print(
+            f"{tables:>6} {depth:>5} {len(records):>7} {error_count:>6} "
+            f"{reference:>12.0f} {fast:>11.0f} {fast / reference:>6.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
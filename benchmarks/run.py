@@ -0,0 +1,222 @@
+"""Time and peak memory of each pipeline stage over a grid of synthetic schema sets.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --output new.json --compare results.json --fail-over 1.25
+
+Schema sets vary in table count, reference fan-out and nesting depth, and
+the profile stage also in the share of tables the profile removes. Each
+stage is timed --repeat times from a fresh setup, then run once more
+under tracemalloc for its peak memory. Everything runs offline in
+temporary directories. Results are written as json with the commit they
+were made at, and --compare prints the change against an earlier run.
+
+--trace records that last run of each case with hsds_schema.BuildTrace:
+the wall and CPU time, memory and io of the case, of each stage and
+output within it and of every file write, as json and as Chrome trace
+events with a process per case.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import hsds_schema  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def write_schemas(schema_dir, schemas):
+    schema_dir.mkdir(parents=True, exist_ok=True)
+    for filename, schema in schemas.items():
+        (schema_dir / filename).write_text(json.dumps(schema, indent=2))
+
+
+def stage_compile(schemas, tmp):
+    compiler = hsds_schema.SchemaCompiler(schemas)
+    return lambda: [hsds_schema.compile_entity(compiler, entity)
+                    for entity in ('service', 'organization', 'service_at_location')]
+
+
+def stage_examples(schemas, tmp):
+    schema_set = hsds_schema.SchemaSet(schemas)
+    return lambda: [hsds_schema.example(schema_set, entity, simple)
+                    for entity in ('service', 'organization', 'service_at_location') for simple in (False, True)]
+
+
+def stage_datapackage(schemas, tmp):
+    schema_set = hsds_schema.SchemaSet(schemas)
+    return lambda: hsds_schema._schemas_to_datapackage(schema_set)
+
+
+def stage_profile(schemas, tmp, removal):
+    files = {**schemas, 'openapi.json': synthetic.openapi()}
+    store = hsds_schema.SchemaStore()
+    core_manifest = store.add({filename: json.dumps(schema) for filename, schema in files.items()})
+
+    profile_dir = tmp / 'profile'
+    write_schemas(profile_dir, synthetic.profile(schemas, removal))
+    schema_dir = tmp / 'schema'
+    schema_dir.mkdir()
+
+    return lambda: hsds_schema.profile_to_schema(
+        'https://github.com/example/profile', profile_dir=profile_dir, schema_dir=schema_dir,
+        store=store, core_manifest=core_manifest,
+    )
+
+
+def stage_docs_all(schemas, tmp):
+    write_schemas(tmp / 'schema', {**schemas, 'openapi.json': synthetic.openapi()})
+    for directory in ('schema/compiled', 'docs/extras', 'examples'):
+        (tmp / directory).mkdir(parents=True, exist_ok=True)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            hsds_schema.docs_all.callback(force=True)
+        finally:
+            os.chdir(cwd)
+    return run
+
+
+STAGES = {
+    'compile': stage_compile,
+    'examples': stage_examples,
+    'datapackage': stage_datapackage,
+    'profile': stage_profile,
+    'docs_all': stage_docs_all,
+}
+
+
+def measure(make_run, repeat, stage=None, build_trace=None):
+    """(seconds of each run, peak tracemalloc MB of one more run), each run from a fresh setup.
+
+    With a build_trace, the last run is recorded in it as a span named stage.
+    """
+    times = []
+    for _ in range(repeat + 1):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            run = make_run(pathlib.Path(tmpdirname))
+            if len(times) < repeat:
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            else:
+                tracemalloc.start()
+                with build_trace or contextlib.nullcontext(), hsds_schema.trace(stage, 'case'):
+                    run()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    return times, peak / 1e6
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_name(result):
+    name = f"{result['stage']} tables={result['tables']} fanout={result['fanout']} depth={result['depth']}"
+    if result.get('removal') is not None:
+        name += f" removal={result['removal']}"
+    return name
+
+
+def numbers(value, kind=int):
+    return [kind(part) for part in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=numbers, default=[20, 100, 300])
+    parser.add_argument('--fanout', type=numbers, default=[2, 4])
+    parser.add_argument('--depth', type=numbers, default=[3, 5])
+    parser.add_argument('--removal', type=lambda value: numbers(value, float), default=[0.0, 0.25, 0.5])
+    parser.add_argument('--stages', type=lambda value: value.split(','), default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the results to this json file.')
+    parser.add_argument('--compare', help='Results json of an earlier run to compare against.')
+    parser.add_argument('--fail-over', type=float,
+                        help='Exit with an error if any stage is this many times slower than in --compare.')
+    parser.add_argument('--trace', help='Write a trace of each case to this json file, and as Chrome trace events '
+                                        'to the same name ending .chrome.json.')
+    args = parser.parse_args()
+
+    results = []
+    # (case name, BuildTrace) with --trace
+    traces = []
+    print(f"{'case':<62} {'min s':>9} {'median s':>9} {'peak MB':>8}")
+    for tables, fanout, depth in itertools.product(args.tables, args.fanout, args.depth):
+        schemas = synthetic.layered_schema_set(tables, fanout, depth)
+        for stage in args.stages:
+            removals = args.removal if stage == 'profile' else [None]
+            for removal in removals:
+                if removal is None:
+                    make_run = lambda tmp: STAGES[stage](schemas, tmp)  # noqa: E731
+                else:
+                    make_run = lambda tmp: STAGES[stage](schemas, tmp, removal)  # noqa: E731
+                build_trace = hsds_schema.BuildTrace() if args.trace else None
+                times, peak = measure(make_run, args.repeat, stage, build_trace)
+                result = {
+                    'stage': stage, 'tables': tables, 'fanout': fanout, 'depth': depth, 'removal': removal,
+                    'min_s': min(times), 'median_s': statistics.median(times), 'peak_mb': peak,
+                }
+                results.append(result)
+                if build_trace:
+                    traces.append((case_name(result), build_trace))
+                print(f"{case_name(result):<62} {result['min_s']:>9.4f} {result['median_s']:>9.4f} {peak:>8.2f}")
+
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps({
+            'commit': commit(),
+            'python': platform.python_version(),
+            'results': results,
+        }, indent=2))
+
+    if args.trace:
+        path = pathlib.Path(args.trace)
+        path.write_text(json.dumps({
+            'commit': commit(),
+            'cases': {name: build_trace.to_json() for name, build_trace in traces},
+        }, indent=2, default=str))
+        events = [event for pid, (name, build_trace) in enumerate(traces)
+                  for event in build_trace.chrome_events(pid, name)]
+        path.with_suffix('.chrome.json').write_text(json.dumps({'traceEvents': events}, default=str))
+
+    if args.compare:
+        earlier = json.loads(pathlib.Path(args.compare).read_text())
+        before = {case_name(result): result for result in earlier['results']}
+        print(f"\nagainst {earlier.get('commit') or args.compare}")
+        print(f"{'case':<62} {'time':>8} {'memory':>8}")
+        slower = []
+        for result in results:
+            old = before.get(case_name(result))
+            if not old:
+                continue
+            time_ratio = result['min_s'] / old['min_s'] if old['min_s'] else float('inf')
+            memory_ratio = result['peak_mb'] / old['peak_mb'] if old['peak_mb'] else float('inf')
+            print(f"{case_name(result):<62} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x")
+            if args.fail_over and time_ratio > args.fail_over:
+                slower.append(case_name(result))
+        if slower:
+            print(f"\n{len(slower)} cases over {args.fail_over}x slower:\n  " + '\n  '.join(slower))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Synthetic HSDS style schema sets for the benchmarks."""
+
+import random
+
+
+def field(name, example, unique=False):
+    return {
+        "name": name,
+        "type": "string",
+        "title": name.replace('_', ' ').title(),
+        "description": f"The {name} of the record.",
+        "example": example,
+        "constraints": {"unique": unique},
+    }
+
+
+def table(name, order, refs=(), array_refs=()):
+    properties = {
+        "id": field("id", f"{name}-1", unique=True),
+        "name": field("name", f"Example {name}"),
+        "description": field("description", f"A description of {name}"),
+    }
+    for ref in refs:
+        properties[f"{ref}_id"] = field(f"{ref}_id", f"{ref}-1")
+        properties[ref] = {"name": ref, "$ref": f"{ref}.json"}
+    for ref in array_refs:
+        properties[f"{ref}s"] = {"name": f"{ref}s", "type": "array", "items": {"$ref": f"{ref}.json"}}
+
+    return {
+        "name": name,
+        "path": f"{name}.csv",
+        "title": name.replace('_', ' ').title(),
+        "description": f"Synthetic table {name}",
+        "type": "object",
+        "properties": properties,
+        "required": ["id"],
+        "tabular_required": [],
+        "datapackage_metadata": {"format": "csv", "mediatype": "text/csv", "path": f"{name}.csv", "order": order},
+    }
+
+
+def deep_schema_set(depth=6, width=3, fanout=2):
+    """Layers of `width` tables, each table has array refs to `fanout` tables in the next layer.
+
+    The entry point is `service`, which references the first layer. Fully
+    inlining it expands to roughly fanout ** depth copies of the deepest
+    tables, which is what makes naive compiling slow.
+    """
+    layers = [[f"table_{level}_{index}" for index in range(width)] for level in range(depth)]
+
+    schemas = {}
+    order = 1
+    schemas["service.json"] = table("service", order, array_refs=layers[0][:fanout])
+    for level, names in enumerate(layers):
+        for index, name in enumerate(names):
+            order += 1
+            children = []
+            if level + 1 < depth:
+                children = [layers[level + 1][(index + offset) % width] for offset in range(fanout)]
+            schemas[f"{name}.json"] = table(name, order, array_refs=children)
+    return schemas
+
+
+def wide_schema_set(tables=100, fanout=3, seed=1):
+    """`tables` tables where each references up to `fanout` tables after it, so there are no cycles."""
+    rng = random.Random(seed)
+    names = ["service"] + [f"table_{index}" for index in range(1, tables)]
+
+    schemas = {}
+    for index, name in enumerate(names):
+        later = names[index + 1:]
+        array_refs = rng.sample(later, min(fanout, len(later)))
+        refs = rng.sample(later, 1) if later and index % 4 == 0 else []
+        array_refs = [ref for ref in array_refs if ref not in refs]
+        schemas[f"{name}.json"] = table(name, index + 1, refs=refs, array_refs=array_refs)
+    return schemas
+
+
+def layered_schema_set(tables=50, fanout=3, depth=4, seed=1):
+    """`tables` tables in `depth` layers, shaped like HSDS.
+
+    `service` is the only table in the first layer, with `organization` as
+    an object and `service_at_location` as an array in the second. Every
+    table has array refs to up to `fanout` tables in the next layer, and
+    every fourth one an object ref too, so there are no cycles.
+    """
+    rng = random.Random(seed)
+    depth = max(depth, 2)
+    layers = [["service"], ["organization", "service_at_location"]] + [[] for _ in range(depth - 2)]
+    for index in range(1, max(tables - 2, 1)):
+        layers[1 + (index - 1) % (depth - 1)].append(f"table_{index}")
+
+    schemas = {}
+    order = 0
+    for level, names in enumerate(layers):
+        following = layers[level + 1] if level + 1 < len(layers) else []
+        others = [name for name in following if name not in ("organization", "service_at_location")]
+        for index, name in enumerate(names):
+            order += 1
+            refs = rng.sample(others, 1) if others and index % 4 == 0 else []
+            array_refs = [ref for ref in rng.sample(others, min(fanout, len(others))) if ref not in refs]
+            if name == "service":
+                refs, array_refs = ["organization"], ["service_at_location"] + array_refs
+            schemas[f"{name}.json"] = table(name, order, refs=refs, array_refs=array_refs)
+    return schemas
+
+
+def openapi():
+    """Just enough of an openapi.json for docs-all."""
+    return {
+        "openapi": "3.1.0",
+        "jsonSchemaDialect": "https://spec.openapis.org/oas/3.1/dialect/base",
+        "info": {"title": "Synthetic", "version": "1.0"},
+        "paths": {},
+    }
+
+
+def profile(schemas, removal=0.25, seed=1):
+    """Profile files for schemas: `removal` of the tables removed and a description patched on the rest."""
+    rng = random.Random(seed)
+    removable = sorted(
+        filename for filename in schemas
+        if filename not in ("service.json", "organization.json", "service_at_location.json")
+    )
+    removed = set(rng.sample(removable, int(len(removable) * removal)))
+
+    files = {}
+    for filename in sorted(schemas):
+        if filename in removed:
+            files[filename] = {}
+        elif rng.random() < 0.5:
+            files[filename] = {"description": f"Profile description of {filename[:-5]}"}
+    return files
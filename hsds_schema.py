@@ -1,70 +1,867 @@
 #!/usr/bin/env python3
 
+import contextlib
 import csv
+import io
 import os
-import copy
+import re
+import sys
 import json
+import functools
+import importlib
+import itertools
+import math
+import collections
+import hashlib
+import random
+import datetime
 import click
 import pathlib
-import flatterer
 import tempfile
-import requests
-import json_merge_patch
-from compiletojsonschema.compiletojsonschema import CompileToJsonSchema
+import threading
+import time
 
-def tabular_example(schemas):
-    input_path = pathlib.Path(schemas)
 
-    schemas = {}
-    for json_schema in input_path.glob("*.json"):
-        if str(json_schema).endswith('openapi.json'):
-            continue
-        schema = json.loads(json_schema.read_text())
-        schemas[schema["name"]] = schema
+def copy_json(value):
+    """Copy parsed json data. Much quicker than copy.deepcopy as there is no memo to keep."""
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
 
-    output = {}
 
-    for name, schema in sorted(schemas.items(), key=lambda i:i[1]['datapackage_metadata']['order']) :
-        table_example = {}
+def prop_refs(prop):
+    """The ($ref, items.$ref) of a schema property, either can be None."""
+    return prop.get("$ref"), prop.get('items', {}).get("$ref")
 
-        for key, value in schema['properties'].items():
-            example = value.get("example")
-            if example:
-                try:
-                    table_example[key] = int(example)
-                except ValueError:
-                    table_example[key] = example
 
-        output[schema['path']] = [table_example]
+Ref = collections.namedtuple('Ref', 'source field target array')
 
-    return output
 
-def get_schemas_from_github(profile_url, branch='main'):
-    url = "https://api.github.com/repos/openreferral/specification/contents/schema?ref=3.0"
+class RefCycleError(click.ClickException):
+    """A schema references itself, directly or through other schemas."""
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__(f'Schema reference cycle: {" -> ".join(path)}')
+
+
+class RefGraph:
+    """Index of the $refs between schema files, in property order, built once per set of schemas."""
+
+    def __init__(self, schemas):
+        # filename -> schema
+        self.nodes = list(schemas)
+        self.forward = {filename: self.schema_refs(filename, schema) for filename, schema in schemas.items()}
+        self.reverse = collections.defaultdict(list)
+        for refs in self.forward.values():
+            for ref in refs:
+                self.reverse[ref.target].append(ref)
+
+    @staticmethod
+    def schema_refs(filename, schema):
+        refs = []
+        for field, prop in schema['properties'].items():
+            obj_ref, array_ref = prop_refs(prop)
+            # array refs first to match the order they have always been found in
+            for target, array in ((array_ref, True), (obj_ref, False)):
+                if target:
+                    refs.append(Ref(filename, field, target, array))
+        return refs
+
+    def updated(self, schemas, changed):
+        """The graph of schemas, which only differ from the schemas of this graph in the changed filenames."""
+        graph = RefGraph({})
+        graph.nodes = list(schemas)
+        graph.forward = {
+            filename: self.forward[filename] if filename in self.forward and filename not in changed
+            else self.schema_refs(filename, schema)
+            for filename, schema in schemas.items()
+        }
+        for refs in graph.forward.values():
+            for ref in refs:
+                graph.reverse[ref.target].append(ref)
+        return graph
+
+    @classmethod
+    def from_edges(cls, nodes, edges):
+        """A graph of other named things, such as tables, from (source, field, target) edges."""
+        graph = cls({})
+        graph.nodes = list(nodes)
+        graph.forward = {node: [] for node in graph.nodes}
+        for source, field, target in edges:
+            ref = Ref(source, field, target, False)
+            graph.forward[source].append(ref)
+            graph.reverse[target].append(ref)
+        return graph
+
+    def refs(self, filename):
+        """Refs from properties of filename."""
+        return self.forward.get(filename, [])
+
+    def referrers(self, filename):
+        """Refs from other schemas to filename."""
+        return self.reverse.get(filename, [])
+
+    def dependencies(self, *filenames):
+        """The given schema files and every schema file they reference, directly or not."""
+        found = set()
+        todo = [filename for filename in filenames if filename in self.forward]
+        while todo:
+            filename = todo.pop()
+            if filename in found:
+                continue
+            found.add(filename)
+            todo.extend(ref.target for ref in self.forward[filename] if ref.target in self.forward)
+        return found
+
+    def dependents(self, *filenames):
+        """The given schema files and every schema file that references them, directly or not."""
+        found = set()
+        todo = list(filenames)
+        while todo:
+            filename = todo.pop()
+            if filename in found:
+                continue
+            found.add(filename)
+            todo.extend(ref.source for ref in self.reverse.get(filename, []))
+        return found
+
+    def find_cycle(self):
+        """A list of filenames making a reference cycle, or None."""
+        state = {}
+        for start in self.nodes:
+            if start in state:
+                continue
+            stack = [(start, iter(self.forward[start]))]
+            path = [start]
+            state[start] = 'visiting'
+            while stack:
+                filename, refs = stack[-1]
+                for ref in refs:
+                    if ref.target not in self.forward:
+                        continue
+                    if state.get(ref.target) == 'visiting':
+                        return path[path.index(ref.target):] + [ref.target]
+                    if ref.target not in state:
+                        state[ref.target] = 'visiting'
+                        stack.append((ref.target, iter(self.forward[ref.target])))
+                        path.append(ref.target)
+                        break
+                else:
+                    state[filename] = 'done'
+                    stack.pop()
+                    path.pop()
+        return None
+
+    def check_cycles(self):
+        cycle = self.find_cycle()
+        if cycle:
+            raise RefCycleError(cycle)
+
+    @functools.cached_property
+    def topological_order(self):
+        """Filenames ordered so every schema comes after the schemas it references, or RefCycleError."""
+        self.check_cycles()
+
+        order = []
+        done = set()
+        for start in self.nodes:
+            stack = [(start, iter(self.forward[start]))]
+            while stack:
+                filename, refs = stack[-1]
+                if filename in done:
+                    stack.pop()
+                    continue
+                for ref in refs:
+                    if ref.target in self.forward and ref.target not in done:
+                        stack.append((ref.target, iter(self.forward[ref.target])))
+                        break
+                else:
+                    done.add(filename)
+                    order.append(filename)
+                    stack.pop()
+        return order
+
+
+class SchemaSet:
+    """The json-schemas of a schema directory, read and parsed once and shared by every pipeline step."""
+
+    def __init__(self, schemas, openapi=None):
+        # filename -> schema e.g 'service.json' -> {...}
+        self.by_filename = dict(sorted(schemas.items()))
+        # schema name -> schema e.g 'service' -> {...}
+        self.by_name = {schema['name']: schema for schema in self.by_filename.values()}
+        self.openapi = openapi
+
+    @classmethod
+    def from_dir(cls, schema_dir):
+        schemas = {}
+        openapi = None
+        for json_schema in sorted(pathlib.Path(schema_dir).glob("*.json")):
+            schema = json.loads(json_schema.read_text())
+            if json_schema.name == 'openapi.json':
+                openapi = schema
+                continue
+            schemas[json_schema.name] = schema
+        return cls(schemas, openapi)
+
+    @classmethod
+    def load(cls, schemas):
+        """Accept either an existing SchemaSet or a schema directory."""
+        if isinstance(schemas, cls):
+            return schemas
+        return cls.from_dir(schemas)
+
+    @functools.cached_property
+    def ordered_filenames(self):
+        """Schema filenames sorted by `datapackage_metadata.order`."""
+        return sorted(self.by_filename, key=lambda i: self.by_filename[i]['datapackage_metadata']['order'])
+
+    @functools.cached_property
+    def ordered(self):
+        """Schemas sorted by `datapackage_metadata.order`."""
+        return [self.by_filename[filename] for filename in self.ordered_filenames]
+
+    def copy_by_filename(self):
+        return {filename: copy_json(schema) for filename, schema in self.by_filename.items()}
+
+    @functools.cached_property
+    def digests(self):
+        """filename -> sha256 of the schema, including openapi.json."""
+        schemas = dict(self.by_filename)
+        if self.openapi is not None:
+            schemas['openapi.json'] = self.openapi
+        return {
+            filename: hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+            for filename, schema in schemas.items()
+        }
+
+    @functools.cached_property
+    def ref_graph(self):
+        return RefGraph(self.by_filename)
+
+    @functools.cached_property
+    def compiler(self):
+        """SchemaCompiler of the schemas, so each is compiled once by everything that compiles them."""
+        return SchemaCompiler(self.by_filename)
+
+    def updated(self, schemas, openapi=None):
+        """SchemaSet of schemas and openapi, keeping what this one has worked out about unchanged files."""
+        schema_set = SchemaSet(schemas, openapi)
+        files = {**self.by_filename, 'openapi.json': self.openapi}
+        new_files = {**schema_set.by_filename, 'openapi.json': openapi}
+        changed = {
+            filename for filename in files.keys() | new_files.keys()
+            if files.get(filename) is not new_files.get(filename) and files.get(filename) != new_files.get(filename)
+        }
+
+        schema_set.ref_graph = self.ref_graph.updated(schema_set.by_filename, changed)
+        if 'digests' in self.__dict__:
+            schema_set.digests = {
+                filename: self.digests[filename] if filename in self.digests and filename not in changed
+                else json_digest(schema)
+                for filename, schema in new_files.items() if schema is not None
+            }
+        if 'compiler' in self.__dict__:
+            stale = self.ref_graph.dependents(*changed) | schema_set.ref_graph.dependents(*changed)
+            schema_set.compiler.compiled = {
+                ref: compiled for ref, compiled in self.compiler.compiled.items() if ref not in stale
+            }
+        return schema_set
+
+    def dependencies(self, *filenames):
+        """The given schema files and every schema file they reference, directly or not."""
+        return self.ref_graph.dependencies(*filenames)
+
+    def fingerprint(self, filenames=None):
+        """Hash of the given schema files, or of every file when filenames is None."""
+        if filenames is None:
+            filenames = self.digests
+        digest = hashlib.sha256()
+        for filename in sorted(filenames):
+            digest.update(f'{filename}:{self.digests.get(filename)}\n'.encode())
+        return digest.hexdigest()
+
+
+JSON_BACKEND = os.environ.get('HSDS_JSON_BACKEND', 'auto')
+
+
+@functools.lru_cache(maxsize=None)
+def json_backend(name=None):
+    """The orjson module if HSDS_JSON_BACKEND (auto, orjson or json) picks it, None for the standard library."""
+    name = name or JSON_BACKEND
+    if name == 'json':
+        return None
+    if name == 'orjson':
+        return import_optional('orjson', 'fast')
+    try:
+        return importlib.import_module('orjson')
+    except ImportError:
+        return None
+
+
+def _same_with_orjson(value):
+    """False if orjson would write value differently to the standard library, as it does some floats."""
+    seen = set()
+    todo = [value]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, (dict, list)):
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            todo.extend(item.values() if isinstance(item, dict) else item)
+        elif isinstance(item, float) and not (item == 0 or 1e-4 <= abs(item) < 1e16):
+            return False
+    return True
+
+
+def _escape_non_ascii(match):
+    return json.dumps(match.group())[1:-1]
+
+
+def dumps_json(value, compact=False):
+    """value as json.dumps(value, indent=2) would write it, or minified if compact, with orjson where it can."""
+    orjson = json_backend()
+    if orjson and _same_with_orjson(value):
+        try:
+            text = orjson.dumps(value, option=0 if compact else orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            # such as keys that are not strings, or integers too big for orjson
+            pass
+        else:
+            if text.isascii() and '\x7f' not in text:
+                return text
+            # the standard library escapes everything past ascii, as well as DEL
+            return re.sub('[\x7f-\U0010ffff]', _escape_non_ascii, text)
+    if compact:
+        return json.dumps(value, separators=(',', ':'))
+    return json.dumps(value, indent=2)
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process so far, or None where there is no /proc/self/io."""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f)
+    except OSError:
+        return None
+    return int(counters['rchar']), int(counters['wchar'])
+
+
+def rss_mb():
+    """Memory this process has resident now, or None where there is no /proc/self/statm."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+@contextlib.contextmanager
+def traced_memory():
+    """Trace memory allocations with tracemalloc in the body of the with statement, unless they already are."""
+    import tracemalloc
+
+    if tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+class BuildTrace:
+    """Spans of a build, such as each stage, output and http request, with their time, memory and io."""
+
+    def __init__(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        # highest traced memory so far in each span open on the main thread
+        self._peaks = []
+        self._previous = None
+
+    def __enter__(self):
+        global _build_trace
+        self._previous, _build_trace = _build_trace, self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _build_trace
+        _build_trace = self._previous
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """Record the body of the with statement, which can add to the args it is given."""
+        import tracemalloc
+
+        main = threading.current_thread() is threading.main_thread()
+        cpu_clock = time.process_time if main else time.thread_time
+        tracing = main and tracemalloc.is_tracing()
+        if tracing:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        io_start, rss_start = io_counters(), rss_mb()
+        start, cpu_start = time.perf_counter(), cpu_clock()
+        try:
+            yield args
+        finally:
+            span = {
+                'name': name, 'category': category, 'thread': threading.current_thread().name,
+                'start_s': start - self.origin, 'wall_s': time.perf_counter() - start,
+                'cpu_s': cpu_clock() - cpu_start,
+            }
+            io_end, rss_end = io_counters(), rss_mb()
+            if io_start and io_end:
+                span['read_bytes'], span['written_bytes'] = io_end[0] - io_start[0], io_end[1] - io_start[1]
+            if rss_start is not None and rss_end is not None:
+                # of the whole process, so other threads count towards the spans of outputs and requests
+                span['rss_mb'], span['rss_delta_mb'] = rss_end, rss_end - rss_start
+            if tracing:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                span['tracemalloc_peak_mb'] = peak / 1e6
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            span['args'] = args
+            with self._lock:
+                self.spans.append(span)
+
+    def add_spans(self, spans, origin, process):
+        """Add the spans of a BuildTrace of another process, such as a stage run by a worker, which started at origin."""
+        # perf_counter is the system's monotonic clock, so the same in every process
+        with self._lock:
+            self.spans.extend(
+                {**span, 'start_s': span['start_s'] + origin - self.origin, 'thread': f"{process}/{span['thread']}"}
+                for span in spans
+            )
+
+    def http_summary(self):
+        """Number of http requests, their latency and the count of each status."""
+        requests = [span for span in self.spans if span['category'] == 'http']
+        latencies = [span['wall_s'] for span in requests]
+        return {
+            'requests': len(requests),
+            'total_s': sum(latencies),
+            'mean_s': sum(latencies) / len(latencies) if latencies else None,
+            'max_s': max(latencies, default=None),
+            'statuses': dict(collections.Counter(str(span['args'].get('status')) for span in requests)),
+        }
+
+    def to_json(self):
+        return {'spans': sorted(self.spans, key=lambda span: span['start_s']), 'http': self.http_summary()}
+
+    def chrome_events(self, pid=None, process_name=None):
+        """The spans as Chrome trace events, for chrome://tracing or Perfetto."""
+        pid = os.getpid() if pid is None else pid
+        threads = {}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span['start_s']):
+            tid = threads.setdefault(span['thread'], len(threads))
+            events.append({
+                'name': span['name'], 'cat': span['category'], 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': span['start_s'] * 1e6, 'dur': span['wall_s'] * 1e6,
+                'args': {**span['args'], **{key: value for key, value in span.items()
+                                            if key not in ('name', 'category', 'thread', 'start_s', 'wall_s', 'args')}},
+            })
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}}
+                   for thread, tid in threads.items()]
+        if process_name:
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name}})
+        return events
+
+    def save(self, path):
+        """Write the trace as json to path, and as Chrome trace events to path ending .chrome.json instead."""
+        path = pathlib.Path(path)
+        path.write_text(json.dumps(self.to_json(), indent=2, default=str))
+        path.with_suffix('.chrome.json').write_text(json.dumps({'traceEvents': self.chrome_events()}, default=str))
+
+
+# the BuildTrace being recorded, if any
+_build_trace = None
+
+
+def trace(name, category, **args):
+    """A span of the BuildTrace being recorded, or a context doing nothing if there is none."""
+    if _build_trace is None:
+        return contextlib.nullcontext(args)
+    return _build_trace.span(name, category, **args)
+
+
+@contextlib.contextmanager
+def trace_to(path):
+    """Record a BuildTrace of the body of the with statement, with tracemalloc, and save it to path unless path is None."""
+    if not path:
+        yield None
+        return
+    build_trace = BuildTrace()
+    try:
+        with traced_memory(), build_trace:
+            yield build_trace
+    finally:
+        build_trace.save(path)
+
+
+def write_if_changed(path, text):
+    """Write text to path unless the file already holds exactly that, returns True if written."""
+    path = pathlib.Path(path)
+    data = text.encode()
+    with trace(str(path), 'write', bytes=len(data)) as span:
+        if path.exists() and path.stat().st_size == len(data) and path.read_bytes() == data:
+            span['written'] = False
+            return False
+        try:
+            path.write_bytes(data)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        span['written'] = True
+        return True
+
+
+@functools.lru_cache(maxsize=None)
+def output_writer():
+    """Thread of this process that writes outputs while the next one is serialized."""
+    import concurrent.futures
+
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='hsds-writer')
+
+
+# a forked process does not get the writer thread, so it makes its own rather than waiting on one that is not there
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=output_writer.cache_clear)
+
+
+class BuildManifest:
+    """Record of the hashes of the inputs each output was last built from, with no path every output is built."""
+
+    def __init__(self, path=None):
+        self.path = pathlib.Path(path) if path else None
+        self.outputs = {}
+        # writes started by write that have not finished yet
+        self.pending = []
+        if self.path and self.path.exists():
+            self.outputs = json.loads(self.path.read_text()).get('outputs', {})
+
+    @functools.cached_property
+    def tool_digest(self):
+        return hashlib.sha256(pathlib.Path(__file__).read_bytes()).hexdigest()
+
+    def key(self, *parts):
+        return hashlib.sha256('\n'.join((self.tool_digest,) + parts).encode()).hexdigest()
+
+    def fresh(self, output, key):
+        return bool(self.path) and self.outputs.get(str(output)) == key and pathlib.Path(output).exists()
+
+    def record(self, output, key):
+        self.outputs[str(output)] = key
+
+    def write(self, output, text, key):
+        """Write text to output and record it, in the background if there is a path, flush waits for the write."""
+        if self.path:
+            self.pending.append(output_writer().submit(write_if_changed, output, text))
+        else:
+            write_if_changed(output, text)
+        self.record(output, key)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def build(self, output, key, make_text):
+        """Write make_text() to output unless it is fresh, returns True if make_text was called."""
+        if self.fresh(output, key):
+            return False
+        with trace(str(output), 'output'):
+            self.write(output, make_text(), key)
+        return True
+
+    def save(self):
+        self.flush()
+        if self.path:
+            write_if_changed(self.path, json.dumps({"outputs": dict(sorted(self.outputs.items()))}, indent=2))
+
+
+def tabular_example_rows(schema):
+    table_example = {}
+
+    for key, value in schema['properties'].items():
+        example = value.get("example")
+        if example:
+            try:
+                table_example[key] = int(example)
+            except ValueError:
+                table_example[key] = example
+
+    return [table_example]
+
 
+def tabular_example(schemas):
+    schema_set = SchemaSet.load(schemas)
+
+    output = {}
+
+    for schema in schema_set.ordered:
+        output[schema['path']] = tabular_example_rows(schema)
+
+    return output
+
+CORE_REF = '3.0'
+CORE_SCHEMA_URL = "https://api.github.com/repos/openreferral/specification/contents/schema?ref={ref}"
+CORE_RAW_URL = "https://raw.githubusercontent.com/openreferral/specification/{ref}"
+DEFAULT_CACHE_DIR = pathlib.Path(
+    os.environ.get('HSDS_SCHEMA_CACHE', pathlib.Path.home() / '.cache' / 'hsds_schema_tools')
+)
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
+BUILD_MANIFEST = '.hsds_build_manifest.json'
+
+
+class HTTPCache:
+    """Fetches urls over one pooled session, revalidating bodies kept in cache_dir with their ETag."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, workers=FETCH_WORKERS, timeout=FETCH_TIMEOUT):
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+
+        import requests
+        import requests.adapters
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f'{key}.body', self.cache_dir / f'{key}.etag'
+
+    def request(self, url, headers=None):
+        with trace(url, 'http') as span:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            span['status'] = response.status_code
+            span['bytes'] = len(response.content)
+        return response
+
+    def get(self, url):
+        if not self.cache_dir:
+            response = self.request(url)
+            response.raise_for_status()
+            return response.text
+
+        body_path, etag_path = self._paths(url)
+        headers = {}
+        if body_path.exists() and etag_path.exists():
+            headers['If-None-Match'] = etag_path.read_text()
+
+        response = self.request(url, headers)
+        if response.status_code == 304:
+            return body_path.read_text()
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        if etag:
+            # write to a temporary file first so a concurrent run never reads half a body
+            tmp_path = body_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_text(response.text)
+            tmp_path.replace(body_path)
+            etag_path.write_text(etag)
+        else:
+            # the cached body is out of date and can not be revalidated
+            etag_path.unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+        return response.text
+
+
+def fetch_core_files(url, cache_dir=DEFAULT_CACHE_DIR, workers=FETCH_WORKERS):
+    """Download every file of a github contents api directory listing, returns filename -> text."""
+    import concurrent.futures
+
+    with trace('fetch', 'stage', url=url):
+        http = HTTPCache(cache_dir, workers=workers)
+
+        data = json.loads(http.get(url))
+
+        # get the download URL and the file name, skipping directories
+        files = [(file['name'], file['download_url']) for file in data if file['download_url']]
+
+        def fetch(file):
+            filename, download_url = file
+            return filename, http.get(download_url)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(fetch, files))
+
+
+def profile_raw_url(profile_url, branch='main'):
     if profile_url.startswith("https://github.com"):
         path = profile_url.replace("https://github.com", "")
         profile_url = "https://raw.githubusercontent.com" + path.rstrip("/") + "/" + branch
-
-    response = requests.get(url)
-    data = json.loads(response.text)
-
+    return profile_url
+
+
+def openapi_for_profile(text, profile_url, branch='main', core_ref=CORE_REF):
+    """Point the core openapi.json at the profile's own compiled schemas."""
+    return json.loads(text.replace(CORE_RAW_URL.format(ref=core_ref), profile_raw_url(profile_url, branch)))
+
+
+def read_core_spec(core):
+    """filename -> text of the core schemas in a spec checkout, its schema directory or a tarball of either."""
+    core = pathlib.Path(core)
+
+    if core.is_dir():
+        if (core / 'schema').is_dir():
+            core = core / 'schema'
+        files = {path.name: path.read_text() for path in sorted(core.glob('*.json'))}
+    else:
+        import tarfile
+
+        with tarfile.open(core) as tar:
+            members = [member for member in tar.getmembers() if member.isfile() and member.name.endswith('.json')]
+            paths = {member.name: pathlib.PurePosixPath(member.name) for member in members}
+            # prefer the spec's schema directory, otherwise take the top most json files
+            in_schema_dir = [member for member in members if paths[member.name].parent.name == 'schema']
+            if in_schema_dir:
+                members = in_schema_dir
+            elif members:
+                depth = min(len(path.parts) for path in paths.values())
+                members = [member for member in members if len(paths[member.name].parts) == depth]
+            files = {
+                paths[member.name].name: tar.extractfile(member).read().decode()
+                for member in sorted(members, key=lambda i: i.name)
+            }
+
+    if not files:
+        raise click.ClickException(f'No core schemas found in {core}')
+    return files
+
+
+class SchemaStore:
+    """Content addressed store of core schema files, with the filename -> hash manifest of each version seen."""
+
+    def __init__(self, store_dir=None):
+        self.store_dir = pathlib.Path(store_dir) if store_dir else None
+        if self.store_dir:
+            (self.store_dir / 'objects').mkdir(parents=True, exist_ok=True)
+            (self.store_dir / 'versions').mkdir(parents=True, exist_ok=True)
+        self._texts = {}
+        self._schemas = {}
+        self._dumps = {}
+        self._manifests = {}
+
+    def _version_path(self, version):
+        return self.store_dir / 'versions' / f'{hashlib.sha256(version.encode()).hexdigest()}.json'
+
+    def add(self, files, version=None):
+        """Store filename -> text files and return their manifest, recorded under version if given."""
+        manifest = {}
+        for filename, text in files.items():
+            digest = hashlib.sha256(text.encode()).hexdigest()
+            manifest[filename] = digest
+            if digest in self._texts:
+                continue
+            self._texts[digest] = text
+            if self.store_dir:
+                path = self.store_dir / 'objects' / f'{digest}.json'
+                if not path.exists():
+                    path.write_text(text)
+
+        if version:
+            self._manifests[version] = manifest
+            if self.store_dir:
+                self._version_path(version).write_text(json.dumps({"version": version, "files": manifest}, indent=2))
+        return manifest
+
+    def manifest(self, version):
+        """The manifest stored for version, or None if that version has not been seen."""
+        if version not in self._manifests and self.store_dir:
+            path = self._version_path(version)
+            if path.exists():
+                self._manifests[version] = json.loads(path.read_text())['files']
+        return self._manifests.get(version)
+
+    def text(self, digest):
+        if digest not in self._texts:
+            self._texts[digest] = (self.store_dir / 'objects' / f'{digest}.json').read_text()
+        return self._texts[digest]
+
+    def schema(self, digest):
+        """Parsed schema for digest. Parsed once and shared, callers must not change it."""
+        if digest not in self._schemas:
+            self._schemas[digest] = json.loads(self.text(digest))
+        return self._schemas[digest]
+
+    def dumps(self, digest):
+        """The schema for digest as written to a schema directory."""
+        if digest not in self._dumps:
+            self._dumps[digest] = dumps_json(self.schema(digest))
+        return self._dumps[digest]
+
+
+def load_core_manifest(core=None, core_ref=CORE_REF, cache_dir=DEFAULT_CACHE_DIR, offline=False, store=None,
+                  workers=FETCH_WORKERS, no_cache=False):
+    """(store, filename -> hash manifest) of the core spec, from core, github or the store if github fails."""
+    if store is None:
+        store = SchemaStore(pathlib.Path(cache_dir) / 'store' if cache_dir else None)
+
+    if core:
+        return store, store.add(read_core_spec(core))
+
+    import requests
+
+    version = f'github:{core_ref}'
+    manifest = None
+    if not offline:
+        try:
+            files = fetch_core_files(CORE_SCHEMA_URL.format(ref=core_ref), None if no_cache else cache_dir, workers)
+            manifest = store.add(files, version)
+        except requests.RequestException as e:
+            click.echo(f'Could not fetch core schemas from github ({e}), using stored core schemas for {core_ref}',
+                       err=True)
+    if manifest is None:
+        manifest = store.manifest(version)
+    if manifest is None:
+        raise click.ClickException(
+            f'Core schemas for {core_ref} are not in the schema store, run once with network access or use --core'
+        )
+    return store, manifest
+
+
+def core_schemas_from_store(store, manifest, profile_url, branch='main', core_ref=CORE_REF):
+    """filename -> schema for a core manifest, shared with the store but for openapi.json."""
     schemas = {}
-    for file in data:
-        # get the download URL and the file name
-        url = file['download_url']
-        if not url:  # skip directories
-            continue
-        filename = file['name']
-
-        response_text = requests.get(url).text
+    for filename, digest in manifest.items():
         if filename == 'openapi.json':
-            response_text = response_text.replace('https://raw.githubusercontent.com/openreferral/specification/3.0', profile_url)
+            schemas[filename] = openapi_for_profile(store.text(digest), profile_url, branch, core_ref)
+        else:
+            schemas[filename] = store.schema(digest)
+    return schemas
 
-        response = json.loads(response_text)
-        schemas[filename] = response
 
-    return schemas
+def merge_patch(target, patch):
+    """Apply a json merge patch (RFC 7386) without changing target, sharing what the patch leaves alone."""
+    if not isinstance(patch, dict):
+        return patch
+
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if isinstance(value, dict):
+            result[key] = merge_patch(result.get(key), value)
+        elif value is None:
+            result.pop(key, None)
+        else:
+            result[key] = value
+    return result
 
 
 @click.group()
@@ -72,14 +869,11 @@ def cli():
     pass
 
 
-def profile_to_schema(profile_url, branch='main', profile_dir='profile', schema_dir='schema'):
-    core_schemas = get_schemas_from_github(profile_url, branch=branch)
-
+def merge_profile(core_schemas, profile_schemas):
+    """filename -> schema of a profile merged into the core spec, without changing either."""
     final_schemas = {}
-    profile_schemas = {}
-
-    for profile_schema in sorted(pathlib.Path(profile_dir).glob("*.json")):
-        profile_schemas[profile_schema.name] = json.loads(profile_schema.read_text())
+    # schemas from the core spec, which lose properties referencing removed tables
+    to_prune = {}
 
     removed = []
     for name, schema in profile_schemas.items():
@@ -91,34 +885,61 @@ def profile_to_schema(profile_url, branch='main', profile_dir='profile', schema_
             final_schemas[name] = schema
             continue
         if schema:
-            merged = json_merge_patch.merge(core_schemas[name], schema)
-            for removed_name in removed:
-                if name == 'openapi.json':
-                    continue
-
-                properties = merged['properties']
-                for prop in list(properties):
-                    if properties[prop].get('$ref') == removed_name or properties[prop].get('items', {}).get('$ref') == removed_name:
-                        properties.pop(prop)
+            merged = merge_patch(core_schemas[name], schema)
             final_schemas[name] = merged
+            if name != 'openapi.json':
+                to_prune[name] = merged
 
     for name, schema in core_schemas.items():
         if name in profile_schemas:
             continue
-        for removed_name in removed:
-            if name == 'openapi.json':
-                continue
-            properties = schema['properties']
-            for prop in list(properties):
-                if properties[prop].get('$ref') == removed_name or properties[prop].get('items', {}).get('$ref') == removed_name:
-                    properties.pop(prop)
         final_schemas[name] = schema
+        if name != 'openapi.json':
+            to_prune[name] = schema
+
+    # drop properties that reference removed tables, copying only the schemas that lose some
+    if removed:
+        ref_graph = RefGraph(to_prune)
+        dropped = collections.defaultdict(set)
+        for removed_name in removed:
+            for ref in ref_graph.referrers(removed_name):
+                dropped[ref.source].add(ref.field)
+
+        for name, fields in dropped.items():
+            schema = final_schemas[name]
+            final_schemas[name] = {**schema, 'properties': {
+                field: prop for field, prop in schema['properties'].items() if field not in fields
+            }}
+
+    return final_schemas
+
+
+def profile_to_schema(profile_url, branch='main', profile_dir='profile', schema_dir='schema',
+                      cache_dir=DEFAULT_CACHE_DIR, core=None, core_ref=CORE_REF, offline=False, store=None,
+                      core_manifest=None):
+    manifest = core_manifest
+    if manifest is None:
+        store, manifest = load_core_manifest(core=core, core_ref=core_ref, cache_dir=cache_dir, offline=offline,
+                                             store=store)
+    core_schemas = core_schemas_from_store(store, manifest, profile_url, branch=branch, core_ref=core_ref)
+
+    profile_schemas = {}
+    for profile_schema in sorted(pathlib.Path(profile_dir).glob("*.json")):
+        profile_schemas[profile_schema.name] = json.loads(profile_schema.read_text())
 
+    final_schemas = merge_profile(core_schemas, profile_schemas)
 
     schema_path = pathlib.Path(schema_dir)
 
     for name, schema in final_schemas.items():
-        (schema_path / name).write_text(json.dumps(schema, indent=2))
+        if name != 'openapi.json' and name in manifest and schema is core_schemas[name]:
+            # unchanged from the core spec, so serialized once per store
+            text = store.dumps(manifest[name])
+        else:
+            text = dumps_json(schema)
+        write_if_changed(schema_path / name, text)
+
+    return final_schemas
 
 
 def clean_dir(directory):
@@ -128,35 +949,58 @@ def clean_dir(directory):
 
 @cli.command()
 @click.argument('jsonschema_dir')
-def schemas_to_datapackage(jsonschema_dir):
+@click.option('--stream', is_flag=True, default=False, help='Write the datapackage one resource at a time.')
+def schemas_to_datapackage(jsonschema_dir, stream=False):
+    if stream:
+        stream_datapackage(jsonschema_dir, sys.stdout)
+        sys.stdout.write('\n')
+        return
     datapackage = _schemas_to_datapackage(jsonschema_dir)
     print(datapackage)
 
-def _schemas_to_datapackage(jsonschema_dir):
-    input_path = pathlib.Path(jsonschema_dir)
-    
-    fks = []
-    schemas = []
 
-    for json_schema in sorted(input_path.glob("*.json")):
-        if str(json_schema).endswith('openapi.json'):
-            continue
-        schema = json.loads(json_schema.read_text())
-        schemas.append(schema)
+DATAPACKAGE_METADATA = {
+    "name": "human_services_data",
+    "title": "Human Services Data Specification",
+    "description": "HSDS describes data about organizations, the services they provide, the locations at which these services can be accessed, and associated details.",
+    "profile": "tabular-data-package",
+    "version": "3.0.0",
+    "homepage": "http://docs.openreferral.org",
+    "license": {
+        "url": "https://creativecommons.org/licenses/by-sa/4.0/",
+        "type": "CC-BY-SA-4.0",
+        "name": "Creative Commons Attribution-ShareAlike 4.0"
+    },
+}
+
+
+def datapackage_foreign_keys(schema_set):
+    """Table name -> the tables it has foreign keys to, without duplicates or self references."""
+    foreign_tables = collections.defaultdict(dict)
+
+    for filename, schema in schema_set.by_filename.items():
         name = schema['name']
-        for field, prop in schema['properties'].items():
-            array_ref = prop.get('items', {}).get("$ref")
-            if array_ref and array_ref not in ['attribute.json', 'metadata.json']:
-                table = array_ref.replace('.json', '')
-                fks.append((table, name))
-            obj_ref = prop.get("$ref")
-            if obj_ref:
-                table = obj_ref.replace('.json', '')
-                fks.append((name, table))
-    
-    resources = []
+        for ref in schema_set.ref_graph.refs(filename):
+            table = ref.target.replace('.json', '')
+            if not ref.array:
+                table, foriegn_table = name, table
+            elif ref.target not in ['attribute.json', 'metadata.json']:
+                foriegn_table = name
+            else:
+                continue
+            if table != foriegn_table:
+                # a dict keeps the order foreign keys are found in, without duplicates
+                foreign_tables[table][foriegn_table] = None
+
+    return {table: list(foriegn_tables) for table, foriegn_tables in foreign_tables.items()}
+
+
+def datapackage_resources(schema_set):
+    """Yield the datapackage resource of each schema, in datapackage order."""
+    foreign_tables = datapackage_foreign_keys(schema_set)
 
-    for schema in sorted(schemas, key=lambda i: i['datapackage_metadata']['order']):
+    for schema in schema_set.ordered:
+        schema = copy_json(schema)
         foreign_keys = []
 
         required = []
@@ -170,17 +1014,16 @@ def _schemas_to_datapackage(jsonschema_dir):
 
         name = schema['name']
 
-        for table, foriegn_table in fks:
-            if table == name:
-                foreign_keys.append(
-                    {
-                        "fields": f"{foriegn_table}_id",
-                        "reference": {
-                            "resource": foriegn_table,
-                            "fields": "id"
-                        }
+        for foriegn_table in foreign_tables.get(name, []):
+            foreign_keys.append(
+                {
+                    "fields": f"{foriegn_table}_id",
+                    "reference": {
+                        "resource": foriegn_table,
+                        "fields": "id"
                     }
-                )
+                }
+            )
 
         fields = []
 
@@ -209,94 +1052,193 @@ def _schemas_to_datapackage(jsonschema_dir):
         if foreign_keys:
             schema['schema']["foreignKeys"] = foreign_keys
 
-        resources.append(schema)
+        yield schema
 
-    datapackage = {
-        "name": "human_services_data",
-        "title": "Human Services Data Specification",
-        "description": "HSDS describes data about organizations, the services they provide, the locations at which these services can be accessed, and associated details.",
-        "profile": "tabular-data-package",
-        "version": "3.0.0",
-        "homepage": "http://docs.openreferral.org",
-        "license": {
-            "url": "https://creativecommons.org/licenses/by-sa/4.0/",
-            "type": "CC-BY-SA-4.0",
-            "name": "Creative Commons Attribution-ShareAlike 4.0"
-        },
-        "resources": resources
-    }
+
+def _schemas_to_datapackage(jsonschema_dir):
+    schema_set = SchemaSet.load(jsonschema_dir)
+
+    datapackage = {**DATAPACKAGE_METADATA, "resources": list(datapackage_resources(schema_set))}
 
     return json.dumps(datapackage, indent=4)
 
 
+def stream_datapackage(jsonschema_dir, f):
+    """Write the same json as _schemas_to_datapackage to f, encoding one resource at a time."""
+    schema_set = SchemaSet.load(jsonschema_dir)
+
+    header = json.dumps({**DATAPACKAGE_METADATA, "resources": []}, indent=4)
+    # the header ends with `"resources": []\n}`, resources are written in between
+    f.write(header[:-len('[]\n}')])
+    f.write('[')
+
+    encoder = json.JSONEncoder(indent=4)
+    separator = '\n' + ' ' * 8
+    written = False
+    for resource in datapackage_resources(schema_set):
+        f.write(',' + separator if written else separator)
+        f.write(encoder.encode(resource).replace('\n', separator))
+        written = True
+
+    f.write('\n    ]\n}' if written else ']\n}')
+
+
+# columns of schemas-to-csv as (path, title, type), paths join nested keys with `_`
+# the same as the fields csv that can be given to override them
+SCHEMA_CSV_FIELDS = [
+    ('table_name', 'table_name', 'text'),
+    ('name', 'name', 'text'),
+    ('type', 'type', 'text'),
+    ('description', 'description', 'text'),
+    ('constraints_unique', 'constraints_unique', 'boolean'),
+    ('constraints_required', 'constraints_required', 'boolean'),
+    ('constraints_tablular_required', 'constraints_tablular_required', 'boolean'),
+    ('format', 'format', 'text'),
+    ('items_$ref', 'one_to_many', 'text'),
+    ('$ref', 'one_to_one', 'text'),
+    ('enum', 'enum', 'text'),
+]
+
+
+def read_fields_csv(path):
+    """Columns from a flatterer style fields csv, with field_name, field_title and field_type."""
+    with open(path, newline='') as f:
+        return [(row['field_name'], row['field_title'], row['field_type']) for row in csv.DictReader(f)]
+
+
+def flatten_prop(value, prefix='', output=None):
+    """Nested dict as path -> value, lists of values are joined with commas."""
+    if output is None:
+        output = {}
+    for key, item in value.items():
+        path = f'{prefix}{key}'
+        if isinstance(item, dict):
+            flatten_prop(item, f'{path}_', output)
+        elif isinstance(item, list):
+            if all(not isinstance(part, (dict, list)) for part in item):
+                output[path] = ','.join(str(part) for part in item)
+        else:
+            output[path] = item
+    return output
+
+
+def schema_field_rows(schemas, fields=SCHEMA_CSV_FIELDS):
+    """Yield a row per schema property, title -> value for each of fields."""
+    schema_set = SchemaSet.load(schemas)
+
+    for schema in schema_set.ordered:
+        name = schema['name']
+
+        required = schema.get("required", [])
+        tabular_required = schema.get("tabular_required", [])
+
+        for field, prop in schema['properties'].items():
+            flat = flatten_prop(prop)
+            flat['table_name'] = name
+            flat['constraints_required'] = field in required
+            flat['constraints_tablular_required'] = field in tabular_required
+            yield {title: flat.get(path) for path, title, _ in fields}
+
+
+def write_schema_fields(rows, fields, output, output_format='csv'):
+    """Write rows as they come, as csv or json lines to the text file output, or parquet to a path."""
+    titles = [title for _, title, _ in fields]
+
+    if output_format == 'jsonl':
+        for row in rows:
+            output.write(json.dumps(row) + '\n')
+        return
+
+    if output_format == 'parquet':
+        pyarrow = import_optional('pyarrow', 'parquet')
+        import pyarrow.parquet
+
+        types = {'boolean': pyarrow.bool_(), 'number': pyarrow.float64()}
+        arrow_schema = pyarrow.schema([(title, types.get(field_type, pyarrow.string())) for _, title, field_type in fields])
+        with pyarrow.parquet.ParquetWriter(output, arrow_schema) as writer:
+            for batch in batched(rows, 1000):
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=arrow_schema))
+        return
+
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(titles)
+    for row in rows:
+        writer.writerow([csv_value(row[title]) for title in titles])
+
+
 @cli.command()
 @click.argument('jsonschema_dir')
-def schemas_to_csv(jsonschema_dir):
+@click.option('--fields', 'fields_csv', type=click.Path(exists=True, dir_okay=False),
+              help='A fields csv (like fields_for_csv.csv) to choose the columns.')
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'jsonl', 'parquet']), default='csv')
+@click.option('--output', default='-', help='File to write to, stdout by default. Needed for parquet.')
+def schemas_to_csv(jsonschema_dir, fields_csv, output_format, output):
+    fields = read_fields_csv(fields_csv) if fields_csv else SCHEMA_CSV_FIELDS
+    rows = schema_field_rows(jsonschema_dir, fields)
+
+    if output_format == 'parquet':
+        if output == '-':
+            raise click.ClickException('Give an --output file for parquet')
+        write_schema_fields(rows, fields, output, output_format)
+        return
 
-    input_path = pathlib.Path(jsonschema_dir)
+    with click.open_file(output, 'w') as f:
+        write_schema_fields(rows, fields, f, output_format)
 
-    def table_iterator():
-        schemas = []
-        for json_schema in input_path.glob("*.json"):
-            if str(json_schema).endswith('openapi.json'):
-                continue
-            schema = json.loads(json_schema.read_text())
-            schemas.append(schema)
 
-        for schema in sorted(schemas, key=lambda i: i['datapackage_metadata']['order']):
-            name = schema['name']
+class ExampleBuilder:
+    """Builds examples from name -> schema, each (schema, simple) once and shared, so not to be changed."""
 
-            required = schema.get("required", [])
-            tabular_required = schema.get("tabular_required", [])
+    def __init__(self, schemas):
+        self.schemas = schemas
+        self.examples = {}
+        self._building = []
 
-            for field, prop in list(schema.pop('properties').items()):
-                prop['table_name'] = name
+    def get(self, schema_name, simple):
+        key = (schema_name, simple)
+        if key in self.examples:
+            return self.examples[key]
+        if schema_name in self._building:
+            path = self._building[self._building.index(schema_name):] + [schema_name]
+            raise RefCycleError([f'{name}.json' for name in path])
 
-                contraints = prop.get('constraints')
-                if not contraints:
-                    prop['constraints'] = {}
+        self._building.append(schema_name)
+        try:
+            example = self.build(schema_name, simple)
+        finally:
+            self._building.pop()
+        self.examples[key] = example
+        return example
 
-                prop['constraints']['required'] = field in required
-                prop['constraints']['tablular_required'] = field in tabular_required
-                yield prop
-    
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        flatterer.flatten(table_iterator(), tmpdirname, force=True, fields_csv='fields_for_csv.csv', only_fields=True)
-        path = pathlib.Path(tmpdirname) / 'csv' / 'main.csv'
-        print(path.read_text())
+    def build(self, schema_name, simple):
+        results = {}
 
+        schema = self.schemas[schema_name]
 
-def get_example(schemas, schema_name, simple):
-    results = {}
+        for key, value in schema["properties"].items():
+            if key.endswith('_id') and 'parent' not in key:
+                continue
+            example = value.get("example")
+            if example:
+                if value.get("type") == "string":
+                    results[key] = example
+                else:
+                    try:
+                        results[key] = int(example)
+                    except ValueError:
+                        results[key] = example
 
-    schema = schemas[schema_name]
+            obj_ref, array_ref = prop_refs(value)
 
-    for key, value in schema["properties"].items():
-        if key.endswith('_id') and 'parent' not in key:
-            continue
-        example = value.get("example")
-        if example:
-            if value.get("type") == "string":
-                results[key] = example
-            else:
-                try:
-                    results[key] = int(example)
-                except ValueError:
-                    results[key] = example
-        
-        obj_ref = value.get('$ref')
+            if obj_ref:
+                results[key] = self.get(obj_ref[:-5], simple)
 
-        if obj_ref:
-           results[key] = get_example(schemas, obj_ref[:-5], simple)
+            if not simple:
+                if array_ref and (array_ref not in ('metadata.json', 'attribute.json') or schema["name"] == "service"):
+                    results[key] = [self.get(array_ref[:-5], simple)]
 
-        if not simple:
-            array_ref = value.get('items', {}).get("$ref")
-            if array_ref and (array_ref not in ('metadata.json', 'attribute.json') or schema_name == "service"):
-                #if array_ref in ('metadata.json', 'attribute.json') and array_ref not in schemas:
-                #    continue
-                results[key] = [get_example(schemas, array_ref[:-5], simple)]
+        return results
 
-    return results
 
 page = {
     "total_items": 10,
@@ -308,32 +1250,42 @@ page = {
     "empty": False,
 }          
 
-def example(schemas, base, paginated):
-    input_path = pathlib.Path(schemas)
 
-    schemas = {}
-    for json_schema in input_path.glob("*.json"):
-        if str(json_schema).endswith('openapi.json'):
-            continue
-        schema = json.loads(json_schema.read_text())
-        schemas[schema["name"]] = schema
+def example_schemas(schema_set, base):
+    """name -> schema for the examples of base, with the overlays of entity_overlay."""
+    if base not in ('organization', 'service_at_location'):
+        return schema_set.by_name
+
+    root, schemas = entity_overlay(schema_set.by_filename, base)
+    schemas = {filename[:-5]: schema for filename, schema in schemas.items()}
+    schemas[base] = root
 
-    if base not in schemas:
-        return
-    
     if base == 'organization':
-        schemas["service"]["properties"].pop("organization")
-        schemas["organization"]["properties"]["services"] = {"type": "array", "items": {"$ref": "service.json"}}
+        # the services of an example organization do not repeat it
+        service = schemas['service']
+        schemas['service'] = {**service, 'properties': {
+            key: value for key, value in service['properties'].items() if key != 'organization'
+        }}
+
+    return schemas
+
+
+def paginate(example):
+    new_example = page.copy()
+    new_example["contents"] = [example]
+    return new_example
 
-    if base == 'service_at_location':
-        schemas["service"]["properties"].pop("service_at_locations")
-        schemas["service_at_location"]["properties"]["service"] = {"$ref": "service.json"}
 
-    example = get_example(schemas, base, paginated)
+def example(schemas, base, paginated, builder=None):
+    schema_set = SchemaSet.load(schemas)
+
+    if base not in schema_set.by_name:
+        return
+
+    builder = builder or ExampleBuilder(example_schemas(schema_set, base))
+    example = builder.get(base, paginated)
     if paginated:
-        new_example = page.copy()
-        new_example["contents"] = [example]
-        example = new_example
+        example = paginate(example)
 
     return example
 
@@ -344,7 +1296,18 @@ def example(schemas, base, paginated):
 def schemas_to_doc_examples(schemas, output):
     _schemas_to_doc_examples(schemas, output)
 
-def _schemas_to_doc_examples(schemas, output):
+def entity_inputs(schema_set, entity):
+    """Schema files an example or compiled schema for entity is built from."""
+    filenames = [f'{entity}.json']
+    if entity in ('organization', 'service_at_location'):
+        # these have the service nested in them
+        filenames.append('service.json')
+    return schema_set.dependencies(*filenames)
+
+
+def _schemas_to_doc_examples(schemas, output, manifest=None):
+    schemas = SchemaSet.load(schemas)
+    manifest = manifest or BuildManifest()
     output_path = pathlib.Path(output)
     examples = [
         # entity, filename, simple
@@ -360,88 +1323,159 @@ def _schemas_to_doc_examples(schemas, output):
         ('taxonomy_term', 'taxonomy_term_list.json', True),
     ]
 
-
+    # one builder per set of overlays, so sub-examples are built once across files
+    builders = {}
+
+    def make_example(entity, simple):
+        base = entity if entity in ('organization', 'service_at_location') else None
+        if base not in builders:
+            builders[base] = ExampleBuilder(example_schemas(schemas, base))
+        return dumps_json(example(schemas, entity, simple, builders[base]))
+
+    def make_csv(schema):
+        f = io.StringIO()
+        rows = tabular_example_rows(schema)
+        dict_writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        dict_writer.writeheader()
+        for row in rows:
+            dict_writer.writerow(row)
+        return f.getvalue()
+
+    outputs = []
     for entity, filename, simple in examples:
-        example_json = example(schemas, entity, simple)
-        if example_json:
-            with open(output_path / filename, 'w+') as f:
-                json.dump(example_json, f, indent=2)
+        if entity not in schemas.by_name:
+            continue
+        key = manifest.key('example', entity, str(simple), schemas.fingerprint(entity_inputs(schemas, entity)))
+        outputs.append((output_path / filename, key, functools.partial(make_example, entity, simple)))
 
-    os.makedirs(output_path / 'csv', exist_ok=True)
+    for filename in schemas.ordered_filenames:
+        schema = schemas.by_filename[filename]
+        key = manifest.key('tabular_example', schemas.fingerprint([filename]))
+        outputs.append((output_path / 'csv' / schema['path'], key, functools.partial(make_csv, schema)))
 
-    for path, rows in tabular_example(schemas).items():
-        with open(output_path / 'csv' / path, 'w+') as f:
-            dict_writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-            dict_writer.writeheader()
-            for row in rows:
-                dict_writer.writerow(row)
+    # fail before writing anything if the examples could never be built
+    schemas.ref_graph.check_cycles()
+
+    for path, key, make_text in outputs:
+        manifest.build(path, key, make_text)
 
 
 @cli.command()
-@click.argument('schamas')
+@click.argument('schemas')
 @click.argument('base')
 @click.option('--simple', is_flag=True)
 def schemas_to_example(schemas, base, simple):
-    print(json.dumps(example(schemas, base, simple), indent=2))
+    print(dumps_json(example(schemas, base, simple)))
 
 
-def compile_definitions(schemas_path, output_path):
+def compile_definitions(schemas, output_path, manifest=None, compact=False):
+    schema_set = SchemaSet.load(schemas)
+    manifest = manifest or BuildManifest()
 
-    schemas = {}
-    for json_schema in schemas_path.glob("*.json"):
-        if str(json_schema).endswith('openapi.json'):
-            continue
-        schema = json.loads(json_schema.read_text())
+    key = manifest.key('compile_definitions', str(compact), schema_set.fingerprint(schema_set.by_filename))
+    if manifest.fresh(output_path / 'service_with_definitions.json', key):
+        return
 
-        for field, prop in schema['properties'].items():
-            array_ref = prop.get('items', {}).get("$ref")
-            if array_ref:
-                prop['items']['$ref'] = f'#/definitions/{array_ref.split(".")[0]}'
+    copies = schema_set.copy_by_filename()
 
-            obj_ref = prop.get("$ref")
-            if obj_ref:
-                prop['$ref'] = f'#/definitions/{obj_ref.split(".")[0]}'
+    schemas = {}
+    for filename in schema_set.ordered_filenames:
+        schema = copies[filename]
+        for ref in schema_set.ref_graph.refs(filename):
+            prop = schema['properties'][ref.field]
+            if ref.array:
+                prop['items']['$ref'] = f'#/definitions/{ref.target.split(".")[0]}'
+            else:
+                prop['$ref'] = f'#/definitions/{ref.target.split(".")[0]}'
 
         schemas[schema["name"]] = schema
     
     compiled = schemas.pop('service')
     compiled['definitions'] = {}
 
-    for name, schema in sorted(schemas.items(), key=lambda i:i[1]['datapackage_metadata']['order']):
+    for name, schema in schemas.items():
         compiled['definitions'][name] = schema
     
-    (output_path / 'service_with_definitions.json').write_text(json.dumps(compiled, indent=2))
+    manifest.write(output_path / 'service_with_definitions.json', dumps_json(compiled, compact), key)
+
+
+class SchemaCompiler:
+    """Inlines the $refs of schemas, compiling each referenced schema once and sharing it, so not to be changed."""
+
+    def __init__(self, schemas):
+        # filename -> schema
+        self.schemas = schemas
+        self.compiled = {}
+        self._compiling = []
+
+    def compile_ref(self, ref):
+        if ref in self.compiled:
+            return self.compiled[ref]
+        if ref in self._compiling:
+            raise RefCycleError(self._compiling[self._compiling.index(ref):] + [ref])
+
+        self._compiling.append(ref)
+        try:
+            compiled = self.compile(self.schemas[ref])
+        finally:
+            self._compiling.pop()
+        self.compiled[ref] = compiled
+        return compiled
+
+    def extended(self, schemas):
+        """A compiler for schemas, which adds files to these but replaces none, using what this one has compiled."""
+        compiler = SchemaCompiler(schemas)
+        compiler.compiled = collections.ChainMap({}, self.compiled)
+        return compiler
+
+    def compile(self, schema):
+        """Compiled version of schema, schema itself is not changed."""
+        properties = {}
+        for field, prop in schema['properties'].items():
+            array_ref = prop_refs(prop)[1]
+            if array_ref:
+                old_prop = {key: value for key, value in prop['items'].items() if key != "$ref"}
+                prop = {**prop, 'items': self.compile_ref(array_ref), **old_prop}
+
+            obj_ref = prop_refs(prop)[0]
+            if obj_ref:
+                old_prop = {key: value for key, value in prop.items() if key != "$ref"}
+                prop = {**self.compile_ref(obj_ref), **old_prop}
+
+            properties[field] = prop
+        return {**schema, 'properties': properties}
 
 
 def compile_schema(schema, schemas):
-    for field, prop in list(schema['properties'].items()):
-        array_ref = prop.get('items', {}).get("$ref")
-        if array_ref:
-            prop['items'].pop("$ref")
-            old_prop = prop['items'].copy()
-            prop['items'] = compile_schema(copy.deepcopy(schemas[array_ref]), schemas)
-            prop.update(old_prop)
-
-        obj_ref = prop.get("$ref")
-        if obj_ref:
-            prop.pop("$ref")
-            old_prop = prop.copy()
-            prop.clear()
-            prop.update(compile_schema(copy.deepcopy(schemas[obj_ref]), schemas))
-            prop.update(old_prop)
-    return schema
-
-
-def remove_one_to_many(properties):
-    for key, value in list(properties.items()):
+    return SchemaCompiler(schemas).compile(schema)
+
+
+def without_one_to_many(properties):
+    """properties without arrays at any depth, sharing everything that does not lead to one."""
+    result = {}
+    changed = False
+    for key, value in properties.items():
         if value.get("type") == "array" and "items" in value:
-            properties.pop(key)
+            changed = True
+            continue
         if value.get("type") == "object" and "properties" in value:
-            remove_one_to_many(value["properties"])
+            pruned = without_one_to_many(value["properties"])
+            if pruned is not value["properties"]:
+                value = {**value, "properties": pruned}
+                changed = True
+        result[key] = value
+    return result if changed else properties
+
 
+def compile_to_openapi30(schemas, docs_dir, manifest=None):
+    schema_set = SchemaSet.load(schemas)
+    manifest = manifest or BuildManifest()
 
-def compile_to_openapi30(schemas_path, docs_dir):
-    open_api_data = json.loads((schemas_path / 'openapi.json').read_text())
+    key = manifest.key('compile_to_openapi30', schema_set.fingerprint(['openapi.json']))
+    if manifest.fresh(docs_dir / 'extras' / 'openapi30.json', key):
+        return
+
+    open_api_data = copy_json(schema_set.openapi)
     open_api_data['openapi'] = "3.0.0"
     open_api_data.pop('jsonSchemaDialect')
 
@@ -464,139 +1498,2300 @@ For further info please see:
           "url": "https://creativecommons.org/licenses/by/4.0/"
         }
       }
-    (docs_dir / 'extras' / 'openapi30.json').write_text(json.dumps(open_api_data, indent=2))
+    manifest.write(docs_dir / 'extras' / 'openapi30.json', dumps_json(open_api_data), key)
+
+
 
+def build_options(jobs=None, jobs_help='Number of build stages run at once.'):
+    """The --force, --jobs and --compact options of commands that build outputs, only --compact if jobs is None."""
+    options = [click.option('--compact', is_flag=True, default=False, help='Write minified compiled schemas.')]
+    if jobs is not None:
+        options[:0] = [
+            click.option('--force', is_flag=True, default=False,
+                         help='Rebuild every output, even if its inputs are unchanged.'),
+            click.option('--jobs', default=jobs, show_default=True, help=jobs_help),
+        ]
+
+    def decorator(command):
+        for option in reversed(options):
+            command = option(command)
+        return command
+    return decorator
 
 
 @cli.command()
 @click.argument('schemas')
 @click.argument('output_dir')
-def compile_schemas(schemas, output_dir):
-    _compile_schemas(schemas, output_dir)
+@build_options()
+def compile_schemas(schemas, output_dir, compact):
+    _compile_schemas(schemas, output_dir, compact=compact)
+
+def entity_schema(schemas, entity):
+    """Schema of one of the entities the API returns, from filename -> schema, which is not changed."""
+    if entity == 'organization':
+        organization = schemas['organization.json']
+
+        return {**organization, 'properties': {
+            **organization['properties'],
+            'services': {"type": "array", "items": {"$ref": "service.json"}},
+        }}
+
+    if entity == 'service_at_location':
+        service_at_location = schemas['service_at_location.json']
+
+        return {**service_at_location, 'properties': {
+            **service_at_location['properties'],
+            'service': {"name": "service", "$ref": "service.json"},
+        }}
+
+    return schemas[f'{entity}.json']
+
+
+def entity_overlay(schemas, entity):
+    """Schema of one of the entities the API returns, and the filename -> schema its $refs resolve in."""
+    if entity != 'service_at_location':
+        return entity_schema(schemas, entity), schemas
+
+    service, service_at_location = schemas['service.json'], schemas['service_at_location.json']
+    root = {**service_at_location, 'properties': {
+        **service_at_location['properties'],
+        'service': {"name": "service", "$ref": "service_at_location_service.json"},
+    }}
+    return root, {**schemas, 'service_at_location_service.json': {**service, 'properties': {
+        key: value for key, value in service['properties'].items() if key != 'service_at_locations'
+    }}}
+
+
+def compile_entity(compiler, entity):
+    """Fully compiled schema for one of the entities the API returns."""
+    if entity not in ('organization', 'service_at_location'):
+        return compiler.compile_ref(f'{entity}.json')
+
+    root, schemas = entity_overlay(compiler.schemas, entity)
+    return compiler.extended(schemas).compile(root)
+
+
+def definitions_entity(schemas, entity, variant=''):
+    """Compiled schema of entity for variant '', '_package' or '_list', with each schema it refers to once in $defs."""
+    list_variant = variant == '_list'
+    defs = {}
+
+    def definition(name, schema):
+        if name not in defs:
+            defs[name] = None
+            defs[name] = {
+                key: value for key, value in rewrite(schema).items() if key not in ('$id', '$schema')
+            }
+        return f'#/$defs/{name}'
+
+    def rewrite(schema):
+        properties = {}
+        for field, prop in schema['properties'].items():
+            if list_variant and prop.get("type") == "array" and "items" in prop:
+                continue
+            obj_ref, array_ref = prop_refs(prop)
+            if array_ref:
+                prop = {**prop, 'items': {**prop['items'], '$ref': definition(array_ref[:-5], schemas[array_ref])}}
+            if obj_ref:
+                prop = {**prop, '$ref': definition(obj_ref[:-5], schemas[obj_ref])}
+            properties[field] = prop
+        return {**schema, 'properties': properties}
+
+    root, schemas = entity_overlay(schemas, entity)
+    output = rewrite(root)
+
+    if variant == '_package':
+        # $defs are on the array, so the items must not be a resource of their own with a $id of its own
+        package = {key: output.pop(key) for key in ('$schema',) if key in output}
+        output.pop('$id', None)
+        return {**package, "type": "array", "items": output, "$defs": defs}
+    return {**output, "$defs": defs}
 
-def _compile_schemas(schema_dir, output_dir):
-    os.makedirs(output_dir, exist_ok=True)
+
+def _compile_schemas(schema_dir, output_dir, manifest=None, compact=False):
+    """Write the compiled schemas of each entity, inlined and with $defs, minified if compact."""
     output_path = pathlib.Path(output_dir)
-    schemas_path = pathlib.Path(schema_dir)
+    schema_set = SchemaSet.load(schema_dir)
+    manifest = manifest or BuildManifest()
 
-    compile_definitions(schemas_path, output_path)
+    compile_definitions(schema_set, output_path, manifest, compact)
     #add_descriptions(schemas_path)
 
-    schemas = {}
-    for json_schema in schemas_path.glob("*.json"):
-        if str(json_schema).endswith('openapi.json'):
+    compiler = schema_set.compiler
+
+    for entity in ('service', 'organization', 'service_at_location'):
+        variants = ('', '_package', '_list')
+        outputs = [output_path / f'{entity}{variant}.json' for variant in variants]
+        outputs += [output_path / f'{entity}{variant}_defs.json' for variant in variants]
+        key = manifest.key('compile_schema', entity, str(compact),
+                           schema_set.fingerprint(entity_inputs(schema_set, entity)))
+        if all(manifest.fresh(output, key) for output in outputs):
             continue
-        schema = json.loads(json_schema.read_text())
-        schemas[json_schema.name] = schema
 
-    # service
+        with trace(str(output_path / f'{entity}.json'), 'output'):
+            output = compile_entity(compiler, entity)
+            manifest.write(output_path / f'{entity}.json', dumps_json(output, compact), key)
 
-    output = compile_schema(copy.deepcopy(schemas['service.json']), schemas)
-    (output_path / 'service.json').write_text(json.dumps(output, indent=2))
+        with trace(str(output_path / f'{entity}_package.json'), 'output'):
+            package = {
+                "type": "array", "items": output
+            }
 
-    package = {
-        "type": "array", "items": output
-    }
+            manifest.write(output_path / f'{entity}_package.json', dumps_json(package, compact), key)
 
-    (output_path / 'service_package.json').write_text(json.dumps(package, indent=2))
+        with trace(str(output_path / f'{entity}_list.json'), 'output'):
+            output = {**output, 'properties': without_one_to_many(output['properties'])}
+            manifest.write(output_path / f'{entity}_list.json', dumps_json(output, compact), key)
 
-    remove_one_to_many(output['properties'])
-    (output_path / 'service_list.json').write_text(json.dumps(output, indent=2))
+        for variant in variants:
+            with trace(str(output_path / f'{entity}{variant}_defs.json'), 'output'):
+                defs = definitions_entity(schema_set.by_filename, entity, variant)
+                manifest.write(output_path / f'{entity}{variant}_defs.json', dumps_json(defs, compact), key)
 
-    # organization
 
-    organization = copy.deepcopy(schemas['organization.json'])
+def import_optional(name, extra):
+    """Import an optional dependency, with a helpful error if it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        raise click.ClickException(
+            f'{name} is needed for this command, install it with: pip install "hsds_schema_tools[{extra}]"'
+        )
 
-    organization['properties']['services'] = {
-        "type": "array", "items": {"$ref": "service.json"}
-    }
 
-    output = compile_schema(organization, schemas)
+def batched(iterable, size):
+    """Lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-    (output_path / 'organization.json').write_text(json.dumps(output, indent=2))
 
-    package = {
-        "type": "array", "items": output
-    }
+# what the functions run by ordered_map need, such as the validator of validate, made once in each process
+_worker_objects = {}
 
-    (output_path / 'organization_package.json').write_text(json.dumps(package, indent=2))
 
-    remove_one_to_many(output['properties'])
-    (output_path / 'organization_list.json').write_text(json.dumps(output, indent=2))
+def _init_worker(name, make, *args):
+    _worker_objects[name] = make(*args)
 
-    # service at location
 
-    service_at_location = copy.deepcopy(schemas['service_at_location.json'])
+def ordered_map(function, tasks, jobs=1, initializer=None, initargs=()):
+    """Yield function(*task) for each of tasks in order, across a pool of jobs processes if jobs is more than one."""
+    if jobs <= 1:
+        if initializer:
+            initializer(*initargs)
+        for task in tasks:
+            yield function(*task)
+        return
 
-    service_at_location['properties']['service'] = {
-        "name": "service",
-        "$ref": "service.json"
-    }
-    
-    output = compile_schema(service_at_location, schemas)
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=initializer, initargs=initargs
+    ) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(function, *task))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_compiled_schema(schema, compiled_dir='schema/compiled'):
+    """A compiled schema from its path or its name in compiled_dir, the items of a _package schema."""
+    path = pathlib.Path(schema)
+    if not path.is_file():
+        path = pathlib.Path(compiled_dir) / f'{schema}.json'
+    if not path.is_file():
+        raise click.ClickException(f'No compiled schema {schema}, give a path or a name from {compiled_dir}')
+
+    compiled = json.loads(path.read_text())
+    if compiled.get('type') == 'array' and 'items' in compiled:
+        items = compiled['items']
+        if '$defs' in compiled:
+            # the $refs of the items point at the $defs of the array
+            dialect = {'$schema': compiled['$schema']} if '$schema' in compiled else {}
+            items = {**dialect, **items, '$defs': compiled['$defs']}
+        compiled = items
+    return compiled
+
+
+def iter_records(f, data_format='auto'):
+    """Yield records from a binary file of a json array, of newline delimited json or of json objects."""
+    if data_format == 'auto':
+        if not hasattr(f, 'peek'):
+            f = io.BufferedReader(f)
+        head = f.peek(1 << 16).lstrip()
+        if head[:1] == b'[':
+            data_format = 'array'
+        else:
+            try:
+                json.loads(head.split(b'\n', 1)[0] or b'null')
+                data_format = 'ndjson'
+            except ValueError:
+                # a pretty printed object, such as an example
+                data_format = 'objects'
+
+    if data_format == 'ndjson':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+        return
 
-    output['properties']['service']['properties'].pop('service_at_locations')
+    ijson = import_optional('ijson', 'validate')
+    if data_format == 'objects':
+        yield from ijson.items(f, '', multiple_values=True, use_float=True)
+    else:
+        yield from ijson.items(f, 'item', use_float=True)
 
-    (output_path / 'service_at_location.json').write_text(json.dumps(output, indent=2))
 
-    package = {
-        "type": "array", "items": output
-    }
+RECORDS_FORMAT_HELP = ('A json array or newline delimited json, found from the data by default, '
+                       'which also reads pretty printed json objects.')
+
+
+def make_validator(schema):
+    """A jsonschema validator for a compiled schema, or the module for the path of a generated validator."""
+    if isinstance(schema, str):
+        return GeneratedValidator(schema)
+    jsonschema = import_optional('jsonschema', 'validate')
+    validator_class = jsonschema.validators.validator_for(schema, default=jsonschema.Draft202012Validator)
+    return validator_class(schema, format_checker=validator_class.FORMAT_CHECKER)
+
+
+def _validate_batch(batch):
+    validator = _worker_objects['validator']
+    errors = []
+    for index, record in batch:
+        for error in validator.iter_errors(record):
+            errors.append({
+                "record": index,
+                "id": record.get('id') if isinstance(record, dict) else None,
+                "path": '/' + '/'.join(str(part) for part in error.absolute_path),
+                "validator": error.validator,
+                "message": error.message,
+            })
+    return errors
+
+
+def validate_records(schema, records, jobs=1, batch_size=500):
+    """Yield an error dict for each problem found in records, in record order."""
+    batches = ((batch,) for batch in batched(enumerate(records), batch_size))
+    for errors in ordered_map(_validate_batch, batches, jobs, _init_worker, ('validator', make_validator, schema)):
+        yield from errors
+
+
+@cli.command()
+@click.argument('schema')
+@click.argument('data', type=click.File('rb'), default='-')
+@click.option('--format', 'data_format', type=click.Choice(['auto', 'array', 'ndjson']), default='auto',
+              help=RECORDS_FORMAT_HELP)
+@click.option('--compiled-dir', default='schema/compiled', show_default=True, type=click.Path(file_okay=False))
+@click.option('--jobs', default=1, show_default=True, help='Number of processes checking records.')
+@click.option('--batch-size', default=500, show_default=True, help='Records sent to a process at a time.')
+@click.option('--output', type=click.File('w'), default='-', help='Where errors are written.')
+def validate(schema, data, data_format, compiled_dir, jobs, batch_size, output):
+    """Check HSDS data against a compiled SCHEMA, or a module written by generate-validator."""
+    if schema.endswith('.py'):
+        compiled = schema
+    else:
+        compiled = load_compiled_schema(schema, compiled_dir)
+
+    counts = collections.Counter()
+
+    def counted(records):
+        for record in records:
+            counts['records'] += 1
+            yield record
+
+    records = counted(iter_records(data, data_format))
+    for error in validate_records(compiled, records, jobs=jobs, batch_size=batch_size):
+        counts['errors'] += 1
+        output.write(json.dumps(error) + '\n')
+
+    click.echo(f"{counts['records']} records, {counts['errors']} errors", err=True)
+    if counts['errors']:
+        sys.exit(1)
+
+
+VALIDATOR_HELPERS = '''
+_DATE = re.compile(r"^\\d{4}-\\d{2}-\\d{2}$", re.ASCII)
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+        return all(value[position] == "-" for position in (8, 13, 18, 23))
+    except (ValueError, IndexError):
+        return False
+
+
+def _is_date(value):
+    try:
+        return bool(_DATE.fullmatch(value) and datetime.date.fromisoformat(value))
+    except ValueError:
+        return False
+
+
+def _is_email(value):
+    return "@" in value
+
+
+def _is_ipv4(value):
+    try:
+        return bool(ipaddress.IPv4Address(value))
+    except ValueError:
+        return False
+
+
+def _is_ipv6(value):
+    try:
+        return not getattr(ipaddress.IPv6Address(value), "scope_id", "")
+    except ValueError:
+        return False
+
+
+def _is_regex(value):
+    try:
+        return bool(re.compile(value))
+    except re.error:
+        return False
+
+
+def _equal(one, two):
+    if isinstance(one, bool) or isinstance(two, bool):
+        return type(one) is type(two) and one == two
+    if isinstance(one, (list, dict)) or isinstance(two, (list, dict)):
+        return json.dumps(one, sort_keys=True) == json.dumps(two, sort_keys=True)
+    return one == two
+
+
+def _no_errors(value):
+    return []
+
+
+def _prefixed(key, found):
+    return [((key,) + path, keyword, message) for path, keyword, message in found]
+'''
+
+# formats checked the same way jsonschema's format checker does without optional extras
+VALIDATOR_FORMATS = {
+    'uuid': '_is_uuid', 'date': '_is_date', 'email': '_is_email', 'idn-email': '_is_email',
+    'ipv4': '_is_ipv4', 'ipv6': '_is_ipv6', 'regex': '_is_regex',
+}
+
+VALIDATOR_TYPES = {
+    'string': 'isinstance({v}, str)',
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, (int, float)) and not isinstance({v}, bool))',
+    'integer': '((isinstance({v}, int) and not isinstance({v}, bool)) or (isinstance({v}, float) and {v}.is_integer()))',
+}
+
+# keywords that change what is valid, which generate-validator cannot check
+UNSUPPORTED_KEYWORDS = {
+    'allOf', 'anyOf', 'oneOf', 'not', 'if', 'then', 'else', 'dependentRequired', 'dependentSchemas',
+    'patternProperties', 'prefixItems', 'contains', 'minContains', 'maxContains', 'uniqueItems', 'multipleOf',
+    'propertyNames', 'minProperties', 'maxProperties', 'unevaluatedProperties', 'unevaluatedItems',
+    '$dynamicRef', 'dependencies', 'additionalItems',
+}
+
+
+def set_literal(values):
+    """Source of a set of strings in sorted order, so generated code is the same on every run."""
+    values = sorted(set(values))
+    return '{' + ', '.join(repr(value) for value in values) + '}' if values else '()'
+
+
+def validation_keywords(schema):
+    """schema without the annotations that do not change what is valid, so alike subschemas can share a check."""
+    if not isinstance(schema, dict):
+        return schema
+    kept = {}
+    for keyword, value in schema.items():
+        if keyword in ('title', 'description', '$comment', 'examples', 'default', 'readOnly', 'writeOnly'):
+            continue
+        if keyword in ('properties', '$defs', 'definitions'):
+            value = {name: validation_keywords(prop) for name, prop in value.items()}
+        elif isinstance(value, dict):
+            value = validation_keywords(value)
+        kept[keyword] = value
+    return kept
+
+
+class ValidatorGenerator:
+    """Writes the source of a Python module finding the errors jsonschema finds in records against a schema."""
+
+    def __init__(self, root):
+        self.root = root
+        self.functions = {}
+        self.refs = {}
+        self.sources = []
+
+    def generate(self):
+        entry = self.function(self.root)
+        digest = json_digest(self.root)
+        return '\n'.join([
+            f'"""Checks records against {self.root.get("title") or self.root.get("name") or "a schema"}.',
+            '',
+            f'Made by `hsds_schema.py generate-validator` from a schema with sha256 {digest}, do not edit.',
+            '"""',
+            '',
+            'import datetime',
+            'import ipaddress',
+            'import json',
+            'import re',
+            'import uuid',
+            '',
+            f'SCHEMA_DIGEST = {digest!r}',
+            VALIDATOR_HELPERS,
+            *self.sources,
+            '',
+            'def errors(record):',
+            '    """(path, keyword, message) for each problem with record, path being a tuple of keys and indexes."""',
+            f'    return {entry}(record)',
+            '',
+            '',
+            'def is_valid(record):',
+            f'    return not {entry}(record)',
+            '',
+        ])
+
+    def function(self, schema):
+        """Name of the function checking schema, made if this is the first schema like it."""
+        if schema is True or schema == {}:
+            return '_no_errors'
+        key = json.dumps(validation_keywords(schema), sort_keys=True)
+        if key in self.functions:
+            return self.functions[key]
+        name = f'_check_{len(self.functions)}'
+        self.functions[key] = name
+
+        lines = [f'def {name}(value):', '    errors = []']
+        lines += self.checks(schema, 'value', '()', 1)
+        lines += ['    return errors', '', '']
+        self.sources.append('\n'.join(lines))
+        return name
+
+    def ref(self, pointer):
+        if pointer in self.refs:
+            return self.refs[pointer]
+        if not pointer.startswith('#'):
+            raise click.ClickException(f'generate-validator only follows refs within the schema, not {pointer}')
+        target = self.root
+        for part in pointer[1:].split('/')[1:]:
+            target = target[part.replace('~1', '/').replace('~0', '~')]
+        # named before it is made, so schemas that refer to themselves work
+        name = f'_ref_{len(self.refs)}'
+        self.refs[pointer] = name
+        self.sources.append(f'def {name}(value):\n    return {self.function(target)}(value)\n\n')
+        return name
+
+    def is_simple(self, schema):
+        return isinstance(schema, dict) and not ({'properties', 'items', '$ref', 'additionalProperties'} & schema.keys())
+
+    def checks(self, schema, v, path, depth):
+        """Lines checking the value in variable v, adding errors at the path expression."""
+        if schema is False:
+            return [f'{"    " * depth}errors.append(({path}, "False", "False schema does not allow " + repr({v})))']
+
+        unsupported = UNSUPPORTED_KEYWORDS & schema.keys()
+        if unsupported:
+            raise click.ClickException(f'generate-validator does not support: {", ".join(sorted(unsupported))}')
+
+        pad = '    ' * depth
+        lines = []
+
+        def error(keyword, message, indent=1):
+            return f'{pad}{"    " * indent}errors.append(({path}, {keyword!r}, {message}))'
+
+        for keyword, value in schema.items():
+            if keyword == 'type':
+                types = value if isinstance(value, list) else [value]
+                test = ' or '.join(VALIDATOR_TYPES[type_name].format(v=v) for type_name in types)
+                reprs = ', '.join(repr(type_name) for type_name in types)
+                lines += [f'{pad}if not ({test}):', error('type', f'repr({v}) + {" is not of type " + reprs!r}')]
+            elif keyword == 'enum':
+                if all(isinstance(each, str) for each in value):
+                    test = f'not (isinstance({v}, str) and {v} in {set_literal(value)})'
+                else:
+                    test = f'not any(_equal(each, {v}) for each in {value!r})'
+                lines += [f'{pad}if {test}:', error('enum', f'repr({v}) + {" is not one of " + repr(value)!r}')]
+            elif keyword == 'const':
+                lines += [f'{pad}if not _equal({v}, {value!r}):', error('const', repr(f'{value!r} was expected'))]
+            elif keyword == 'format' and value in VALIDATOR_FORMATS:
+                lines += [f'{pad}if isinstance({v}, str) and not {VALIDATOR_FORMATS[value]}({v}):',
+                          error('format', f'repr({v}) + {" is not a " + repr(value)!r}')]
+            elif keyword in ('minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum'):
+                operator, words = {
+                    'minimum': ('<', 'is less than the minimum of'),
+                    'maximum': ('>', 'is greater than the maximum of'),
+                    'exclusiveMinimum': ('<=', 'is less than or equal to the minimum of'),
+                    'exclusiveMaximum': ('>=', 'is greater than or equal to the maximum of'),
+                }[keyword]
+                lines += [f'{pad}if {VALIDATOR_TYPES["number"].format(v=v)} and {v} {operator} {value!r}:',
+                          error(keyword, f'repr({v}) + {f" {words} {value!r}"!r}')]
+            elif keyword in ('minLength', 'maxLength', 'minItems', 'maxItems'):
+                kind = 'str' if keyword.endswith('Length') else 'list'
+                if keyword.startswith('min'):
+                    operator, words = '<', 'should be non-empty' if value == 1 else 'is too short'
+                else:
+                    operator, words = '>', 'is expected to be empty' if value == 0 else 'is too long'
+                lines += [f'{pad}if isinstance({v}, {kind}) and len({v}) {operator} {value!r}:',
+                          error(keyword, f'repr({v}) + {" " + words!r}')]
+            elif keyword == 'pattern':
+                lines += [f'{pad}if isinstance({v}, str) and not re.search({value!r}, {v}):',
+                          error('pattern', f'repr({v}) + {f" does not match {value!r}"!r}')]
+            elif keyword == 'required' and value:
+                lines.append(f'{pad}if isinstance({v}, dict):')
+                for field in value:
+                    lines += [f'{pad}    if {field!r} not in {v}:',
+                              error('required', repr(f'{field!r} is a required property'), 2)]
+            elif keyword == 'properties':
+                lines += self.properties(value, v, path, depth)
+            elif keyword == 'additionalProperties' and value is not True:
+                known = set_literal(schema.get('properties', {}))
+                lines += [f'{pad}if isinstance({v}, dict):',
+                          f'{pad}    extras = [key for key in {v} if key not in {known}]']
+                if value is False:
+                    lines += [
+                        f'{pad}    if extras:',
+                        f'{pad}        extras.sort(key=str)',
+                        f'{pad}        listed = ", ".join(repr(extra) for extra in extras)',
+                        f'{pad}        verb = "was" if len(extras) == 1 else "were"',
+                        error('additionalProperties',
+                              'f"Additional properties are not allowed ({listed} {verb} unexpected)"', 2),
+                    ]
+                else:
+                    lines += [f'{pad}    for extra in extras:',
+                              f'{pad}        errors.extend(_prefixed(extra, {self.function(value)}({v}[extra])))']
+            elif keyword == 'items' and value is not True:
+                if not isinstance(value, dict):
+                    raise click.ClickException('generate-validator only supports items given as one schema')
+                lines += [f'{pad}if isinstance({v}, list):',
+                          f'{pad}    check = {self.function(value)}',
+                          f'{pad}    for index, item in enumerate({v}):',
+                          f'{pad}        found = check(item)',
+                          f'{pad}        if found:',
+                          f'{pad}            errors.extend(_prefixed(index, found))']
+            elif keyword == '$ref':
+                lines += [f'{pad}errors.extend({self.ref(value)}({v}))']
+        return lines
+
+    def properties(self, properties, v, path, depth):
+        pad = '    ' * depth
+        lines = [f'{pad}if isinstance({v}, dict):']
+        for field, prop in properties.items():
+            if prop is True or prop == {}:
+                continue
+            if self.is_simple(prop):
+                checks = self.checks(prop, 'item', f'({field!r},)', depth + 2)
+                if checks:
+                    lines += [f'{pad}    if {field!r} in {v}:', f'{pad}        item = {v}[{field!r}]', *checks]
+                continue
+            lines += [f'{pad}    if {field!r} in {v}:',
+                      f'{pad}        found = {self.function(prop)}({v}[{field!r}])',
+                      f'{pad}        if found:',
+                      f'{pad}            errors.extend(_prefixed({field!r}, found))']
+        if len(lines) == 1:
+            return []
+        return lines
+
+
+TABULAR_TYPES = {
+    'integer': '_is_integer',
+    'number': '_is_number',
+    'boolean': '_is_boolean',
+    'date': '_is_date',
+    'datetime': '_is_datetime',
+}
+
+TABULAR_HELPERS = '''
+_DATE = re.compile(r"^\\d{4}-\\d{2}-\\d{2}$", re.ASCII)
+_INTEGER = re.compile(r"^[+-]?\\d+$", re.ASCII)
+
+
+def _is_integer(value):
+    return bool(_INTEGER.fullmatch(value))
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_boolean(value):
+    return value in ("true", "True", "TRUE", "1", "false", "False", "FALSE", "0")
+
+
+def _is_date(value):
+    try:
+        return bool(_DATE.fullmatch(value) and datetime.date.fromisoformat(value))
+    except ValueError:
+        return False
+
+
+def _is_datetime(value):
+    try:
+        return bool(datetime.datetime.fromisoformat(value))
+    except ValueError:
+        return False
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+        return all(value[position] == "-" for position in (8, 13, 18, 23))
+    except (ValueError, IndexError):
+        return False
+
+
+def _number(value):
+    return float(value)
+'''
+
+
+def generate_tabular_validator(datapackage):
+    """Source of a module checking csv rows, dicts of strings, against the field constraints of datapackage."""
+    digest = json_digest(datapackage)
+    sources = []
+    tables = {}
+
+    for resource in datapackage['resources']:
+        name = f"_check_{re.sub(r'[^0-9a-zA-Z_]', '_', resource['name'])}"
+        tables[resource['name']] = name
+        lines = [f'def {name}(row):', '    errors = []']
+        for field in resource['schema']['fields']:
+            field_name = field['name']
+            constraints = field.get('constraints', {})
+            field_type = field.get('type', 'string')
+
+            def error(keyword, message, indent=3):
+                return f'{"    " * indent}errors.append(({field_name!r}, {keyword!r}, {message}))'
+
+            checks = []
+            if field_type in TABULAR_TYPES:
+                checks += [f'        if not {TABULAR_TYPES[field_type]}(value):',
+                           error('type', f'repr(value) + {f" is not a {field_type}"!r}')]
+            if field.get('format') == 'uuid':
+                checks += ['        if not _is_uuid(value):', error('format', "repr(value) + \" is not a 'uuid'\"")]
+            if field.get('format') == 'email':
+                checks += ['        if "@" not in value:', error('format', "repr(value) + \" is not a 'email'\"")]
+            enum = constraints.get('enum')
+            if enum:
+                values = (str(each).lower() if isinstance(each, bool) else str(each) for each in enum)
+                checks += [f'        if value not in {set_literal(values)}:',
+                           error('enum', f'repr(value) + {" is not one of " + repr(enum)!r}')]
+            for keyword, operator in (('minimum', '<'), ('maximum', '>')):
+                if keyword in constraints and field_type in ('integer', 'number'):
+                    bound = constraints[keyword]
+                    checks += [f'        if {TABULAR_TYPES[field_type]}(value) and _number(value) {operator} {bound!r}:',
+                               error(keyword, f'repr(value) + {f" is out of the {keyword} of {bound!r}"!r}')]
+            for keyword, operator in (('minLength', '<'), ('maxLength', '>')):
+                if keyword in constraints:
+                    bound = constraints[keyword]
+                    checks += [f'        if len(value) {operator} {bound!r}:',
+                               error(keyword, f'repr(value) + {f" breaks {keyword} {bound!r}"!r}')]
+            if 'pattern' in constraints:
+                pattern = constraints['pattern']
+                checks += [f'        if not re.fullmatch({pattern!r}, value):',
+                           error('pattern', f'repr(value) + {f" does not match {pattern!r}"!r}')]
+
+            if constraints.get('required'):
+                lines += [f'    value = row.get({field_name!r})', '    if value is None or value == "":',
+                          error('required', repr(f'{field_name!r} is a required field'), 2)]
+                if checks:
+                    lines += ['    else:', *checks]
+            elif checks:
+                lines += [f'    value = row.get({field_name!r})', '    if value is not None and value != "":', *checks]
+        lines += ['    return errors', '', '']
+        sources.append('\n'.join(lines))
+
+    return '\n'.join([
+        '"""Checks csv rows against the field constraints of a datapackage.',
+        '',
+        f'Made by `hsds_schema.py generate-validator` from a datapackage with sha256 {digest}, do not edit.',
+        '"""',
+        '',
+        'import datetime',
+        'import re',
+        'import uuid',
+        '',
+        f'DATAPACKAGE_DIGEST = {digest!r}',
+        TABULAR_HELPERS,
+        *sources,
+        'TABLES = {',
+        *(f'    {table!r}: {name},' for table, name in tables.items()),
+        '}',
+        '',
+        '',
+        'def errors(table, row):',
+        '    """(field, keyword, message) for each problem with a row of table, a dict of csv strings."""',
+        '    return TABLES[table](row)',
+        '',
+    ])
+
+
+def load_generated_validator(path):
+    """Import a module written by generate-validator from its path."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(pathlib.Path(path).stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+GeneratedError = collections.namedtuple('GeneratedError', 'absolute_path validator message')
+
+
+class GeneratedValidator:
+    """A module from generate-validator, with the iter_errors of a jsonschema validator."""
+
+    def __init__(self, path):
+        self.module = load_generated_validator(path)
+
+    def iter_errors(self, record):
+        for path, keyword, message in self.module.errors(record):
+            yield GeneratedError(path, keyword, message)
+
 
-    (output_path / 'service_at_location_package.json').write_text(json.dumps(package, indent=2))
+@cli.command()
+@click.argument('schema')
+@click.argument('output', type=click.File('w'))
+@click.option('--compiled-dir', default='schema/compiled', show_default=True, type=click.Path(file_okay=False))
+def generate_validator(schema, output, compiled_dir):
+    """Write a Python module that checks records against a compiled SCHEMA, or rows against a datapackage.json."""
+    path = pathlib.Path(schema)
+    if path.is_file():
+        loaded = json.loads(path.read_text())
+        if 'resources' in loaded:
+            output.write(generate_tabular_validator(loaded))
+            return
+    output.write(ValidatorGenerator(load_compiled_schema(schema, compiled_dir)).generate())
+
+
+# columns linking rows of attribute and metadata, which can belong to any table, to their parent
+LINK_COLUMNS = {
+    'attribute': ('link_id', 'link_entity'),
+    'metadata': ('resource_id', 'resource_type'),
+}
+
+
+def csv_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def json_value(prop, value):
+    """A csv value as the type its schema property has."""
+    json_type = prop.get('type')
+    try:
+        if json_type == 'integer':
+            return int(value)
+        if json_type == 'number':
+            number = float(value)
+            return int(number) if number.is_integer() and '.' not in value else number
+    except ValueError:
+        return value
+    if json_type == 'boolean':
+        return value.lower() == 'true'
+    return value
+
+
+class TabularLayout:
+    """How nested HSDS records map onto the tables of the datapackage."""
+
+    def __init__(self, schemas):
+        # filename -> schema
+        self.schemas = schemas
+        self.resources = {resource['name']: resource for resource in datapackage_resources(SchemaSet(schemas))}
+        self.fields = {
+            name: [field['name'] for field in resource['schema']['fields']]
+            for name, resource in self.resources.items()
+        }
+
+    def flatten(self, schema, record, rows, parent_table=None, parent_id=None):
+        """Append a (table, row) to rows for record and everything nested in it."""
+        table = schema['name']
+        fields = self.fields.get(table, [])
+        row = {}
+
+        for field, prop in schema['properties'].items():
+            value = record.get(field)
+            if value is None:
+                continue
+            obj_ref, array_ref = prop_refs(prop)
+            if obj_ref:
+                if isinstance(value, dict):
+                    child = self.schemas[obj_ref]
+                    self.flatten(child, value, rows)
+                    fk = f"{child['name']}_id"
+                    if fk in fields and value.get('id') is not None and record.get(fk) is None:
+                        row[fk] = value['id']
+            elif array_ref:
+                if isinstance(value, list):
+                    for item in value:
+                        self.flatten(self.schemas[array_ref], item, rows, table, record.get('id'))
+            elif not isinstance(value, (dict, list)) and field in fields:
+                row[field] = csv_value(value)
+
+        if parent_id is not None:
+            id_column, table_column = LINK_COLUMNS.get(table, (f'{parent_table}_id', None))
+            if id_column in fields:
+                row.setdefault(id_column, parent_id)
+            if table_column in fields:
+                row.setdefault(table_column, parent_table)
+
+        rows.append((table, row))
+        return rows
+
+    def nest(self, schema, row, lookup):
+        """The nested record for a row, using lookup(table, column, value) to find related rows."""
+        table = schema['name']
+        record = {}
+
+        for field, prop in schema['properties'].items():
+            obj_ref, array_ref = prop_refs(prop)
+            if obj_ref:
+                child = self.schemas[obj_ref]
+                fk = row.get(f"{child['name']}_id")
+                if fk:
+                    for child_row in lookup(child['name'], 'id', fk):
+                        record[field] = self.nest(child, child_row, lookup)
+                        break
+            elif array_ref:
+                child = self.schemas[array_ref]
+                id_column = LINK_COLUMNS.get(child['name'], (f'{table}_id',))[0]
+                if id_column in self.fields.get(child['name'], []) and row.get('id'):
+                    items = [
+                        self.nest(child, child_row, lookup)
+                        for child_row in lookup(child['name'], id_column, row['id'])
+                    ]
+                    if items:
+                        record[field] = items
+            elif row.get(field) not in (None, ''):
+                record[field] = json_value(prop, row[field])
+
+        return record
+
+
+def _flatten_batch(entity, batch):
+    layout = _worker_objects['layout']
+    root = entity_schema(layout.schemas, entity)
+    rows = []
+    for record in batch:
+        layout.flatten(root, record, rows)
+    return rows
+
+
+class TableRows:
+    """The rows of each table in a sqlite database, where a repeated id fills in the columns its row is missing."""
+
+    def __init__(self, directory, fields, recent_size=1 << 16):
+        import sqlite3
+
+        # table -> column names
+        self.fields = fields
+        self.connection = sqlite3.connect(pathlib.Path(directory) / 'rows.sqlite', isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.upserts = {}
+        for table, columns in fields.items():
+            column_sql = ', '.join(f'"{column}"' for column in columns)
+            self.connection.execute(f'CREATE TABLE "{table}" ({column_sql}, UNIQUE (id))')
+            filled = ', '.join(f'"{column}" = coalesce("{column}", excluded."{column}")' for column in columns)
+            self.upserts[table] = (
+                f'INSERT INTO "{table}" VALUES ({", ".join("?" for _ in columns)}) '
+                f'ON CONFLICT (id) DO UPDATE SET {filled}'
+            )
+        self.connection.execute('BEGIN')
+        # (table, id) -> columns of the rows added last, as objects such as organizations repeat in nearby records
+        self.recent = collections.OrderedDict()
+        self.recent_size = recent_size
+
+    def add(self, table, row):
+        key = (table, row.get('id'))
+        columns = self.recent.get(key)
+        if columns is not None and columns.issuperset(row):
+            self.recent.move_to_end(key)
+            return
+
+        self.connection.execute(self.upserts[table], [row.get(column) for column in self.fields[table]])
+        if key[1] is None:
+            return
+        self.recent[key] = columns | row.keys() if columns else set(row)
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+
+    def rows(self, table):
+        """The rows of table, in the order they were first added."""
+        return self.connection.execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+
+    def close(self):
+        self.connection.close()
+
+
+def data_to_csv(schemas, records, entity, output_dir, jobs=1, batch_size=500):
+    """Write nested entity records to one csv per datapackage table in output_dir, returns the rows of each."""
+    schema_set = SchemaSet.load(schemas)
+    layout = TabularLayout(schema_set.by_filename)
+
+    output_path = pathlib.Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    counts = collections.Counter()
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        table_rows = TableRows(tmpdirname, layout.fields)
+        try:
+            batches = ((entity, batch) for batch in batched(records, batch_size))
+            for rows in ordered_map(_flatten_batch, batches, jobs, _init_worker,
+                                    ('layout', TabularLayout, schema_set.by_filename)):
+                for table, row in rows:
+                    if table in layout.resources:
+                        table_rows.add(table, row)
+
+            for name, resource in layout.resources.items():
+                with open(output_path / resource['path'], 'w', newline='', buffering=1 << 20) as f:
+                    writer = csv.writer(f)
+                    writer.writerow(layout.fields[name])
+                    for row in table_rows.rows(name):
+                        writer.writerow(row)
+                        counts[name] += 1
+        finally:
+            table_rows.close()
+
+    return counts
+
+
+def csv_to_records(schemas, entity, csv_dir):
+    """Yield nested entity records from the per table csvs in csv_dir, joined in a temporary sqlite database."""
+    import sqlite3
+
+    schema_set = SchemaSet.load(schemas)
+    layout = TabularLayout(schema_set.by_filename)
+    csv_path = pathlib.Path(csv_dir)
+    root = entity_schema(layout.schemas, entity)
 
-    remove_one_to_many(output['properties'])
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        connection = sqlite3.connect(pathlib.Path(tmpdirname) / 'index.sqlite')
+        connection.row_factory = sqlite3.Row
+        columns = {}
 
-    (output_path / 'service_at_location_list.json').write_text(json.dumps(output, indent=2))
+        for name, resource in layout.resources.items():
+            path = csv_path / resource['path']
+            if not path.exists():
+                continue
+            with open(path, newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if not header:
+                    continue
+                columns[name] = set(header)
+                column_sql = ', '.join(f'"{column}"' for column in header)
+                connection.execute(f'CREATE TABLE "{name}" ({column_sql})')
+                placeholders = ', '.join('?' for _ in header)
+                connection.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})', reader)
+            for column in header:
+                if column == 'id' or column.endswith('_id'):
+                    connection.execute(f'CREATE INDEX "{name}__{column}" ON "{name}" ("{column}")')
+        connection.commit()
+
+        def lookup(table, column, value):
+            if column not in columns.get(table, ()):
+                return []
+            return [dict(row) for row in connection.execute(
+                f'SELECT * FROM "{table}" WHERE "{column}" = ?', (value,)
+            )]
+
+        if root['name'] in columns:
+            for row in connection.execute(f'SELECT * FROM "{root["name"]}"'):
+                yield layout.nest(root, dict(row), lookup)
+        connection.close()
+
+
+@cli.command('data-to-csv')
+@click.argument('schemas')
+@click.argument('entity')
+@click.argument('data', type=click.File('rb'))
+@click.argument('output_dir')
+@click.option('--format', 'data_format', type=click.Choice(['auto', 'array', 'ndjson']), default='auto',
+              help=RECORDS_FORMAT_HELP)
+@click.option('--jobs', default=1, show_default=True, help='Number of processes flattening records.')
+@click.option('--batch-size', default=500, show_default=True, help='Records sent to a process at a time.')
+def data_to_csv_command(schemas, entity, data, output_dir, data_format, jobs, batch_size):
+    """Convert nested ENTITY records, e.g. service, into a csv for each datapackage table."""
+    counts = data_to_csv(schemas, iter_records(data, data_format), entity, output_dir, jobs=jobs,
+                         batch_size=batch_size)
+    for table, count in sorted(counts.items()):
+        click.echo(f'{table}: {count} rows', err=True)
 
 
 @cli.command()
-def docs_all():
+@click.argument('schemas')
+@click.argument('entity')
+@click.argument('csv_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--format', 'data_format', type=click.Choice(['array', 'ndjson']), default='array')
+@click.option('--output', type=click.File('w'), default='-')
+def csv_to_data(schemas, entity, csv_dir, data_format, output):
+    """Convert a csv for each datapackage table back into nested ENTITY records."""
+    if data_format == 'array':
+        output.write('[')
+    for index, record in enumerate(csv_to_records(schemas, entity, csv_dir)):
+        if data_format == 'array':
+            output.write((',\n' if index else '\n') + json.dumps(record))
+        else:
+            output.write(json.dumps(record) + '\n')
+    if data_format == 'array':
+        output.write('\n]\n')
+
+
+def value_bounds(prop, scale, span):
+    """The lowest and highest whole numbers of 1/scale within the bounds of prop, span apart if one is missing."""
+    lows, highs = [], []
+    for key, bounds, whole in (('minimum', lows, math.ceil), ('exclusiveMinimum', lows, lambda x: math.floor(x) + 1),
+                               ('maximum', highs, math.floor), ('exclusiveMaximum', highs, lambda x: math.ceil(x) - 1)):
+        value = prop.get(key)
+        # draft 4 exclusive bounds are booleans rather than numbers
+        if value is not None and not isinstance(value, bool):
+            bounds.append(whole(round(value * scale, 9)))
+
+    low = max(lows) if lows else None
+    high = min(highs) if highs else None
+    if low is None:
+        low = 0 if high is None else high - span * scale
+    if high is None:
+        high = low + span * scale
+    return low, high
+
+
+class DataGenerator:
+    """Generates synthetic rows for every datapackage table, any row on its own, and nested records from them."""
+
+    def __init__(self, schemas, counts, seed=0):
+        schema_set = SchemaSet.load(schemas)
+        self.layout = TabularLayout(schema_set.by_filename)
+        self.seed = seed
+
+        largest = max(counts.values(), default=0)
+        self.counts = {name: counts.get(name, largest) for name in self.layout.resources}
+
+        # table -> the first 24 characters of its ids, a uuid's worth with the row number
+        self.id_prefixes = {}
+        for name in self.layout.resources:
+            digest = hashlib.md5(f'{seed}/{name}'.encode()).hexdigest()
+            self.id_prefixes[name] = f'{digest[:8]}-{digest[8:12]}-4{digest[13:16]}-a{digest[17:20]}-'
+        self.prefix_tables = {prefix: name for name, prefix in self.id_prefixes.items()}
+
+        self.properties = {schema['name']: schema['properties'] for schema in schema_set.by_name.values()}
+        self.required = {
+            schema['name']: set(schema.get('required', [])) | set(schema.get('tabular_required', []))
+            for schema in schema_set.by_name.values()
+        }
+
+        # table -> {fk column: referenced table}
+        self.foreign_keys = {}
+        for name, resource in self.layout.resources.items():
+            self.foreign_keys[name] = {
+                foreign_key['fields']: foreign_key['reference']['resource']
+                for foreign_key in resource['schema'].get('foreignKeys', [])
+                if foreign_key['fields'] in self.layout.fields[name] and self.counts.get(foreign_key['reference']['resource'])
+            }
+
+        # attribute and metadata rows are shared out between the tables that have them
+        self.owners = {}
+        for name in LINK_COLUMNS:
+            self.owners[name] = sorted(
+                schema_set.by_filename[ref.source]['name'] for ref in schema_set.ref_graph.referrers(f'{name}.json')
+                if ref.array and self.counts.get(schema_set.by_filename[ref.source]['name'])
+            )
+
+        # related rows such as organizations come up again and again in nested records
+        self.lookup = functools.lru_cache(maxsize=1 << 16)(self.lookup)
+
+    def id(self, table, index):
+        return self.id_prefixes[table] + f'{index:012x}'
+
+    def parse_id(self, value):
+        """(table, index) of a generated id, or (None, None)."""
+        table = self.prefix_tables.get(value[:-12]) if isinstance(value, str) and len(value) == 36 else None
+        if table is None:
+            return None, None
+        return table, int(value[-12:], 16)
+
+    def row(self, table, index):
+        """Row index of table, as the strings that would be in its csv."""
+        rng = random.Random(f'{self.seed}/{table}/{index}')
+        properties = self.properties[table]
+        required = self.required[table]
+        foreign_keys = self.foreign_keys[table]
+        link_id, link_table = LINK_COLUMNS.get(table, (None, None))
+        owners = self.owners.get(table)
+
+        row = {}
+        for field in self.layout.fields[table]:
+            if field == 'id':
+                row[field] = self.id(table, index)
+            elif field in foreign_keys:
+                foreign_table = foreign_keys[field]
+                row[field] = self.id(foreign_table, index % self.counts[foreign_table])
+            elif field in (link_id, link_table):
+                if owners:
+                    owner = owners[index % len(owners)]
+                    owner_index = (index // len(owners)) % self.counts[owner]
+                    row[field] = self.id(owner, owner_index) if field == link_id else owner
+            elif field in required or (not field.endswith('_id') and rng.random() < 0.8):
+                row[field] = self.value(properties.get(field, {}), table, field, index, rng)
+        return row
+
+    def value(self, prop, table, field, index, rng):
+        """A value for prop, keeping to its enum, format and bounds."""
+        enum = prop.get('enum')
+        if enum:
+            return csv_value(rng.choice(enum))
+
+        value_format = prop.get('format')
+        json_type = prop.get('type')
+
+        if value_format == 'uuid':
+            return '%08x-%04x-4%03x-a%03x-%012x' % tuple(rng.getrandbits(bits) for bits in (32, 16, 12, 12, 48))
+        if value_format == 'date':
+            return (datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(10000))).isoformat()
+        if value_format == 'date-time':
+            moment = datetime.datetime(2000, 1, 1) + datetime.timedelta(seconds=rng.randrange(10000 * 86400))
+            return moment.isoformat() + 'Z'
+        if value_format == 'email':
+            return f'{table}{index}@example.com'
+        if value_format in ('uri', 'url'):
+            return f'https://example.com/{table}/{index}'
+
+        if json_type == 'integer':
+            low, high = value_bounds(prop, 1, 100)
+            return str(rng.randint(low, max(low, high)))
+        if json_type == 'number':
+            # hundredths, so the value is the same once written out
+            low, high = value_bounds(prop, 100, 1000)
+            return str(rng.randint(low, max(low, high)) / 100)
+        if json_type == 'boolean':
+            return csv_value(rng.random() < 0.5)
+
+        example = prop.get('example')
+        if example:
+            return f'{example} {index}'
+        return f'{table} {field} {index}'
+
+    def children(self, table, column, parent_table, parent_index):
+        """Indexes of the rows of table whose column points at a parent row."""
+        count = self.counts[table]
+        if column in self.foreign_keys[table]:
+            if self.foreign_keys[table][column] != parent_table:
+                return range(0)
+            return range(parent_index, count, self.counts[parent_table])
+        if column == LINK_COLUMNS.get(table, (None,))[0]:
+            owners = self.owners[table]
+            if parent_table not in owners:
+                return range(0)
+            slot = owners.index(parent_table)
+            step = len(owners) * self.counts[parent_table]
+            return range(slot + len(owners) * parent_index, count, step)
+        return range(0)
+
+    def lookup(self, table, column, value):
+        """Rows of table with value in column, as used by TabularLayout.nest."""
+        value_table, index = self.parse_id(value)
+        if value_table is None:
+            return []
+        if column == 'id':
+            if value_table != table or index >= self.counts[table]:
+                return []
+            return [self.row(table, index)]
+        return [self.row(table, child) for child in self.children(table, column, value_table, index)]
+
+    def record(self, entity, index):
+        """Nested record index of entity, such as a service with its organization and locations."""
+        root = entity_schema(self.layout.schemas, entity)
+        return self.layout.nest(root, self.row(entity, index), self.lookup)
+
+
+def _generate_shard(name, shard, start, stop, output_dir, data_format):
+    generator = _worker_objects['generator']
+    output_path = pathlib.Path(output_dir) / name
+    output_path.mkdir(parents=True, exist_ok=True)
+    extension = 'json' if data_format == 'array' else data_format
+    path = output_path / f'{name}-{shard:05d}.{extension}'
+
+    with open(path, 'w', newline='', buffering=1 << 20) as f:
+        if data_format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=generator.layout.fields[name])
+            writer.writeheader()
+            for index in range(start, stop):
+                writer.writerow(generator.row(name, index))
+        elif data_format == 'ndjson':
+            for index in range(start, stop):
+                f.write(json.dumps(generator.record(name, index)) + '\n')
+        else:
+            f.write('[')
+            for index in range(start, stop):
+                f.write((',\n' if index > start else '\n') + json.dumps(generator.record(name, index)))
+            f.write('\n]\n')
+
+    return name, stop - start
+
+
+def generate_data(schemas, counts, output_dir, data_format='ndjson', seed=0, jobs=1, shard_size=100000):
+    """Write synthetic data to one file per shard of up to shard_size, returning the number written per table."""
+    schema_set = SchemaSet.load(schemas)
+    generator = DataGenerator(schema_set, counts, seed)
+
+    unknown = set(counts) - set(generator.counts)
+    if unknown:
+        raise click.ClickException(f'No table for: {", ".join(sorted(unknown))}')
+
+    names = generator.counts if data_format == 'csv' else counts
+    shards = []
+    for name in names:
+        count = generator.counts[name]
+        for shard, start in enumerate(range(0, count, shard_size)):
+            shards.append((name, shard, start, min(start + shard_size, count), output_dir, data_format))
+
+    totals = collections.Counter()
+    for name, count in ordered_map(_generate_shard, shards, jobs, _init_worker,
+                                   ('generator', DataGenerator, schema_set, counts, seed)):
+        totals[name] += count
+    return totals
+
+
+def parse_counts(values):
+    counts = {}
+    for value in values:
+        name, _, count = value.partition('=')
+        try:
+            counts[name] = int(count)
+        except ValueError:
+            raise click.ClickException(f'Counts are given as table=number, not: {value}')
+    return counts
+
+
+@cli.command('generate-data')
+@click.argument('schemas')
+@click.argument('output_dir')
+@click.option('--count', 'counts', multiple=True, required=True,
+              help='Number of rows of a table as table=number, e.g. service=1000000. Can be repeated.')
+@click.option('--format', 'data_format', type=click.Choice(['ndjson', 'array', 'csv']), default='ndjson',
+              help='Nested records as newline delimited json or json arrays, or a csv for every table.')
+@click.option('--seed', default=0, show_default=True, help='The same seed always gives the same data.')
+@click.option('--jobs', default=1, show_default=True, help='Number of processes writing shards.')
+@click.option('--shard-size', default=100000, show_default=True, help='Rows or records in each output file.')
+def generate_data_command(schemas, output_dir, counts, data_format, seed, jobs, shard_size):
+    """Generate synthetic HSDS data with consistent keys, for load testing."""
+    totals = generate_data(schemas, parse_counts(counts), output_dir, data_format, seed, jobs, shard_size)
+    for name, count in sorted(totals.items()):
+        click.echo(f'{name}: {count}', err=True)
+
+
+SQLITE_TYPES = {'integer': 'INTEGER', 'number': 'REAL', 'boolean': 'INTEGER'}
+
+# settings for loading a new database in one go, a crash part way through losing the file
+SQLITE_LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'locking_mode': 'EXCLUSIVE',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',
+}
+
+
+def load_resources(schemas):
+    """Datapackage resources from a datapackage.json, or made from a schema directory."""
+    path = pathlib.Path(schemas)
+    if path.is_file():
+        return json.loads(path.read_text())['resources']
+    return list(datapackage_resources(SchemaSet.load(schemas)))
+
+
+def sqlite_foreign_keys(resource):
+    """(column, referenced table) of each foreign key of a resource whose column is one of its fields."""
+    fields = {field['name'] for field in resource['schema']['fields']}
+    foreign_keys = []
+    for foreign_key in resource['schema'].get('foreignKeys', []):
+        column = foreign_key['fields'] if isinstance(foreign_key['fields'], str) else foreign_key['fields'][0]
+        if column in fields:
+            foreign_keys.append((column, foreign_key['reference']['resource']))
+    return foreign_keys
+
+
+def sqlite_table_order(resources):
+    """Resources with the tables they refer to first, in datapackage order otherwise or if there is a cycle."""
+    by_name = {resource['name']: resource for resource in resources}
+    graph = RefGraph.from_edges(by_name, [
+        (name, column, table) for name, resource in by_name.items() for column, table in sqlite_foreign_keys(resource)
+    ])
+    try:
+        return [by_name[name] for name in graph.topological_order]
+    except RefCycleError:
+        return list(by_name.values())
+
+
+def sqlite_ddl(resource):
+    """CREATE TABLE statement for a resource, with its types, constraints and keys."""
+    primary_key = resource['schema'].get('primaryKey')
+    columns = []
+    for field in resource['schema']['fields']:
+        column = f'"{field["name"]}" {SQLITE_TYPES.get(field.get("type"), "TEXT")}'
+        constraints = field.get('constraints', {})
+        if field['name'] == primary_key:
+            column += ' NOT NULL PRIMARY KEY'
+        else:
+            if constraints.get('required'):
+                column += ' NOT NULL'
+            if constraints.get('unique'):
+                column += ' UNIQUE'
+        columns.append(column)
+    for column, table in sqlite_foreign_keys(resource):
+        columns.append(f'FOREIGN KEY ("{column}") REFERENCES "{table}" ("id")')
+    return f'CREATE TABLE "{resource["name"]}" (\n    ' + ',\n    '.join(columns) + '\n)'
+
+
+def sqlite_indexes(resource):
+    """CREATE INDEX statements for the foreign key and link columns of a resource."""
+    fields = {field['name'] for field in resource['schema']['fields']}
+    columns = [column for column, _ in sqlite_foreign_keys(resource)]
+    link_column = LINK_COLUMNS.get(resource['name'], (None,))[0]
+    if link_column in fields:
+        columns.append(link_column)
+    name = resource['name']
+    return [f'CREATE INDEX "{name}__{column}" ON "{name}" ("{column}")' for column in dict.fromkeys(columns)]
+
+
+def table_csv_paths(csv_dir, resource):
+    """The csv of a resource in csv_dir, and any shards of it in a directory named after the table."""
+    csv_path = pathlib.Path(csv_dir)
+    paths = [csv_path / resource['path']] if (csv_path / resource['path']).is_file() else []
+    return paths + sorted((csv_path / resource['name']).glob('*.csv'))
+
+
+def csv_chunks(path, chunk_size):
+    """(start, end) byte ranges of path after its header, each ending at the end of a row."""
+    with open(path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        quotes = 0
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                return
+            quotes += block.count(b'"')
+            line = f.readline()
+            quotes += line.count(b'"')
+            while line and quotes % 2:
+                line = f.readline()
+                quotes += line.count(b'"')
+            end = f.tell()
+            yield start, end
+            start = end
+
+
+def csv_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _read_csv_chunk(path, start, end, width, columns):
+    """Rows of a byte range of a csv, as lists of the values at columns, or of every value if columns is None."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    rows = [row for row in csv.reader(io.StringIO(text, newline='')) if row]
+    if set(map(len, rows)) - {width}:
+        with open(path, 'rb') as f:
+            line = f.read(start).count(b'\n')
+        reader = csv.reader(io.StringIO(text, newline=''))
+        # the line a row starts on, as a quoted newline makes it end on a later one
+        row_line = line + 1
+        for row in reader:
+            if row and len(row) != width:
+                raise click.ClickException(f'{path}, line {row_line}: {len(row)} values where the header has {width}')
+            row_line = line + reader.line_num + 1
+    if columns is None:
+        return rows
+    return [[row[index] for index in columns] for row in rows]
+
+
+def load_sqlite(schemas, csv_dir, database, jobs=1, chunk_size=1 << 23):
+    """Load the per table csvs in csv_dir into a new sqlite database, returning the rows loaded per table."""
+    import sqlite3
+
+    if os.path.exists(database):
+        raise click.ClickException(f'{database} already exists, load-sqlite makes a new database')
+
+    resources = sqlite_table_order(load_resources(schemas))
+
+    tasks = []
+    for resource in resources:
+        types = {field['name']: field.get('type') for field in resource['schema']['fields']}
+        primary_key = resource['schema'].get('primaryKey')
+        for path in table_csv_paths(csv_dir, resource):
+            header = csv_header(path)
+            if primary_key and primary_key not in header:
+                raise click.ClickException(f'{path} has no {primary_key} column')
+            loaded = [column for column in header if column in types]
+            columns = None if loaded == header else [header.index(column) for column in loaded]
+            column_sql = ', '.join(f'"{column}"' for column in loaded)
+            # empty values become null, and booleans 1 or 0, in sqlite rather than for each row in Python
+            values_sql = ', '.join(
+                "NULLIF(lower(?), '') IN ('true', '1')" if types[column] == 'boolean' else "NULLIF(?, '')"
+                for column in loaded
+            )
+            statement = f'INSERT INTO "{resource["name"]}" ({column_sql}) VALUES ({values_sql})'
+            for start, end in csv_chunks(path, chunk_size):
+                tasks.append((resource['name'], statement, (path, start, end, len(header), columns)))
+
+    connection = sqlite3.connect(database, isolation_level=None)
+    for pragma, value in SQLITE_LOAD_PRAGMAS.items():
+        connection.execute(f'PRAGMA {pragma} = {value}')
+
+    counts = collections.Counter()
+    try:
+        connection.execute('BEGIN')
+        for resource in resources:
+            connection.execute(sqlite_ddl(resource))
+
+        chunks = ordered_map(_read_csv_chunk, (chunk for _, _, chunk in tasks), jobs)
+        for (table, statement, _), rows in zip(tasks, chunks):
+            connection.executemany(statement, rows)
+            counts[table] += len(rows)
+
+        for resource in resources:
+            for statement in sqlite_indexes(resource):
+                connection.execute(statement)
+        connection.execute('COMMIT')
+    except BaseException as e:
+        # whatever stopped the load, including a bad csv or ctrl-c, leaves no database behind
+        connection.close()
+        os.remove(database)
+        if isinstance(e, sqlite3.Error):
+            raise click.ClickException(f'Could not load {database}: {e}')
+        raise
+
+    connection.close()
+    return counts
+
+
+@cli.command('load-sqlite')
+@click.argument('schemas')
+@click.argument('csv_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('database')
+@click.option('--jobs', default=1, show_default=True, help='Number of processes parsing csvs.')
+@click.option('--chunk-size', default=8, show_default=True, help='Megabytes of csv parsed at a time.')
+def load_sqlite_command(schemas, csv_dir, database, jobs, chunk_size):
+    """Load a csv for each table into a new sqlite DATABASE, with tables made from the datapackage."""
+    start = time.perf_counter()
+    counts = load_sqlite(schemas, csv_dir, database, jobs=jobs, chunk_size=chunk_size << 20)
+    for table, count in sorted(counts.items()):
+        click.echo(f'{table}: {count} rows', err=True)
+    click.echo(f'{sum(counts.values())} rows in {time.perf_counter() - start:.1f}s', err=True)
+
+
+def build_manifest(force=False, path=BUILD_MANIFEST):
+    manifest = BuildManifest(path)
+    if force:
+        manifest.outputs.clear()
+    return manifest
+
+
+def write_datapackage(schema_set, manifest, path='datapackage.json'):
+    key = manifest.key('datapackage', schema_set.fingerprint(schema_set.by_filename))
+    manifest.build(pathlib.Path(path), key, lambda: _schemas_to_datapackage(schema_set))
+
+
+def _run_stage(stage, schema_set, manifest):
+    start = time.perf_counter()
+    before = dict(manifest.outputs)
+    stage(schema_set, manifest=manifest)
+    manifest.flush()
+    recorded = {output: key for output, key in manifest.outputs.items() if before.get(output) != key}
+    return recorded, time.perf_counter() - start
+
+
+def _run_traced_stage(name, stage, schema_set, manifest):
+    """_run_stage in a worker process, with the spans and origin of its BuildTrace."""
+    with traced_memory(), BuildTrace() as build_trace:
+        with trace(name, 'stage'):
+            result = _run_stage(stage, schema_set, manifest)
+    return result, build_trace.spans, build_trace.origin
+
+
+def run_stages(stages, schema_set, manifest, jobs=1):
+    """Run build stages, which only depend on the schemas, returning the seconds each took."""
+    timings = {}
+    if jobs <= 1:
+        for name, stage in stages.items():
+            with trace(name, 'stage'):
+                recorded, timings[name] = _run_stage(stage, schema_set, manifest)
+        return timings
+
+    import concurrent.futures
+
+    manifest.flush()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(stages))) as executor:
+        futures = {
+            name: executor.submit(_run_traced_stage, name, stage, schema_set, manifest) if _build_trace
+            else executor.submit(_run_stage, stage, schema_set, manifest)
+            for name, stage in stages.items()
+        }
+        for name, future in futures.items():
+            if _build_trace:
+                (recorded, timings[name]), spans, origin = future.result()
+                _build_trace.add_spans(spans, origin, name)
+            else:
+                recorded, timings[name] = future.result()
+            manifest.outputs.update(recorded)
+    return timings
+
+
+TRACE_HELP = ('Write the time, memory and io of each stage, output and http request to this json file, '
+              'and as Chrome trace events to the same name ending .chrome.json.')
+
+
+def docs_stages(docs_dir, example_dir, compiled_dir, datapackage_path='datapackage.json', compact=False):
+    return {
+        'openapi': functools.partial(compile_to_openapi30, docs_dir=docs_dir),
+        'datapackage': functools.partial(write_datapackage, path=datapackage_path),
+        'examples': functools.partial(_schemas_to_doc_examples, output=example_dir),
+        'compile': functools.partial(_compile_schemas, output_dir=compiled_dir, compact=compact),
+    }
+
+
+def profile_stages(example_dir, compiled_dir, datapackage_path='datapackage.json', compact=False):
+    """The docs-all stages but openapi, as profiles have no openapi docs of their own."""
+    stages = docs_stages(None, example_dir, compiled_dir, datapackage_path, compact)
+    stages.pop('openapi')
+    return stages
+
+
+@cli.command()
+@build_options(jobs=1)
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False), help=TRACE_HELP)
+def docs_all(force=False, jobs=1, compact=False, trace_path=None):
     schema_dir = pathlib.Path('schema') 
     docs_dir = pathlib.Path('docs') 
     example_dir = pathlib.Path('examples') 
     compiled_dir = schema_dir / 'compiled'
 
-    compile_to_openapi30(schema_dir, docs_dir)
-    #add_titles(schema_dir)
-    with open('datapackage.json', 'w+') as f: 
-        datapackage = _schemas_to_datapackage(schema_dir)
-        f.write(datapackage)
+    with trace_to(trace_path):
+        with trace('load', 'stage'):
+            schema_set = SchemaSet.from_dir(schema_dir)
+            schema_set.ref_graph.check_cycles()
+        manifest = build_manifest(force)
+
+        #add_titles(schema_dir)
+        run_stages(docs_stages(docs_dir, example_dir, compiled_dir, compact=compact), schema_set, manifest, jobs)
+        manifest.save()
+
+
+def core_spec_options(command):
+    """The options choosing the core spec a profile is merged with, shared by profile-all, profile-batch and watch."""
+    options = [
+        click.option('--branch', default='main', help='Branch of the profile repository.'),
+        click.option('--cache-dir', default=DEFAULT_CACHE_DIR, type=click.Path(file_okay=False),
+                     help='Where downloaded core schemas are cached.'),
+        click.option('--no-cache', is_flag=True, default=False, help='Always download core schemas in full.'),
+        click.option('--core', type=click.Path(exists=True),
+                     help='Local core spec to use instead of github, a checkout, schema directory or tarball.'),
+        click.option('--core-ref', default=CORE_REF, help='Branch or tag of the core spec on github.'),
+        click.option('--offline', is_flag=True, default=False,
+                     help='Only use core schemas already in the schema store.'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
 
-    _schemas_to_doc_examples(schema_dir, example_dir)
-    _compile_schemas(schema_dir, compiled_dir)
+def core_spec_manifest(cache_dir, no_cache, core, core_ref, offline):
+    """load_core_manifest with the core_spec_options given to a command."""
+    return load_core_manifest(core=core, core_ref=core_ref, cache_dir=cache_dir, offline=offline, no_cache=no_cache)
 
 
 @cli.command()
 @click.argument('profile_url')
-@click.option('--branch', default='main')
 @click.option('--clean', is_flag=True, default=False)
-def profile_all(profile_url, branch, clean=False):
-    schema_dir = pathlib.Path('schema')
+@core_spec_options
+@build_options(jobs=1)
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False), help=TRACE_HELP)
+def profile_all(profile_url, branch, clean=False, cache_dir=DEFAULT_CACHE_DIR, no_cache=False,
+                core=None, core_ref=CORE_REF, offline=False, force=False, jobs=1, compact=False, trace_path=None):
+    with trace_to(trace_path):
+        store, manifest = core_spec_manifest(cache_dir, no_cache, core, core_ref, offline)
+        build_profile(profile_url, 'profile', '.', store, manifest, branch=branch, core_ref=core_ref,
+                      clean=clean, force=force, jobs=jobs, compact=compact)
+
+
+def build_profile(profile_url, profile_dir, output_dir, store, core_manifest, branch='main', core_ref=CORE_REF,
+                  clean=False, force=False, jobs=1, compact=False):
+    """Merge a profile with the core spec in store and build its outputs in output_dir, returning stage timings."""
+    output_path = pathlib.Path(output_dir)
+    schema_dir = output_path / 'schema'
+    example_dir = output_path / 'examples'
+    compiled_dir = schema_dir / 'compiled'
+    timings = {}
+
+    start = time.perf_counter()
+    for directory in (schema_dir, example_dir, compiled_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+        if clean:
+            clean_dir(directory)
+
+    with trace('merge', 'stage'):
+        profile_to_schema(profile_url, branch, profile_dir=profile_dir, schema_dir=schema_dir,
+                          core_ref=core_ref, store=store, core_manifest=core_manifest)
+    timings['merge'] = time.perf_counter() - start
+
+    schema_set = SchemaSet.from_dir(schema_dir)
+    schema_set.ref_graph.check_cycles()
+    manifest = build_manifest(force, output_path / BUILD_MANIFEST)
+    stages = profile_stages(example_dir, compiled_dir, output_path / 'datapackage.json', compact)
+    timings.update(run_stages(stages, schema_set, manifest, jobs))
+    manifest.save()
+
+    return timings
+
+
+class MemoryOutputs(BuildManifest):
+    """A build manifest that keeps each output's text in texts, path -> text, instead of writing it."""
+
+    # keys are never compared, so there is no need to read this file to make them
+    tool_digest = ''
+
+    def __init__(self):
+        super().__init__()
+        self.texts = {}
+
+    def write(self, output, text, key):
+        self.texts[str(output)] = text
+        self.record(output, key)
+
+    def flush(self):
+        pass
+
+    def save(self):
+        pass
+
+
+def json_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactBuilder:
+    """Builds every output of docs-all or profile-all in memory, with an LRU cache of builds."""
+
+    def __init__(self, core, cache_size=128, core_ref=CORE_REF):
+        self.core = core
+        self.core_ref = core_ref
+        self.core_digest = json_digest(core)
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, profile, profile_url, branch, compact):
+        return json_digest([self.core_digest, profile, profile_url, branch, compact])
+
+    def build(self, profile=None, profile_url=None, branch='main', compact=False):
+        """Outputs of the core spec as docs-all builds them, or of profile (filename -> schema) as profile-all does."""
+        key = self.key(profile, profile_url, branch, compact)
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return dict(self.cache[key])
+
+        texts = self._build(profile, profile_url, branch, compact)
+
+        with self._lock:
+            self.cache[key] = texts
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return dict(texts)
+
+    def _build(self, profile, profile_url, branch, compact):
+        outputs = MemoryOutputs()
+        schema_dir = pathlib.Path('schema')
+
+        if profile is None:
+            final_schemas = self.core
+            stages = docs_stages(pathlib.Path('docs'), pathlib.Path('examples'), schema_dir / 'compiled',
+                                 compact=compact)
+        else:
+            core = self.core
+            if profile_url and 'openapi.json' in core:
+                core = {**core, 'openapi.json': openapi_for_profile(
+                    json.dumps(core['openapi.json']), profile_url, branch, self.core_ref
+                )}
+            final_schemas = merge_profile(core, profile)
+            for name, schema in final_schemas.items():
+                outputs.texts[str(schema_dir / name)] = dumps_json(schema)
+            stages = profile_stages(pathlib.Path('examples'), schema_dir / 'compiled', compact=compact)
+
+        schemas = {name: schema for name, schema in final_schemas.items() if name != 'openapi.json'}
+        schema_set = SchemaSet(schemas, final_schemas.get('openapi.json'))
+        schema_set.ref_graph.check_cycles()
+        run_stages(stages, schema_set, outputs)
+        return outputs.texts
+
+
+# the core spec of profile-batch, put in each worker process once
+def core_from_files(core_files):
+    """A schema store holding the filename -> text core_files, and their manifest."""
+    store = SchemaStore()
+    return store, store.add(core_files)
+
+
+def _build_batch_profile(name, profile_url, profile_dir, output_dir, options):
+    """(name, timings, None) for a built profile, or (name, None, error message) if it could not be built."""
+    store, manifest = _worker_objects['core']
+    try:
+        return name, build_profile(profile_url, profile_dir, output_dir, store, manifest, **options), None
+    except click.ClickException as e:
+        return name, None, e.format_message()
+    except Exception as e:
+        return name, None, f'{type(e).__name__}: {e}'
 
-    if clean:
-        clean_dir(schema_dir)
 
-    profile_to_schema(profile_url, branch, profile_dir='profile', schema_dir='schema')
+@cli.command()
+@click.argument('profile_dirs', nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--url-template', required=True,
+              help='URL of each profile, with {name} for the name of its directory, e.g. https://github.com/org/{name}')
+@click.option('--output-dir', default='build', type=click.Path(file_okay=False),
+              help='Each profile is built in a directory named after it inside this one.')
+@click.option('--clean', is_flag=True, default=False)
+@core_spec_options
+@build_options(jobs=os.cpu_count() or 1, jobs_help='Number of profiles built at once.')
+def profile_batch(profile_dirs, url_template, output_dir, branch, clean, cache_dir, no_cache, core, core_ref,
+                  offline, force, jobs, compact):
+    """Build many profiles from one copy of the core spec."""
+    store, manifest = core_spec_manifest(cache_dir, no_cache, core, core_ref, offline)
+    core_files = {filename: store.text(digest) for filename, digest in manifest.items()}
+
+    profiles = {}
+    for profile_dir in profile_dirs:
+        name = pathlib.Path(profile_dir).resolve().name
+        if name in profiles:
+            raise click.ClickException(f'More than one profile directory is called {name}')
+        profiles[name] = profile_dir
+
+    options = {"branch": branch, "core_ref": core_ref, "clean": clean, "force": force, "compact": compact}
+    timings = {}
+    errors = {}
+    start = time.perf_counter()
+
+    tasks = [
+        (name, url_template.format(name=name), profile_dir, pathlib.Path(output_dir) / name, options)
+        for name, profile_dir in profiles.items()
+    ]
+    for name, profile_timings, error in ordered_map(_build_batch_profile, tasks, jobs, _init_worker,
+                                                    ('core', core_from_files, core_files)):
+        if error:
+            errors[name] = error
+        else:
+            timings[name] = profile_timings
+
+    stages = ['merge', 'datapackage', 'examples', 'compile']
+    click.echo(f"{'profile':<30}" + ''.join(f'{stage:>12}' for stage in stages) + f"{'total':>12}")
+    for name in profiles:
+        if name in errors:
+            click.echo(f'{name:<30}  failed: {errors[name]}')
+            continue
+        row = timings[name]
+        click.echo(f'{name:<30}' + ''.join(f'{row[stage]:>12.3f}' for stage in stages) + f'{sum(row.values()):>12.3f}')
+    click.echo(f'{len(profiles)} profiles in {time.perf_counter() - start:.3f}s')
+    if errors:
+        raise click.ClickException(f'{len(errors)} of {len(profiles)} profiles failed')
+
+
+
+# inotify events for a file being written, created, deleted or moved in or out
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x8, 0x40, 0x80, 0x100, 0x200
+# sent with a watch of -1 when events were dropped as the kernel's queue was full
+IN_Q_OVERFLOW = 0x4000
+
+
+def inotify_changes(directories, interval):
+    """Yield the sets of paths changed in directories using inotify, None if events were lost."""
+    import ctypes
+    import ctypes.util
+    import select
+    import struct
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init()
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    watches = {}
+    for directory in directories:
+        wd = libc.inotify_add_watch(fd, str(directory).encode(), mask)
+        if wd < 0:
+            os.close(fd)
+            return None
+        watches[wd] = pathlib.Path(directory)
+
+    def changes():
+        try:
+            while True:
+                changed = set()
+                overflowed = False
+                timeout = None
+                while select.select([fd], [], [], timeout)[0]:
+                    data = os.read(fd, 65536)
+                    offset = 0
+                    while offset < len(data):
+                        wd, event, _, length = struct.unpack_from('iIII', data, offset)
+                        name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode()
+                        offset += 16 + length
+                        if event & IN_Q_OVERFLOW:
+                            overflowed = True
+                        elif wd in watches:
+                            changed.add(watches[wd] / name)
+                    timeout = interval
+                yield None if overflowed else changed
+        finally:
+            os.close(fd)
+
+    return changes()
+
+
+def poll_changes(directories, interval):
+    """Yield the set of paths changed in directories, by comparing their stat every interval seconds."""
+    def snapshot():
+        found = {}
+        for directory in directories:
+            for path in pathlib.Path(directory).iterdir():
+                if path.is_file():
+                    stat = path.stat()
+                    found[path] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    previous = snapshot()
+    while True:
+        time.sleep(interval)
+        current = snapshot()
+        changed = {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+        if changed:
+            yield changed
+        previous = current
+
+
+def file_changes(directories, interval=0.05, polling=False):
+    """Sets of paths changed in directories, through inotify where there is one, or polling."""
+    changes = None if polling else inotify_changes(directories, interval)
+    return changes or poll_changes(directories, interval)
+
+
+class Watcher:
+    """Keeps a build in memory and rebuilds the outputs affected by changed files."""
+
+    def __init__(self, schema_dir='schema', profile_dir=None, profile_url=None, branch='main', store=None,
+                 core_manifest=None, core_ref=CORE_REF, docs=True, compact=False):
+        self.schema_dir = pathlib.Path(schema_dir)
+        self.profile_dir = pathlib.Path(profile_dir) if profile_dir else None
+        self.profile_url = profile_url
+        self.branch = branch
+        self.store = store
+        self.core_manifest = core_manifest
+        self.core_ref = core_ref
+
+        self.manifest = build_manifest()
+        if docs:
+            self.stages = docs_stages(pathlib.Path('docs'), pathlib.Path('examples'), self.schema_dir / 'compiled',
+                                      compact=compact)
+        else:
+            self.stages = profile_stages(pathlib.Path('examples'), self.schema_dir / 'compiled', compact=compact)
+        self.schema_set = None
+
+    @property
+    def directories(self):
+        return [self.profile_dir] if self.profile_url else [self.schema_dir]
+
+    def load(self, changed=None):
+        """The schema set after changed paths, or after reading every file again if changed is None."""
+        if self.profile_url:
+            final_schemas = profile_to_schema(self.profile_url, self.branch, profile_dir=self.profile_dir,
+                                              schema_dir=self.schema_dir, core_ref=self.core_ref, store=self.store,
+                                              core_manifest=self.core_manifest)
+            schemas = {name: schema for name, schema in final_schemas.items() if name != 'openapi.json'}
+            openapi = final_schemas.get('openapi.json')
+        elif changed is None or self.schema_set is None:
+            loaded = SchemaSet.from_dir(self.schema_dir)
+            schemas, openapi = loaded.by_filename, loaded.openapi
+        else:
+            schemas = dict(self.schema_set.by_filename)
+            openapi = self.schema_set.openapi
+            for path in changed:
+                if path.suffix != '.json' or path.parent != self.schema_dir:
+                    continue
+                schema = json.loads(path.read_text()) if path.exists() else None
+                if path.name == 'openapi.json':
+                    openapi = schema
+                elif schema is None:
+                    schemas.pop(path.name, None)
+                else:
+                    schemas[path.name] = schema
+
+        if self.schema_set is None:
+            return SchemaSet(schemas, openapi)
+        return self.schema_set.updated(schemas, openapi)
+
+    def build(self, changed=None):
+        """Rebuild after changed paths, returns the outputs that were built."""
+        schema_set = self.load(changed)
+        schema_set.ref_graph.check_cycles()
+        self.schema_set = schema_set
+
+        before = dict(self.manifest.outputs)
+        run_stages(self.stages, schema_set, self.manifest)
+        self.manifest.save()
+        return sorted(output for output, key in self.manifest.outputs.items() if before.get(output) != key)
+
+    def run(self, interval=0.05, polling=False):
+        # paths changed since the last build that worked
+        pending = set()
+        for changed in file_changes(self.directories, interval, polling):
+            # None when inotify lost events, and then every file is read again
+            pending = None if changed is None or pending is None else pending | changed
+            start = time.perf_counter()
+            try:
+                built = self.build(pending)
+            except (click.ClickException, ValueError, KeyError) as e:
+                # keep watching, the next save may fix it
+                message = e.format_message() if isinstance(e, click.ClickException) else repr(e)
+                click.echo(f'Build failed: {message}', err=True)
+                continue
+            pending = set()
+            took = (time.perf_counter() - start) * 1000
+            click.echo(f'Rebuilt {len(built)} outputs in {took:.0f}ms: {", ".join(built) or "nothing changed"}',
+                       err=True)
 
-    example_dir = pathlib.Path('examples')
-    example_dir.mkdir(exist_ok=True)
 
-    if clean:
-        clean_dir(example_dir)
+@cli.command()
+@click.option('--profile-url', help='Watch profile/ and merge it with the core spec, as profile-all does.')
+@core_spec_options
+@build_options()
+@click.option('--interval', default=0.05, show_default=True, help='Seconds to wait for more changes.')
+@click.option('--polling', is_flag=True, default=False, help='Poll for changes instead of using inotify.')
+def watch(profile_url, branch, cache_dir, no_cache, core, core_ref, offline, compact, interval, polling):
+    """Build docs-all (or profile-all) outputs, then rebuild what changes affect as files are saved."""
+    store = core_manifest = None
+    if profile_url:
+        store, core_manifest = core_spec_manifest(cache_dir, no_cache, core, core_ref, offline)
+
+    watcher = Watcher(profile_dir='profile' if profile_url else None, profile_url=profile_url, branch=branch,
+                      store=store, core_manifest=core_manifest, core_ref=core_ref, docs=not profile_url,
+                      compact=compact)
+
+    start = time.perf_counter()
+    built = watcher.build()
+    click.echo(f'Built {len(built)} outputs in {(time.perf_counter() - start) * 1000:.0f}ms, '
+               f'watching {", ".join(str(directory) for directory in watcher.directories)}', err=True)
+    watcher.run(interval, polling)
+
+
+def without_arrays(record):
+    """record without its array values at any depth, as in the _list variant of a compiled schema."""
+    return {
+        key: without_arrays(value) if isinstance(value, dict) else value
+        for key, value in record.items() if not isinstance(value, list)
+    }
 
-    compiled_dir = schema_dir / 'compiled'
-    compiled_dir.mkdir(exist_ok=True)
-
-    if clean:
-        clean_dir(compiled_dir)
-    #compile_to_openapi30(schema_dir, docs_dir)
-    with open('datapackage.json', 'w+') as f: 
-        datapackage = _schemas_to_datapackage(schema_dir)
-        f.write(datapackage)
-    
-    _schemas_to_doc_examples(schema_dir, example_dir)
-    _compile_schemas(schema_dir, compiled_dir)
+
+class MockApi:
+    """Responses for each GET path of an openapi.json, with records from a DataGenerator."""
+
+    def __init__(self, schemas, counts, seed=0, per_page=50, cache_size=1024, stream_size=1000):
+        schema_set = SchemaSet.load(schemas)
+        if not schema_set.openapi:
+            raise click.ClickException('No openapi.json in the schemas')
+        self.openapi = schema_set.openapi
+        self.generator = DataGenerator(schema_set, counts, seed)
+        self.per_page = per_page
+        # pages with more records are made as they are sent rather than cached
+        self.stream_size = stream_size
+
+        # (pattern, entity or None, by id, response for other paths)
+        self.routes = []
+        for path, operations in self.openapi.get('paths', {}).items():
+            operation = operations.get('get') if isinstance(operations, dict) else None
+            if not isinstance(operation, dict):
+                continue
+            response = self.resolve(operation.get('responses', {}).get('200', {}))
+            schema = response.get('content', {}).get('application/json', {}).get('schema', {})
+            entity = self.schema_entity(schema)
+            pattern = re.compile('^' + re.sub(r'\\\{[^/]*?\\\}', '([^/]+)', re.escape(path)) + '$')
+            if entity:
+                self.routes.append((pattern, entity, path.endswith('}'), None))
+            else:
+                self.routes.append((pattern, None, False, dumps_json(self.schema_example(schema), compact=True).encode()))
+
+        self.record_json = functools.lru_cache(maxsize=cache_size * 16)(self.record_json)
+        self.page_json = functools.lru_cache(maxsize=cache_size)(self.page_json)
+
+    def resolve(self, schema):
+        """schema, or what its $ref points at if that is in the openapi.json."""
+        seen = set()
+        while isinstance(schema, dict) and schema.get('$ref', '').startswith('#/') and schema['$ref'] not in seen:
+            seen.add(schema['$ref'])
+            target = self.openapi
+            for part in schema['$ref'][2:].split('/'):
+                part = part.replace('~1', '/').replace('~0', '~')
+                target = target.get(part) if isinstance(target, dict) else None
+            schema = target
+        return schema if isinstance(schema, dict) else {}
+
+    def ref_entity(self, ref):
+        """(table, listed) for a $ref to a schema of generated records, such as service_list.json, or (None, False)."""
+        name = ref.split('#')[0].rsplit('/', 1)[-1]
+        if name.endswith('.json'):
+            name = name[:-5]
+        listed = name.endswith('_list')
+        for suffix in ('_list', '_package'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        return (name, listed) if name in self.generator.counts else (None, False)
+
+    def schema_entity(self, schema, seen=frozenset()):
+        """The table whose records a response schema refers to, directly, through allOf or in the contents of a page."""
+        # a $ref met again on the way down is a cycle
+        ref = schema.get('$ref') if isinstance(schema, dict) else None
+        if ref in seen:
+            return None
+        if ref:
+            seen = seen | {ref}
+        schema = self.resolve(schema)
+
+        entity, _ = self.ref_entity(schema.get('$ref', ''))
+        for part in schema.get('allOf', []):
+            entity = entity or self.schema_entity(part, seen)
+        items = self.resolve(schema.get('properties', {}).get('contents')).get('items')
+        if isinstance(items, dict):
+            entity = entity or self.schema_entity(items, seen)
+        return entity
+
+    def schema_example(self, schema, seen=frozenset()):
+        """A value for a response schema, from its examples, enums and types, and generated records for entities."""
+        ref = schema.get('$ref') if isinstance(schema, dict) else None
+        if ref in seen:
+            return None
+        if ref:
+            seen = seen | {ref}
+        schema = self.resolve(schema)
+
+        if 'example' in schema:
+            return schema['example']
+        if schema.get('examples'):
+            return schema['examples'][0]
+        if schema.get('enum'):
+            return schema['enum'][0]
+        entity, listed = self.ref_entity(schema.get('$ref', ''))
+        if entity:
+            return json.loads(self.record_json(entity, 0, listed)) if self.generator.counts[entity] else None
+        if schema.get('allOf'):
+            example = {}
+            for part in schema['allOf']:
+                value = self.schema_example(part, seen)
+                if isinstance(value, dict):
+                    example.update(value)
+            return example
+        schema_type = schema.get('type')
+        if isinstance(schema_type, list):
+            schema_type = schema_type[0]
+        if schema_type == 'object' or 'properties' in schema:
+            return {key: self.schema_example(prop, seen) for key, prop in schema.get('properties', {}).items()}
+        if schema_type == 'array':
+            return [self.schema_example(schema['items'], seen)] if isinstance(schema.get('items'), dict) else []
+        return {'string': '', 'integer': 0, 'number': 0, 'boolean': False}.get(schema_type)
+
+    def record_json(self, entity, index, listed):
+        record = self.generator.record(entity, index)
+        return dumps_json(without_arrays(record) if listed else record, compact=True).encode()
+
+    def page_info(self, entity, page_number, size):
+        total = self.generator.counts[entity]
+        total_pages = max(1, -(-total // size))
+        indexes = range(min((page_number - 1) * size, total), min(page_number * size, total))
+        info = {
+            **page, "total_items": total, "total_pages": total_pages, "page_number": page_number, "size": size,
+            "first_page": page_number == 1, "last_page": page_number >= total_pages, "empty": not indexes,
+        }
+        return info, indexes
+
+    def page_chunks(self, entity, page_number, size):
+        """A page of entity records as json, in chunks of up to 100 records."""
+        info, indexes = self.page_info(entity, page_number, size)
+        yield dumps_json(info, compact=True)[:-1].encode() + b',"contents":['
+        for start in range(indexes.start, indexes.stop, 100):
+            records = [self.record_json(entity, index, True) for index in range(start, min(start + 100, indexes.stop))]
+            yield (b',' if start != indexes.start else b'') + b','.join(records)
+        yield b']}'
+
+    def page_json(self, entity, page_number, size):
+        return b''.join(self.page_chunks(entity, page_number, size))
+
+    def response(self, target):
+        """(status, body) for a GET of target, the body being bytes or an iterator of bytes for large pages."""
+        import urllib.parse
+
+        url = urllib.parse.urlsplit(target)
+        for pattern, entity, by_id, body in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            if entity is None:
+                return 200, body
+            if by_id:
+                index = self.record_index(entity, urllib.parse.unquote(match.groups()[-1]))
+                if index is None:
+                    return 404, b'{"message":"Not found"}'
+                return 200, self.record_json(entity, index, False)
+
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                page_number = int(query.get('page', [1])[0])
+                size = int(query.get('per_page', query.get('size', [self.per_page]))[0])
+            except ValueError:
+                return 400, b'{"message":"page and per_page must be whole numbers"}'
+            if page_number < 1 or size < 1:
+                return 400, b'{"message":"page and per_page must be at least 1"}'
+            if min(size, self.generator.counts[entity]) > self.stream_size:
+                return 200, self.page_chunks(entity, page_number, size)
+            return 200, self.page_json(entity, page_number, size)
+        return 404, b'{"message":"Not found"}'
+
+    def record_index(self, entity, record_id):
+        """Row number of the record with record_id, or None if there is none."""
+        prefix = self.generator.id_prefixes[entity]
+        if not record_id.startswith(prefix):
+            return None
+        try:
+            index = int(record_id[len(prefix):], 16)
+        except ValueError:
+            return None
+        return index if index < self.generator.counts[entity] else None
+
+
+async def _send_response(writer, status, body, head=False, keep_alive=True, chunked=True):
+    import http
+
+    lines = [f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}', 'Content-Type: application/json']
+    if isinstance(body, bytes):
+        lines.append(f'Content-Length: {len(body)}')
+    elif chunked:
+        lines.append('Transfer-Encoding: chunked')
+    else:
+        keep_alive = False
+    lines.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+
+    if head:
+        if not isinstance(body, bytes):
+            body.close()
+    elif isinstance(body, bytes):
+        writer.write(body)
+    else:
+        import asyncio
+
+        for chunk in body:
+            writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+            await writer.drain()
+            # let other connections be served between chunks of a large page
+            await asyncio.sleep(0)
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+    await writer.drain()
+    return keep_alive
+
+
+async def _handle_connection(api, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if headers.get('content-length', '').isdigit():
+                await reader.readexactly(int(headers['content-length']))
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                await _send_response(writer, 400, b'{"message":"Bad request"}', keep_alive=False)
+                break
+            method, target, version = parts
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+            if method in ('GET', 'HEAD'):
+                status, body = api.response(target)
+            else:
+                status, body = 405, b'{"message":"Only GET is supported"}'
+            keep_alive = await _send_response(writer, status, body, head=method == 'HEAD', keep_alive=keep_alive,
+                                              chunked=version != 'HTTP/1.0')
+            if not keep_alive:
+                break
+    except (ConnectionError, EOFError):
+        # EOFError includes the IncompleteReadError of a request cut short
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_mock_api(api, host='127.0.0.1', port=8000):
+    import asyncio
+
+    server = await asyncio.start_server(functools.partial(_handle_connection, api), host, port)
+    async with server:
+        click.echo(f'Serving {len(api.routes)} paths on http://{host}:{port}', err=True)
+        await server.serve_forever()
+
+
+@cli.command('mock-server')
+@click.argument('schemas')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--count', 'counts', multiple=True, default=['service=1000'], show_default=True,
+              help='Number of records of a table as table=number. Tables not given get the largest count.')
+@click.option('--seed', default=0, show_default=True, help='The same seed always gives the same data.')
+@click.option('--per-page', default=50, show_default=True, help='Page size when a request does not give per_page.')
+@click.option('--cache-size', default=1024, show_default=True, help='Number of pages kept serialized.')
+def mock_server(schemas, host, port, counts, seed, per_page, cache_size):
+    """Serve a mock HSDS API for every GET path of the openapi.json in SCHEMAS, with generated data."""
+    import asyncio
+
+    counts = parse_counts(counts)
+    api = MockApi(schemas, counts, seed=seed, per_page=per_page, cache_size=cache_size)
+    unknown = set(counts) - set(api.generator.counts)
+    if unknown:
+        raise click.ClickException(f'No table for: {", ".join(sorted(unknown))}')
+    try:
+        asyncio.run(serve_mock_api(api, host, port))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
@@ -6,11 +6,15 @@ from setuptools.command.install import install
 install_requires = [
     "click",
     "requests",
-    "flatterer",
-    "compiletojsonschema",
-    "json-merge-patch",
 ]
 
+extras_require = {
+    "validate": ["jsonschema", "ijson"],
+    "parquet": ["pyarrow"],
+    "fast": ["orjson"],
+    "test": ["pytest"],
+}
+
 setup(
     name="hsds_schema_tools",
     version="0.0.14",
@@ -22,4 +26,5 @@ setup(
     license="MIT",
     description="Tools for dealing with HSDS schema",
     install_requires=install_requires,
+    extras_require=extras_require,
 )
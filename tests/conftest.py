@@ -0,0 +1,75 @@
+import hashlib
+import http.server
+import json
+import pathlib
+import sys
+import threading
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import pytest
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+SPEC_FILES = {
+    'service.json': json.dumps({'name': 'service', 'properties': {'id': {'type': 'string'}}}),
+    'openapi.json': json.dumps({'openapi': '3.1.0', 'paths': {}}),
+}
+
+
+@pytest.fixture
+def schema_dir():
+    """A small set of HSDS schemas, with the tables and links of the core spec."""
+    return FIXTURES / 'schema'
+
+
+class SpecHandler(http.server.BaseHTTPRequestHandler):
+    """Serves a contents api listing at /contents and each file at /raw/<name>, with ETags unless turned off."""
+
+    def do_GET(self):
+        if self.server.error:
+            self.server.log.append((self.path, self.server.error))
+            self.send_error(self.server.error)
+            return
+
+        if self.path.startswith('/contents'):
+            listing = [{'name': name, 'download_url': f'{self.server.url}/raw/{name}'} for name in self.server.files]
+            listing.append({'name': 'subdir', 'download_url': None})
+            body = json.dumps(listing)
+        else:
+            body = self.server.files[self.path.rsplit('/', 1)[-1]]
+
+        etag = f'"{hashlib.sha256(body.encode()).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.log.append((self.path, 304))
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.server.log.append((self.path, 200))
+        self.send_response(200)
+        if self.server.etags:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body.encode())))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """A local stand-in for the github api, serving the files of a core spec."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SpecHandler)
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    server.files = dict(SPEC_FILES)
+    server.log = []
+    server.etags = True
+    # a status to answer every request with instead
+    server.error = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
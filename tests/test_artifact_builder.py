@@ -0,0 +1,88 @@
+"""ArtifactBuilder building in memory what docs-all and profile-all write."""
+
+import json
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+PROFILE_URL = 'https://github.com/example/profile'
+PROFILE = {
+    'phone.json': {'properties': {'number': {'title': 'Phone number'}}},
+    'taxonomy_term.json': {},
+    'taxonomy.json': {},
+    'attribute.json': {},
+}
+
+
+@pytest.fixture
+def core(schema_dir):
+    return {path.name: json.loads(path.read_text()) for path in schema_dir.glob('*.json')}
+
+
+def written(directory, *skip):
+    return {
+        str(path.relative_to(directory)): path.read_bytes().decode()
+        for path in directory.rglob('*')
+        if path.is_file() and path.name != hsds_schema.BUILD_MANIFEST and path.parts[len(directory.parts)] not in skip
+    }
+
+
+def test_core_matches_docs_all(core, schema_dir, tmp_path, monkeypatch):
+    shutil.copytree(schema_dir, tmp_path / 'schema')
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(hsds_schema.cli, ['docs-all'])
+    assert result.exit_code == 0, result.output
+
+    built = hsds_schema.ArtifactBuilder(core).build()
+    expected = written(tmp_path)
+    for name in core:
+        expected.pop(f'schema/{name}')
+    assert built == expected
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_profile_matches_profile_all(core, schema_dir, tmp_path, monkeypatch, compact):
+    (tmp_path / 'profile').mkdir()
+    for name, schema in PROFILE.items():
+        (tmp_path / 'profile' / name).write_text(json.dumps(schema))
+    monkeypatch.chdir(tmp_path)
+    args = ['profile-all', PROFILE_URL, '--core', str(schema_dir), '--cache-dir', str(tmp_path / 'cache')]
+    result = CliRunner().invoke(hsds_schema.cli, args + (['--compact'] if compact else []))
+    assert result.exit_code == 0, result.output
+
+    built = hsds_schema.ArtifactBuilder(core).build(PROFILE, profile_url=PROFILE_URL, compact=compact)
+    assert 'schema/compiled/service.json' in built
+    assert 'schema/taxonomy.json' not in built
+    assert built == written(tmp_path, 'profile', 'cache')
+
+
+def test_builds_are_cached(core, monkeypatch):
+    builder = hsds_schema.ArtifactBuilder(core, cache_size=2)
+    calls = []
+    build = builder._build
+    monkeypatch.setattr(builder, '_build', lambda *args: calls.append(args) or build(*args))
+
+    docs = builder.build()
+    preview = builder.build(PROFILE, profile_url=PROFILE_URL)
+    assert builder.build() == docs
+    assert builder.build(PROFILE, profile_url=PROFILE_URL) == preview
+    assert len(calls) == 2
+
+    # a copy each time, so changing one does not change the cache
+    docs.clear()
+    assert builder.build()
+
+    # the same profile given as new dicts hits the cache, a changed one does not
+    assert builder.build(json.loads(json.dumps(PROFILE)), profile_url=PROFILE_URL) == preview
+    assert len(calls) == 2
+    builder.build({**PROFILE, 'taxonomy.json': None}, profile_url=PROFILE_URL)
+    assert len(calls) == 3
+
+    # only the two most recently used builds are kept
+    builder.build(PROFILE, profile_url=PROFILE_URL)
+    assert len(calls) == 3
+    builder.build()
+    assert len(calls) == 4
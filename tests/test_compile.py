@@ -0,0 +1,55 @@
+"""Compiled schemas, against the output of compile-schemas from before compiling was memoized."""
+
+import json
+import pathlib
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+EXPECTED = sorted(path.name for path in (FIXTURES / 'compiled').glob('*.json'))
+
+
+@pytest.fixture(scope='module')
+def compiled_dir(tmp_path_factory):
+    output = tmp_path_factory.mktemp('compiled')
+    result = CliRunner().invoke(hsds_schema.cli, ['compile-schemas', str(FIXTURES / 'schema'), str(output)])
+    assert result.exit_code == 0, result.output
+    return output
+
+
+@pytest.mark.parametrize('filename', EXPECTED)
+def test_same_as_fixture(compiled_dir, filename):
+    # the fixtures are stored minified, the outputs are indented as json.dumps does
+    expected = json.loads((FIXTURES / 'compiled' / filename).read_text())
+
+    assert (compiled_dir / filename).read_text() == json.dumps(expected, indent=2)
+
+
+@pytest.mark.parametrize('entity', ['service', 'organization', 'service_at_location'])
+def test_package_is_an_array_of_the_entity(compiled_dir, entity):
+    expected = json.loads((FIXTURES / 'compiled' / f'{entity}.json').read_text())
+
+    assert (compiled_dir / f'{entity}_package.json').read_text() == json.dumps(
+        {'type': 'array', 'items': expected}, indent=2
+    )
+
+
+def test_compact(tmp_path):
+    hsds_schema._compile_schemas(FIXTURES / 'schema', tmp_path, compact=True)
+    expected = json.loads((FIXTURES / 'compiled' / 'service.json').read_text())
+
+    assert (tmp_path / 'service.json').read_text() == json.dumps(expected, separators=(',', ':'))
+
+
+def test_schemas_are_not_changed(schema_dir):
+    schema_set = hsds_schema.SchemaSet.from_dir(schema_dir)
+    before = json.dumps(schema_set.by_filename)
+
+    first = hsds_schema.compile_entity(schema_set.compiler, 'service')
+    second = hsds_schema.compile_entity(schema_set.compiler, 'service')
+
+    assert first == second
+    assert json.dumps(schema_set.by_filename) == before
@@ -0,0 +1,78 @@
+"""The _defs variants of compiled schemas, with each referenced schema once in $defs."""
+
+import json
+
+import jsonschema
+import pytest
+
+import hsds_schema
+
+ENTITIES = ['service', 'organization', 'service_at_location']
+VARIANTS = ['', '_package', '_list']
+
+
+def with_ids(schema_set):
+    """schema_set with a $id and $schema on every schema, as the core spec has."""
+    schemas = schema_set.copy_by_filename()
+    for filename, schema in schemas.items():
+        schema['$id'] = f'https://example.com/schema/{filename}'
+        schema['$schema'] = 'https://json-schema.org/draft/2020-12/schema'
+    return hsds_schema.SchemaSet(schemas, schema_set.openapi)
+
+
+@pytest.fixture(params=['plain', 'with $id'])
+def schema_set(request, schema_dir):
+    schema_set = hsds_schema.SchemaSet.from_dir(schema_dir)
+    return schema_set if request.param == 'plain' else with_ids(schema_set)
+
+
+def refs(value):
+    if isinstance(value, dict):
+        if '$ref' in value:
+            yield value['$ref']
+        for item in value.values():
+            yield from refs(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from refs(item)
+
+
+@pytest.mark.parametrize('variant', VARIANTS)
+@pytest.mark.parametrize('entity', ENTITIES)
+def test_refs_resolve_in_the_document(schema_set, entity, variant):
+    compiled = hsds_schema.definitions_entity(schema_set.by_filename, entity, variant)
+    found = set(refs(compiled))
+
+    assert found == {f'#/$defs/{name}' for name in compiled['$defs']}
+    # only the document itself may have a $id, or refs would resolve against another base
+    assert '$id' not in json.dumps(compiled['$defs'])
+
+
+@pytest.mark.parametrize('entity', ENTITIES)
+def test_same_errors_as_inlined(schema_set, entity):
+    generator = hsds_schema.DataGenerator(schema_set, {entity: 20})
+    records = [generator.record(entity, index) for index in range(20)]
+    records += [{**record, 'id': 5} for record in records[:5]]
+
+    inlined = hsds_schema.compile_entity(schema_set.compiler, entity)
+    for variant in VARIANTS:
+        defs = hsds_schema.definitions_entity(schema_set.by_filename, entity, variant)
+        if variant == '_package':
+            reference = jsonschema.Draft202012Validator({'type': 'array', 'items': inlined})
+            assert [error.message for error in jsonschema.Draft202012Validator(defs).iter_errors(records)] == [
+                error.message for error in reference.iter_errors(records)
+            ]
+        elif variant == '':
+            for record in records:
+                assert [error.message for error in jsonschema.Draft202012Validator(defs).iter_errors(record)] == [
+                    error.message for error in jsonschema.Draft202012Validator(inlined).iter_errors(record)
+                ]
+
+
+def test_package_items_load_with_their_defs(schema_set, tmp_path):
+    hsds_schema._compile_schemas(schema_set, tmp_path)
+
+    items = hsds_schema.load_compiled_schema('service_package_defs', tmp_path)
+    validator = jsonschema.Draft202012Validator(items)
+
+    assert list(validator.iter_errors({'id': 1, 'name': 'x', 'status': 'active', 'phones': [{'id': 'p'}]}))
@@ -0,0 +1,47 @@
+"""Converting nested records to per table csvs and back."""
+
+import json
+
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+def without_ids(value):
+    """value without the foreign keys csv-to-data adds back from the tables."""
+    if isinstance(value, dict):
+        return {key: without_ids(item) for key, item in value.items() if not key.endswith('_id')}
+    if isinstance(value, list):
+        return [without_ids(item) for item in value]
+    return value
+
+
+def test_service_full_round_trip(schema_dir, tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(hsds_schema.cli, ['schemas-to-doc-examples', str(schema_dir), str(tmp_path / 'examples')])
+    assert result.exit_code == 0, result.output
+    example = tmp_path / 'examples' / 'service_full.json'
+
+    result = runner.invoke(hsds_schema.cli, ['data-to-csv', str(schema_dir), 'service', str(example), str(tmp_path / 'csv')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(hsds_schema.cli, ['csv-to-data', str(schema_dir), 'service', str(tmp_path / 'csv')])
+    assert result.exit_code == 0, result.output
+
+    assert [without_ids(record) for record in json.loads(result.output)] == [json.loads(example.read_text())]
+
+
+def test_repeated_rows_keep_every_parent(schema_dir, tmp_path):
+    phone = {'id': 'p1', 'number': '1'}
+    records = [
+        {'id': 's1', 'name': 'One', 'status': 'active', 'phones': [phone],
+         'organization': {'id': 'o1', 'name': 'Org', 'phones': [phone]}},
+        {'id': 's2', 'name': 'Two', 'status': 'active', 'organization': {'id': 'o1', 'name': 'Org'},
+         'service_at_locations': [{'id': 'sal1', 'location': {'id': 'l1', 'phones': [phone]}}]},
+    ]
+
+    counts = hsds_schema.data_to_csv(schema_dir, records, 'service', tmp_path, batch_size=1)
+
+    assert counts['phone'] == 1
+    assert counts['organization'] == 1
+    phone_csv = (tmp_path / 'phone.csv').read_text().splitlines()
+    assert phone_csv == ['id,organization_id,location_id,service_at_location_id,service_id,number', 'p1,o1,l1,,s1,1']
@@ -0,0 +1,97 @@
+"""Fetching the core spec, against a local stand-in for the github api."""
+
+import click
+import pytest
+
+import hsds_schema
+
+
+def test_cold_then_warm_fetch(server, tmp_path):
+    url = f'{server.url}/contents?ref=3.0'
+
+    assert hsds_schema.fetch_core_files(url, tmp_path / 'cache') == server.files
+    assert sorted(status for _, status in server.log) == [200, 200, 200]
+
+    server.log.clear()
+    assert hsds_schema.fetch_core_files(url, tmp_path / 'cache') == server.files
+    assert sorted(status for _, status in server.log) == [304, 304, 304]
+
+
+def test_no_cache_dir_always_downloads(server):
+    url = f'{server.url}/contents?ref=3.0'
+
+    hsds_schema.fetch_core_files(url, None)
+    hsds_schema.fetch_core_files(url, None)
+    assert [status for _, status in server.log] == [200] * 6
+
+
+def test_response_without_etag_drops_cached_body(server, tmp_path):
+    url = f'{server.url}/contents?ref=3.0'
+    cache_dir = tmp_path / 'cache'
+    hsds_schema.fetch_core_files(url, cache_dir)
+    assert len(list(cache_dir.glob('*.etag'))) == 3
+
+    server.etags = False
+    server.files['service.json'] = '{"name": "service"}'
+    assert hsds_schema.fetch_core_files(url, cache_dir) == server.files
+    # only the changed file was sent again, and its old body is gone
+    assert len(list(cache_dir.glob('*.etag'))) == len(list(cache_dir.glob('*.body'))) == 2
+
+    server.etags = True
+    server.log.clear()
+    assert hsds_schema.fetch_core_files(url, cache_dir) == server.files
+    assert sorted(server.log) == [('/contents?ref=3.0', 304), ('/raw/openapi.json', 304), ('/raw/service.json', 200)]
+
+
+def test_no_cache_keeps_the_store(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(hsds_schema, 'CORE_SCHEMA_URL', f'{server.url}/contents?ref={{ref}}')
+    cache_dir = tmp_path / 'cache'
+
+    hsds_schema.load_core_manifest(cache_dir=cache_dir, no_cache=True)
+    hsds_schema.load_core_manifest(cache_dir=cache_dir, no_cache=True)
+    assert [status for _, status in server.log] == [200] * 6
+    assert not list(cache_dir.glob('*.etag'))
+
+    server.log.clear()
+    store, manifest = hsds_schema.load_core_manifest(cache_dir=cache_dir, offline=True)
+    assert {filename: store.text(digest) for filename, digest in manifest.items()} == server.files
+    assert server.log == []
+
+
+def test_offline_fallback_to_store(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(hsds_schema, 'CORE_SCHEMA_URL', f'{server.url}/contents?ref={{ref}}')
+    cache_dir = tmp_path / 'cache'
+
+    store, manifest = hsds_schema.load_core_manifest(cache_dir=cache_dir)
+    expected = {filename: store.text(digest) for filename, digest in manifest.items()}
+    assert expected == server.files
+
+    # with the server gone, the stored version is used
+    server.shutdown()
+    server.server_close()
+    store, manifest = hsds_schema.load_core_manifest(cache_dir=cache_dir)
+    assert {filename: store.text(digest) for filename, digest in manifest.items()} == server.files
+
+    server.log.clear()
+    store, manifest = hsds_schema.load_core_manifest(cache_dir=cache_dir, offline=True)
+    assert {filename: store.text(digest) for filename, digest in manifest.items()} == server.files
+    assert server.log == []
+
+
+def test_http_error_falls_back_to_store(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(hsds_schema, 'CORE_SCHEMA_URL', f'{server.url}/contents?ref={{ref}}')
+    cache_dir = tmp_path / 'cache'
+    hsds_schema.load_core_manifest(cache_dir=cache_dir)
+
+    server.error = 503
+    store, manifest = hsds_schema.load_core_manifest(cache_dir=cache_dir)
+    assert {filename: store.text(digest) for filename, digest in manifest.items()} == server.files
+    assert server.log[-1][1] == 503
+
+    with pytest.raises(click.ClickException, match='not in the schema store'):
+        hsds_schema.load_core_manifest(core_ref='other', cache_dir=cache_dir)
+
+
+def test_offline_without_stored_version(tmp_path):
+    with pytest.raises(click.ClickException):
+        hsds_schema.load_core_manifest(cache_dir=tmp_path / 'cache', offline=True)
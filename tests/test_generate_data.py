@@ -0,0 +1,59 @@
+"""Generating synthetic records that keep to the schemas."""
+
+import jsonschema
+import pytest
+
+import hsds_schema
+
+BOUNDED = {
+    'capacity': {'type': 'integer', 'minimum': 500},
+    'floor': {'type': 'integer', 'exclusiveMaximum': -5},
+    'rooms': {'type': 'integer', 'minimum': 1.5, 'maximum': 4.5},
+    'rating': {'type': 'number', 'exclusiveMinimum': 1000.5},
+    'share': {'type': 'number', 'minimum': 0.1, 'maximum': 0.3},
+    'fee': {'type': 'number', 'exclusiveMinimum': 0, 'exclusiveMaximum': 0.05},
+}
+
+
+@pytest.fixture
+def bounded_schemas(schema_dir):
+    schema_set = hsds_schema.SchemaSet.from_dir(schema_dir)
+    schemas = schema_set.copy_by_filename()
+    service = schemas['service.json']
+    for name, prop in BOUNDED.items():
+        service['properties'][name] = {'name': name, 'constraints': {'unique': False}, **prop}
+    service['required'] += list(BOUNDED)
+    return hsds_schema.SchemaSet(schemas, schema_set.openapi)
+
+
+def test_records_keep_to_bounds(bounded_schemas):
+    generator = hsds_schema.DataGenerator(bounded_schemas, {'service': 200})
+    validator = jsonschema.Draft202012Validator(hsds_schema.compile_entity(bounded_schemas.compiler, 'service'))
+
+    records = [generator.record('service', index) for index in range(200)]
+
+    assert [error.message for record in records for error in validator.iter_errors(record)] == []
+    assert {record['rooms'] for record in records} == {2, 3, 4}
+    assert max(record['capacity'] for record in records) > 510
+
+
+@pytest.mark.parametrize('prop, low, high', [
+    ({}, 0, 100),
+    ({'minimum': 500}, 500, 600),
+    ({'maximum': -5}, -105, -5),
+    ({'exclusiveMinimum': 0.1, 'exclusiveMaximum': 3}, 1, 2),
+    ({'minimum': 2, 'exclusiveMinimum': 4}, 5, 105),
+])
+def test_integer_bounds(prop, low, high):
+    assert hsds_schema.value_bounds(prop, 1, 100) == (low, high)
+
+
+def test_same_data_whatever_the_jobs(schema_dir, tmp_path):
+    counts = {'service': 30, 'organization': 5}
+    hsds_schema.generate_data(schema_dir, counts, tmp_path / 'one', shard_size=7)
+    hsds_schema.generate_data(schema_dir, counts, tmp_path / 'two', jobs=2, shard_size=7)
+
+    one = sorted(path.relative_to(tmp_path / 'one') for path in (tmp_path / 'one').rglob('*.ndjson'))
+    assert len(one) == 6
+    for path in one:
+        assert (tmp_path / 'two' / path).read_bytes() == (tmp_path / 'one' / path).read_bytes()
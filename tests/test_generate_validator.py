@@ -0,0 +1,119 @@
+"""Modules written by generate-validator finding the same errors as jsonschema."""
+
+import copy
+import random
+
+import jsonschema
+import pytest
+
+import hsds_schema
+
+EXTRA_PROPERTIES = {
+    'email': {'type': 'string', 'format': 'email'},
+    'capacity': {'type': 'integer', 'minimum': 1, 'exclusiveMaximum': 10},
+    'code': {'type': 'string', 'pattern': '^[A-Z]', 'maxLength': 3},
+    'tags': {'type': 'array', 'items': {'type': 'string', 'minLength': 1}, 'minItems': 1, 'maxItems': 2},
+}
+
+BAD_VALUES = [None, 1, 1.5, True, '', 'not-a-uuid', '2020-13-45', 'no-at-sign', [], {}]
+
+
+def break_record(record, rng):
+    """A copy of record with a value somewhere in it replaced or removed."""
+    record = copy.deepcopy(record)
+    value = record
+    while True:
+        keys = list(value) if isinstance(value, dict) else range(len(value))
+        if not keys:
+            return record
+        key = rng.choice(keys)
+        if isinstance(value[key], (dict, list)) and value[key] and rng.random() < 0.6:
+            value = value[key]
+        elif isinstance(value, dict) and rng.random() < 0.3:
+            del value[key]
+            return record
+        else:
+            value[key] = copy.deepcopy(rng.choice(BAD_VALUES))
+            return record
+
+
+@pytest.fixture
+def schema_set(schema_dir):
+    schema_set = hsds_schema.SchemaSet.from_dir(schema_dir)
+    schemas = schema_set.copy_by_filename()
+    for name, prop in EXTRA_PROPERTIES.items():
+        schemas['service.json']['properties'][name] = {'name': name, **prop}
+    return hsds_schema.SchemaSet(schemas, schema_set.openapi)
+
+
+@pytest.fixture
+def validators(schema_set, tmp_path):
+    compiled = hsds_schema.compile_entity(schema_set.compiler, 'service')
+    path = tmp_path / 'service_validator.py'
+    path.write_text(hsds_schema.ValidatorGenerator(compiled).generate())
+    reference = jsonschema.Draft202012Validator(compiled, format_checker=jsonschema.Draft202012Validator.FORMAT_CHECKER)
+    return reference, hsds_schema.load_generated_validator(path)
+
+
+def expected_errors(reference, record):
+    return [(tuple(error.absolute_path), error.validator, error.message) for error in reference.iter_errors(record)]
+
+
+def test_generated_and_broken_records(schema_set, validators):
+    reference, generated = validators
+    generator = hsds_schema.DataGenerator(schema_set, {'service': 300})
+    rng = random.Random(1)
+
+    records = [generator.record('service', index) for index in range(300)]
+    records += [break_record(record, rng) for record in records]
+
+    error_counts = []
+    for record in records:
+        expected = expected_errors(reference, record)
+        assert generated.errors(record) == expected
+        assert generated.is_valid(record) == (not expected)
+        error_counts.append(len(expected))
+    assert 0 in error_counts and sum(error_counts) > 200
+
+
+VALID = {
+    'id': 'ac148810-d857-441c-9679-408f346de14b', 'name': 'Service', 'status': 'active',
+    'email': 'service@example.com', 'capacity': 9, 'code': 'ABC', 'tags': ['a'],
+    'phones': [{'id': 'ph1', 'number': '0123', 'languages': [{'id': 'lang1', 'name': 'English'}]}],
+    'metadata': [{'id': 'm1', 'last_action_date': '2023-01-01'}],
+}
+
+
+@pytest.mark.parametrize('change, validator', [
+    ({'id': 'not-a-uuid'}, 'format'),
+    ({'email': 'no-at-sign'}, 'format'),
+    ({'metadata': [{'id': 'm1', 'last_action_date': '2023-02-30'}]}, 'format'),
+    ({'status': 'closed'}, 'enum'),
+    ({'name': None}, 'type'),
+    ({'phones': [{'id': 'ph1'}]}, 'required'),
+    ({'capacity': 10}, 'exclusiveMaximum'),
+    ({'capacity': 0}, 'minimum'),
+    ({'code': 'abc'}, 'pattern'),
+    ({'code': 'ABCD'}, 'maxLength'),
+    ({'tags': []}, 'minItems'),
+    ({'tags': ['a', 'b', 'c']}, 'maxItems'),
+    ({'tags': ['']}, 'minLength'),
+])
+def test_invalid_records(validators, change, validator):
+    reference, generated = validators
+    assert generated.errors(VALID) == expected_errors(reference, VALID) == []
+
+    record = {**VALID, **change}
+    expected = expected_errors(reference, record)
+    assert [error[1] for error in expected] == [validator]
+    assert generated.errors(record) == expected
+
+
+@pytest.mark.parametrize('missing', ['id', 'name', 'status'])
+def test_missing_required(validators, missing):
+    reference, generated = validators
+    record = {key: value for key, value in VALID.items() if key != missing}
+
+    expected = expected_errors(reference, record)
+    assert expected == [((), 'required', f"'{missing}' is a required property")]
+    assert generated.errors(record) == expected
@@ -0,0 +1,94 @@
+"""docs-all only rebuilding the outputs whose schemas have changed."""
+
+import json
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+@pytest.fixture
+def built(schema_dir, tmp_path, monkeypatch):
+    """Run docs-all in a copy of the fixture, returning the outputs each call writes."""
+    shutil.copytree(schema_dir, tmp_path / 'schema')
+    monkeypatch.chdir(tmp_path)
+
+    written = []
+    write = hsds_schema.BuildManifest.write
+
+    def recording_write(self, output, text, key):
+        written.append(str(output))
+        write(self, output, text, key)
+
+    monkeypatch.setattr(hsds_schema.BuildManifest, 'write', recording_write)
+
+    def docs_all(*args):
+        written.clear()
+        result = CliRunner().invoke(hsds_schema.cli, ['docs-all', *args])
+        assert result.exit_code == 0, result.output
+        return set(written)
+
+    return docs_all
+
+
+def outputs(tmp_path):
+    return {
+        str(path.relative_to(tmp_path)): path.read_text()
+        for path in tmp_path.rglob('*')
+        if path.is_file() and path.parent.name != 'schema' and path.name != hsds_schema.BUILD_MANIFEST
+    }
+
+
+def test_unchanged_inputs_are_skipped(built, tmp_path):
+    first = built()
+    assert 'datapackage.json' in first
+    assert 'schema/compiled/service_at_location.json' in first
+    before = outputs(tmp_path)
+
+    assert built() == set()
+    assert outputs(tmp_path) == before
+
+
+def test_changed_schema_rebuilds_its_dependents(built, tmp_path):
+    built()
+    before = outputs(tmp_path)
+
+    path = tmp_path / 'schema' / 'metadata.json'
+    metadata = json.loads(path.read_text())
+    metadata['description'] = 'Changed'
+    path.write_text(json.dumps(metadata, indent=2))
+
+    rebuilt = built()
+    assert {'datapackage.json', 'schema/compiled/service.json', 'schema/compiled/organization.json'} <= rebuilt
+    # taxonomies and phones do not refer to metadata
+    assert not rebuilt & {'examples/taxonomy.json', 'examples/taxonomy_term_list.json', 'examples/csv/phone.csv'}
+
+    after = outputs(tmp_path)
+    assert {path for path in before if before[path] != after[path]} <= rebuilt
+    assert after['datapackage.json'] != before['datapackage.json']
+
+
+def test_changed_tool_or_force_rebuilds_everything(built, tmp_path):
+    first = built()
+    before = outputs(tmp_path)
+
+    assert built('--force') == first
+    assert outputs(tmp_path) == before
+
+    manifest = json.loads((tmp_path / hsds_schema.BUILD_MANIFEST).read_text())
+    manifest['outputs'] = {output: 'stale' for output in manifest['outputs']}
+    (tmp_path / hsds_schema.BUILD_MANIFEST).write_text(json.dumps(manifest))
+    assert built() == first
+
+
+def test_missing_output_is_rebuilt(built, tmp_path):
+    built()
+    (tmp_path / 'schema' / 'compiled' / 'service.json').unlink()
+
+    rebuilt = built()
+    assert 'schema/compiled/service.json' in rebuilt
+    assert all(output.startswith('schema/compiled/service') for output in rebuilt)
+    assert not [output for output in rebuilt if output.startswith('schema/compiled/service_at_location')]
+    assert (tmp_path / 'schema' / 'compiled' / 'service.json').exists()
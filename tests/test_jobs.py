@@ -0,0 +1,40 @@
+"""Running the build stages in separate processes with --jobs."""
+
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+def build(schema_dir, directory, monkeypatch, *args):
+    shutil.copytree(schema_dir, directory / 'schema')
+    monkeypatch.chdir(directory)
+    result = CliRunner().invoke(hsds_schema.cli, ['docs-all', *args])
+    assert result.exit_code == 0, result.output
+    return {
+        str(path.relative_to(directory)): path.read_bytes()
+        for path in directory.rglob('*') if path.is_file()
+    }
+
+
+@pytest.mark.parametrize('args', [[], ['--compact']])
+def test_jobs_match_serial(schema_dir, tmp_path, monkeypatch, args):
+    serial = build(schema_dir, tmp_path / 'serial', monkeypatch, *args)
+    parallel = build(schema_dir, tmp_path / 'parallel', monkeypatch, '--jobs', '4', *args)
+
+    assert 'schema/compiled/service_package_defs.json' in parallel
+    assert parallel.keys() == serial.keys()
+    assert parallel == serial
+
+
+def test_jobs_record_the_manifest(schema_dir, tmp_path, monkeypatch):
+    build(schema_dir, tmp_path, monkeypatch, '--jobs', '4')
+
+    written = []
+    monkeypatch.setattr(hsds_schema, 'write_if_changed', lambda path, text: written.append(path))
+    result = CliRunner().invoke(hsds_schema.cli, ['docs-all', '--jobs', '4'])
+    assert result.exit_code == 0, result.output
+    # every output built by the workers was recorded, so only the manifest is written again
+    assert [str(path) for path in written] == [hsds_schema.BUILD_MANIFEST]
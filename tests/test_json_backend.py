@@ -0,0 +1,54 @@
+"""dumps_json giving the same text as json.dumps, whichever backend writes it."""
+
+import json
+import pathlib
+
+import pytest
+
+import hsds_schema
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+SHARED = {'type': 'string', 'format': 'uuid'}
+
+VALUES = [
+    {},
+    [],
+    {'a': [], 'b': {}, 'c': [{}], 'd': [[]]},
+    {'id': SHARED, 'organization_id': SHARED, 'items': [SHARED, SHARED]},
+    {'text': 'quote " backslash \\ slash / tab \t newline \n nul \x00 unit \x1f del \x7f'},
+    {'text': 'café ✓ 😀   ﻿', 'ключ': 'значение'},
+    [0, -1, 2 ** 53, 2 ** 64, -2 ** 63, 2 ** 70],
+    [0.0, -0.0, 0.1, 1.5, -2.25, 1e15, 1e16, 1e-4, 1e-5, 123456789.123456789, 5e-324, 1.7976931348623157e308],
+    [float('nan'), float('inf'), float('-inf')],
+    {1: 'integer key', True: 'bool key', None: 'null key'},
+    [True, False, None, 'true', 'null'],
+]
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    monkeypatch.setattr(hsds_schema, 'JSON_BACKEND', request.param)
+    hsds_schema.json_backend.cache_clear()
+    yield request.param
+    hsds_schema.json_backend.cache_clear()
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_same_as_json_dumps(backend, value):
+    assert hsds_schema.dumps_json(value) == json.dumps(value, indent=2)
+    assert hsds_schema.dumps_json(value, compact=True) == json.dumps(value, separators=(',', ':'))
+
+
+@pytest.mark.parametrize('path', sorted((FIXTURES / 'compiled').glob('*.json')), ids=lambda path: path.name)
+def test_compiled_schemas(backend, path):
+    value = json.loads(path.read_text())
+
+    assert hsds_schema.dumps_json(value) == json.dumps(value, indent=2)
+    assert hsds_schema.dumps_json(value, compact=True) == json.dumps(value, separators=(',', ':'))
+
+
+def test_backend_in_use(backend):
+    assert (hsds_schema.json_backend() is None) == (backend == 'json')
@@ -0,0 +1,103 @@
+"""Loading per table csvs into a new sqlite database."""
+
+import csv
+import sqlite3
+
+import click
+import pytest
+
+import hsds_schema
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def table(database, name):
+    connection = sqlite3.connect(database)
+    try:
+        return connection.execute(f'SELECT * FROM "{name}" ORDER BY rowid').fetchall()
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_loads_generated_shards(schema_dir, tmp_path, jobs):
+    hsds_schema.generate_data(schema_dir, {'service': 30}, tmp_path / 'csv', 'csv', shard_size=10)
+    database = tmp_path / 'hsds.sqlite'
+
+    counts = hsds_schema.load_sqlite(schema_dir, tmp_path / 'csv', str(database), jobs=jobs, chunk_size=300)
+
+    assert counts['service'] == 30
+    for name, count in counts.items():
+        expected = []
+        for path in sorted((tmp_path / 'csv' / name).glob('*.csv')):
+            with open(path, newline='') as f:
+                expected += [row['id'] for row in csv.DictReader(f)]
+        assert [row[0] for row in table(database, name)] == expected
+        assert len(expected) == count
+
+    connection = sqlite3.connect(database)
+    indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'service__organization_id' in indexes
+    assert connection.execute('PRAGMA foreign_key_check').fetchall() == []
+    connection.close()
+
+
+def test_referenced_tables_first(schema_dir):
+    order = [resource['name'] for resource in hsds_schema.sqlite_table_order(hsds_schema.load_resources(schema_dir))]
+
+    for resource in hsds_schema.load_resources(schema_dir):
+        for _, referenced in hsds_schema.sqlite_foreign_keys(resource):
+            if referenced != resource['name']:
+                assert order.index(referenced) < order.index(resource['name'])
+
+
+def test_quoted_newlines_across_chunks(schema_dir, tmp_path):
+    names = [f'Service "{index}"\nsecond line,\r\nthird' if index % 3 else f'Service {index}' for index in range(50)]
+    write_csv(tmp_path / 'service.csv', [['id', 'name', 'status', 'unknown']] + [
+        [f's{index}', name, 'active', 'x'] for index, name in enumerate(names)
+    ])
+    database = tmp_path / 'hsds.sqlite'
+
+    hsds_schema.load_sqlite(schema_dir, tmp_path, str(database), chunk_size=16)
+
+    connection = sqlite3.connect(database)
+    rows = connection.execute('SELECT id, name, organization_id FROM service ORDER BY rowid').fetchall()
+    connection.close()
+    # empty and missing values are null, and columns not in the datapackage are left out
+    assert rows == [(f's{index}', name, None) for index, name in enumerate(names)]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_bad_row_leaves_no_database(schema_dir, tmp_path, jobs):
+    rows = [['id', 'name', 'status']] + [[f's{index}', f'Service\n{index}', 'active'] for index in range(20)]
+    rows[15].append('extra')
+    write_csv(tmp_path / 'service.csv', rows)
+    database = tmp_path / 'hsds.sqlite'
+
+    with pytest.raises(click.ClickException) as error:
+        hsds_schema.load_sqlite(schema_dir, tmp_path, str(database), jobs=jobs, chunk_size=64)
+    # each row before it takes two lines
+    assert error.value.format_message() == f'{tmp_path / "service.csv"}, line 30: 4 values where the header has 3'
+    assert not database.exists()
+
+
+def test_sqlite_error_leaves_no_database(schema_dir, tmp_path):
+    write_csv(tmp_path / 'service.csv', [['id', 'name', 'status'], ['s1', 'One', 'active'], ['s1', 'Two', 'active']])
+    database = tmp_path / 'hsds.sqlite'
+
+    with pytest.raises(click.ClickException, match='UNIQUE'):
+        hsds_schema.load_sqlite(schema_dir, tmp_path, str(database))
+    assert not database.exists()
+
+
+def test_existing_database_is_kept(schema_dir, tmp_path):
+    write_csv(tmp_path / 'service.csv', [['id', 'name', 'status'], ['s1', 'One', 'active']])
+    database = tmp_path / 'hsds.sqlite'
+    database.write_text('not mine')
+
+    with pytest.raises(click.ClickException, match='already exists'):
+        hsds_schema.load_sqlite(schema_dir, tmp_path, str(database))
+    assert database.read_text() == 'not mine'
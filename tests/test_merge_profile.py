@@ -0,0 +1,67 @@
+"""Merging a profile into the core spec."""
+
+import copy
+import json
+
+import pytest
+
+import hsds_schema
+
+# the examples of RFC 7386, appendix A
+RFC_7386 = [
+    ({'a': 'b'}, {'a': 'c'}, {'a': 'c'}),
+    ({'a': 'b'}, {'b': 'c'}, {'a': 'b', 'b': 'c'}),
+    ({'a': 'b'}, {'a': None}, {}),
+    ({'a': 'b', 'b': 'c'}, {'a': None}, {'b': 'c'}),
+    ({'a': ['b']}, {'a': 'c'}, {'a': 'c'}),
+    ({'a': 'c'}, {'a': ['b']}, {'a': ['b']}),
+    ({'a': {'b': 'c'}}, {'a': {'b': 'd', 'c': None}}, {'a': {'b': 'd'}}),
+    ({'a': [{'b': 'c'}]}, {'a': [1]}, {'a': [1]}),
+    (['a', 'b'], ['c', 'd'], ['c', 'd']),
+    ({'a': 'b'}, ['c'], ['c']),
+    ({'a': 'foo'}, None, None),
+    ({'a': 'foo'}, 'bar', 'bar'),
+    ({'e': None}, {'a': 1}, {'e': None, 'a': 1}),
+    ([1, 2], {'a': 'b', 'c': None}, {'a': 'b'}),
+    ({}, {'a': {'bb': {'ccc': None}}}, {'a': {'bb': {}}}),
+]
+
+
+@pytest.mark.parametrize('target, patch, result', RFC_7386)
+def test_merge_patch(target, patch, result):
+    original = copy.deepcopy(target)
+
+    assert hsds_schema.merge_patch(target, patch) == result
+    assert target == original
+
+
+def test_merge_patch_shares_what_it_leaves_alone():
+    target = {'properties': {'id': {'type': 'string'}, 'name': {'type': 'string'}}, 'required': ['id']}
+
+    result = hsds_schema.merge_patch(target, {'properties': {'name': {'type': 'integer'}}})
+
+    assert result['properties']['id'] is target['properties']['id']
+    assert result['required'] is target['required']
+    assert target['properties']['name'] == {'type': 'string'}
+
+
+def test_merge_profile(schema_dir):
+    core = hsds_schema.SchemaSet.from_dir(schema_dir).by_filename
+    before = json.dumps(core)
+    profile = {
+        'language.json': {},
+        'service.json': {'properties': {'minimum_age': None, 'name': {'title': 'Service name'}}},
+        'extra.json': {'name': 'extra', 'properties': {}},
+    }
+
+    merged = hsds_schema.merge_profile(core, profile)
+
+    assert 'language.json' not in merged
+    assert merged['extra.json'] is profile['extra.json']
+    assert 'minimum_age' not in merged['service.json']['properties']
+    assert merged['service.json']['properties']['name']['title'] == 'Service name'
+    assert merged['service.json']['properties']['name']['type'] == 'string'
+    # the property referencing the removed table is dropped, from a copy
+    assert 'languages' not in merged['phone.json']['properties']
+    assert merged['organization.json'] is core['organization.json']
+    assert json.dumps(core) == before
@@ -0,0 +1,112 @@
+"""The mock API, for openapi.json files with paged and referenced response schemas."""
+
+import asyncio
+import json
+import shutil
+
+import pytest
+
+import hsds_schema
+
+COMPILED = 'https://raw.githubusercontent.com/openreferral/specification/3.0/schema/compiled'
+
+OPENAPI = {
+    'openapi': '3.1.0',
+    'paths': {
+        '/': {'get': {'responses': {'200': {'$ref': '#/components/responses/About'}}}},
+        '/services': {'get': {'responses': {'200': {'content': {'application/json': {'schema': {
+            'allOf': [
+                {'$ref': '#/components/schemas/Page'},
+                {'type': 'object', 'properties': {
+                    'contents': {'type': 'array', 'items': {'$ref': f'{COMPILED}/service_list.json'}},
+                }},
+            ],
+        }}}}}}},
+        '/services/{id}': {'get': {'responses': {'200': {'content': {'application/json': {'schema': {
+            '$ref': '#/components/schemas/Service',
+        }}}}}}},
+        '/organizations': {'get': {'responses': {'200': {'content': {'application/json': {'schema': {
+            '$ref': '#/components/schemas/OrganizationPage',
+        }}}}}}},
+    },
+    'components': {
+        'responses': {'About': {'content': {'application/json': {'schema': {
+            'type': 'object',
+            'properties': {
+                'version': {'$ref': '#/components/schemas/Version'},
+                'tree': {'$ref': '#/components/schemas/Tree'},
+                'sample': {'$ref': f'{COMPILED}/organization.json'},
+            },
+        }}}}},
+        'schemas': {
+            'Page': {'type': 'object', 'properties': {'total_items': {'type': 'integer'}}},
+            'Service': {'$ref': f'{COMPILED}/service.json'},
+            'OrganizationPage': {'allOf': [{'$ref': '#/components/schemas/Page'}], 'properties': {
+                'contents': {'type': 'array', 'items': {'$ref': f'{COMPILED}/organization_list.json'}},
+            }},
+            'Version': {'type': 'string', 'example': '3.0'},
+            'Tree': {'type': 'object', 'properties': {'child': {'$ref': '#/components/schemas/Tree'}}},
+        },
+    },
+}
+
+
+@pytest.fixture
+def api(schema_dir, tmp_path):
+    shutil.copytree(schema_dir, tmp_path / 'schema')
+    (tmp_path / 'schema' / 'openapi.json').write_text(json.dumps(OPENAPI))
+    return hsds_schema.MockApi(tmp_path / 'schema', {'service': 120, 'organization': 7}, per_page=50)
+
+
+def get(api, target):
+    status, body = api.response(target)
+    return status, json.loads(body if isinstance(body, bytes) else b''.join(body))
+
+
+def test_paged_endpoint(api):
+    status, page = get(api, '/services?page=3')
+
+    assert status == 200
+    assert (page['total_items'], page['total_pages'], page['page_number'], page['last_page']) == (120, 3, 3, True)
+    assert len(page['contents']) == 20
+    # list records leave out their arrays, as service_list.json does
+    assert not any(isinstance(value, list) for value in page['contents'][0].values())
+
+    status, record = get(api, f"/services/{page['contents'][0]['id']}")
+    assert status == 200
+    assert record['id'] == page['contents'][0]['id']
+    assert record['phones']
+
+
+def test_page_schema_behind_a_ref(api):
+    status, page = get(api, '/organizations?per_page=5&page=2')
+
+    assert status == 200
+    assert page['total_items'] == 7
+    assert [record['id'] for record in page['contents']] == [api.generator.id('organization', index) for index in (5, 6)]
+
+
+def test_example_follows_refs(api):
+    status, about = get(api, '/')
+
+    assert status == 200
+    assert about['version'] == '3.0'
+    assert about['tree'] == {'child': None}
+    assert about['sample']['id'] == api.generator.id('organization', 0)
+
+
+def test_served_over_http(api):
+    async def fetch():
+        server = await asyncio.start_server(lambda r, w: hsds_schema._handle_connection(api, r, w), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /services?per_page=2 HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(fetch()).partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 OK')
+    assert len(json.loads(body)['contents']) == 2
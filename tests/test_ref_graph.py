@@ -0,0 +1,75 @@
+"""The index of $refs between schema files."""
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+def schema(*refs):
+    """A schema with an object property for each ref, or an array one for refs ending []."""
+    properties = {'id': {'type': 'string'}}
+    for ref in refs:
+        if ref.endswith('[]'):
+            properties[ref[:-7]] = {'type': 'array', 'items': {'$ref': ref[:-2]}}
+        else:
+            properties[ref[:-5]] = {'$ref': ref}
+    return {'name': 'x', 'properties': properties}
+
+
+def test_topological_order(schema_dir):
+    graph = hsds_schema.SchemaSet.from_dir(schema_dir).ref_graph
+    order = graph.topological_order
+
+    assert sorted(order) == sorted(graph.nodes)
+    for filename in order:
+        for ref in graph.refs(filename):
+            assert order.index(ref.target) < order.index(filename)
+
+
+def test_refs_outside_the_set_are_edges_not_nodes():
+    graph = hsds_schema.RefGraph({'a.json': schema('b.json', 'elsewhere.json[]'), 'b.json': schema()})
+
+    assert [ref.target for ref in graph.refs('a.json')] == ['b.json', 'elsewhere.json']
+    assert [ref.source for ref in graph.referrers('elsewhere.json')] == ['a.json']
+    assert graph.topological_order == ['b.json', 'a.json']
+    assert graph.dependencies('a.json') == {'a.json', 'b.json'}
+    assert graph.dependents('b.json') == {'a.json', 'b.json'}
+
+
+@pytest.mark.parametrize('schemas, cycle', [
+    ({'a.json': schema('a.json')}, ['a.json', 'a.json']),
+    ({'a.json': schema('b.json[]'), 'b.json': schema('a.json')}, ['a.json', 'b.json', 'a.json']),
+    ({'a.json': schema('b.json'), 'b.json': schema('c.json'), 'c.json': schema('b.json[]')},
+     ['b.json', 'c.json', 'b.json']),
+])
+def test_cycles(schemas, cycle):
+    graph = hsds_schema.RefGraph(schemas)
+
+    assert graph.find_cycle() == cycle
+    with pytest.raises(hsds_schema.RefCycleError) as error:
+        graph.topological_order
+    assert error.value.path == cycle
+
+
+def test_no_cycle_in_a_diamond():
+    graph = hsds_schema.RefGraph({
+        'a.json': schema('b.json', 'c.json'), 'b.json': schema('d.json[]'), 'c.json': schema('d.json'),
+        'd.json': schema(),
+    })
+
+    assert graph.find_cycle() is None
+    assert graph.topological_order == ['d.json', 'b.json', 'c.json', 'a.json']
+
+
+def test_cycle_stops_the_build(schema_dir, tmp_path):
+    schemas = tmp_path / 'schema'
+    schemas.mkdir()
+    for path in schema_dir.glob('*.json'):
+        (schemas / path.name).write_text(path.read_text().replace('"taxonomy.json"', '"taxonomy_term.json"'))
+
+    result = CliRunner().invoke(hsds_schema.cli, ['schemas-to-doc-examples', str(schemas), str(tmp_path / 'out')])
+
+    assert result.exit_code == 1
+    assert 'Schema reference cycle: taxonomy_term.json -> taxonomy_term.json' in result.output
+    assert not (tmp_path / 'out').exists()
@@ -0,0 +1,62 @@
+"""schemas-to-csv, written natively with the columns flatterer gave it."""
+
+import csv
+import io
+import json
+import pathlib
+import tempfile
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+FIELDS_CSV = pathlib.Path(__file__).resolve().parent.parent / 'fields_for_csv.csv'
+
+
+def flatterer_rows(schema_dir):
+    """Rows as schemas-to-csv made them with flatterer, before it was written natively."""
+    flatterer = pytest.importorskip('flatterer')
+
+    def table_iterator():
+        schemas = [json.loads(path.read_text()) for path in schema_dir.glob('*.json') if path.name != 'openapi.json']
+        for schema in sorted(schemas, key=lambda schema: schema['datapackage_metadata']['order']):
+            required = schema.get('required', [])
+            tabular_required = schema.get('tabular_required', [])
+            for field, prop in schema['properties'].items():
+                prop['table_name'] = schema['name']
+                prop['constraints'] = prop.get('constraints') or {}
+                prop['constraints']['required'] = field in required
+                prop['constraints']['tablular_required'] = field in tabular_required
+                yield prop
+
+    with tempfile.TemporaryDirectory() as output:
+        flatterer.flatten(table_iterator(), output, force=True, fields_csv=str(FIELDS_CSV), only_fields=True)
+        with open(pathlib.Path(output) / 'csv' / 'main.csv', newline='') as f:
+            return list(csv.reader(f))
+
+
+def test_default_fields_are_fields_for_csv():
+    assert hsds_schema.read_fields_csv(FIELDS_CSV) == hsds_schema.SCHEMA_CSV_FIELDS
+
+
+@pytest.mark.parametrize('args', [[], ['--fields', str(FIELDS_CSV)]])
+def test_same_as_flatterer(schema_dir, args):
+    result = CliRunner().invoke(hsds_schema.cli, ['schemas-to-csv', str(schema_dir), *args])
+    assert result.exit_code == 0, result.output
+
+    rows = list(csv.reader(io.StringIO(result.output)))
+    assert rows[0] == [title for _, title, _ in hsds_schema.SCHEMA_CSV_FIELDS]
+    assert rows == flatterer_rows(schema_dir)
+
+
+def test_jsonl_has_the_csv_values(schema_dir):
+    runner = CliRunner()
+    rows = list(csv.DictReader(io.StringIO(runner.invoke(hsds_schema.cli, ['schemas-to-csv', str(schema_dir)]).output)))
+    result = runner.invoke(hsds_schema.cli, ['schemas-to-csv', str(schema_dir), '--format', 'jsonl'])
+    assert result.exit_code == 0, result.output
+
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert len(records) == len(rows)
+    for record, row in zip(records, rows):
+        assert {title: '' if value is None else str(hsds_schema.csv_value(value)) for title, value in record.items()} == row
@@ -0,0 +1,48 @@
+"""Tracing the stages, outputs and http requests of a build."""
+
+import json
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+def test_trace_records_requests(server, tmp_path):
+    url = f'{server.url}/contents?ref=3.0'
+
+    with hsds_schema.BuildTrace() as build_trace:
+        hsds_schema.fetch_core_files(url, tmp_path / 'cache')
+        hsds_schema.fetch_core_files(url, tmp_path / 'cache')
+    assert build_trace.http_summary()['statuses'] == {'200': 3, '304': 3}
+    assert [span['name'] for span in build_trace.spans if span['category'] == 'stage'] == ['fetch', 'fetch']
+
+    # nothing is recorded once the trace is over
+    hsds_schema.fetch_core_files(url, tmp_path / 'cache')
+    assert len(build_trace.spans) == 8
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_docs_all_trace(schema_dir, tmp_path, monkeypatch, jobs):
+    shutil.copytree(schema_dir, tmp_path / 'schema')
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(hsds_schema.cli, ['docs-all', '--jobs', jobs, '--trace', 'trace.json'])
+    assert result.exit_code == 0, result.output
+
+    spans = json.loads((tmp_path / 'trace.json').read_text())['spans']
+    stages = {span['name']: span for span in spans if span['category'] == 'stage'}
+    assert set(stages) == {'load', 'openapi', 'datapackage', 'examples', 'compile'}
+    for span in stages.values():
+        assert span['tracemalloc_peak_mb'] > 0
+        assert 'rss_delta_mb' in span
+    outputs = {span['name'] for span in spans if span['category'] == 'output'}
+    assert 'schema/compiled/service.json' in outputs
+    # spans of stages run in other processes are on their own lanes
+    assert {span['thread'].split('/')[0] for span in spans if span['category'] == 'output'} == (
+        {'MainThread'} if jobs == '1' else {'examples', 'compile', 'datapackage'}
+    )
+
+    events = json.loads((tmp_path / 'trace.chrome.json').read_text())['traceEvents']
+    assert {event['name'] for event in events if event.get('cat') == 'stage'} == set(stages)
@@ -0,0 +1,74 @@
+"""Validating records read as a json array, newline delimited json, json objects or stdin."""
+
+import json
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+GOOD = {'id': 'ac148810-d857-441c-9679-408f346de14b', 'name': 'Service', 'status': 'active'}
+BAD = {'id': 'not-a-uuid', 'name': 'Service', 'status': 'closed'}
+
+
+@pytest.fixture
+def compiled_dir(schema_dir, tmp_path):
+    hsds_schema._compile_schemas(schema_dir, tmp_path / 'compiled')
+    return tmp_path / 'compiled'
+
+
+def validate(compiled_dir, *args, input=None):
+    result = CliRunner().invoke(hsds_schema.cli, ['validate', 'service', *args, '--compiled-dir', str(compiled_dir)],
+                                input=input)
+    errors = [json.loads(line) for line in result.stdout.splitlines()]
+    return result.exit_code, [(error['record'], error['validator']) for error in errors]
+
+
+EXPECTED = (1, [(1, 'format'), (1, 'enum')])
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps([GOOD, BAD]),
+    json.dumps([GOOD, BAD], indent=2),
+    json.dumps(GOOD) + '\n\n' + json.dumps(BAD) + '\n',
+    json.dumps(GOOD, indent=2) + '\n' + json.dumps(BAD, indent=2),
+], ids=['array', 'pretty array', 'ndjson', 'objects'])
+def test_formats(compiled_dir, tmp_path, text):
+    data = tmp_path / 'data.json'
+    data.write_text(text)
+
+    assert validate(compiled_dir, str(data)) == EXPECTED
+
+
+@pytest.mark.parametrize('args', [[], ['-']])
+def test_stdin(compiled_dir, args):
+    assert validate(compiled_dir, *args, input=json.dumps(GOOD) + '\n' + json.dumps(BAD) + '\n') == EXPECTED
+    assert validate(compiled_dir, *args, input=json.dumps([GOOD, BAD], indent=2)) == EXPECTED
+
+
+def test_piped_stdin(compiled_dir):
+    result = subprocess.run(
+        [sys.executable, hsds_schema.__file__, 'validate', 'service', '--compiled-dir', str(compiled_dir)],
+        input=json.dumps(GOOD) + '\n' + json.dumps(BAD) + '\n', capture_output=True, text=True,
+    )
+    assert result.returncode == 1
+    assert [json.loads(line)['validator'] for line in result.stdout.splitlines()] == ['format', 'enum']
+    assert result.stderr == '2 records, 2 errors\n'
+
+
+def test_single_example_object(compiled_dir, tmp_path):
+    data = tmp_path / 'service.json'
+    data.write_text(json.dumps(GOOD, indent=2))
+
+    assert validate(compiled_dir, str(data)) == (0, [])
+
+
+def test_jobs_give_the_same_errors(compiled_dir, tmp_path):
+    data = tmp_path / 'data.ndjson'
+    data.write_text(''.join(json.dumps(BAD if index % 3 else GOOD) + '\n' for index in range(50)))
+
+    serial = validate(compiled_dir, str(data))
+    assert serial[0] == 1 and len(serial[1]) == 2 * 33
+    assert validate(compiled_dir, str(data), '--jobs', '2', '--batch-size', '7') == serial
@@ -0,0 +1,102 @@
+"""Watcher rebuilding the docs-all outputs as schemas are saved."""
+
+import json
+import pathlib
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+import hsds_schema
+
+
+def outputs(directory):
+    return {
+        str(path.relative_to(directory)): path.read_bytes()
+        for path in directory.rglob('*')
+        if path.is_file() and path.parent.name != 'schema' and path.name != hsds_schema.BUILD_MANIFEST
+    }
+
+
+def docs_all(directory, monkeypatch):
+    monkeypatch.chdir(directory)
+    result = CliRunner().invoke(hsds_schema.cli, ['docs-all'])
+    assert result.exit_code == 0, result.output
+    return outputs(directory)
+
+
+@pytest.fixture
+def watched(schema_dir, tmp_path, monkeypatch):
+    """A built Watcher over a copy of the fixture, with a copy to build from scratch to compare it with."""
+    for name in ('watched', 'fresh'):
+        shutil.copytree(schema_dir, tmp_path / name / 'schema')
+    monkeypatch.chdir(tmp_path / 'watched')
+    watcher = hsds_schema.Watcher()
+    watcher.build()
+    return watcher
+
+
+def edit(tmp_path, filename, change):
+    """Make the same change to filename in both copies, returns its path relative to the watched one."""
+    for name in ('watched', 'fresh'):
+        path = tmp_path / name / 'schema' / filename
+        schema = json.loads(path.read_text())
+        change(schema)
+        path.write_text(json.dumps(schema, indent=2))
+    return pathlib.Path('schema') / filename
+
+
+def test_edit_rebuilds_as_docs_all(watched, tmp_path, monkeypatch):
+    changed = edit(tmp_path, 'phone.json', lambda schema: schema['properties']['number'].update(title='Number!'))
+
+    built = watched.build({changed})
+    assert 'schema/compiled/service.json' in built
+    assert 'examples/taxonomy.json' not in built
+
+    assert outputs(tmp_path / 'watched') == docs_all(tmp_path / 'fresh', monkeypatch)
+
+
+def test_added_and_removed_fields(watched, tmp_path, monkeypatch):
+    extra = {'name': 'extra', 'type': 'string', 'title': 'Extra', 'description': 'Extra',
+             'constraints': {'unique': False}}
+    watched.build({edit(tmp_path, 'address.json', lambda schema: schema['properties'].update(extra=extra))})
+    watched.build({edit(tmp_path, 'language.json', lambda schema: schema['properties'].pop('name'))})
+
+    assert b'"extra"' in (tmp_path / 'watched' / 'schema' / 'compiled' / 'service.json').read_bytes()
+    assert outputs(tmp_path / 'watched') == docs_all(tmp_path / 'fresh', monkeypatch)
+
+
+def test_bad_json_keeps_outputs_until_fixed(watched, tmp_path, monkeypatch):
+    before = outputs(tmp_path / 'watched')
+    path = tmp_path / 'watched' / 'schema' / 'phone.json'
+    text = path.read_text()
+
+    # run picks up saves from file_changes, here a bad save and then its fix
+    def file_changes(directories, interval, polling):
+        assert directories == [pathlib.Path('schema')]
+        path.write_text(text[:-20])
+        yield {pathlib.Path('schema/phone.json')}
+        assert outputs(tmp_path / 'watched') == before
+        yield {pathlib.Path('schema/metadata.json')}
+        path.write_text(text.replace('"description"', '"title": "Fixed", "description"', 1))
+        yield {pathlib.Path('schema/language.json')}
+
+    monkeypatch.setattr(hsds_schema, 'file_changes', file_changes)
+    messages = []
+    monkeypatch.setattr(hsds_schema.click, 'echo', lambda message, err=False: messages.append(message))
+    watched.run()
+
+    assert messages[0].startswith('Build failed')
+    assert messages[1].startswith('Build failed')
+    assert messages[2].startswith('Rebuilt')
+    # phone.json was read again, though the last change was to another file
+    assert watched.schema_set.by_filename['phone.json']['title'] == 'Fixed'
+    assert outputs(tmp_path / 'watched') != before
+
+
+def test_reference_cycle_is_reported(watched, tmp_path):
+    def cycle(schema):
+        schema['properties']['service'] = {'name': 'service', '$ref': 'service.json'}
+
+    with pytest.raises(hsds_schema.RefCycleError):
+        watched.build({edit(tmp_path, 'phone.json', cycle)})